@@ -0,0 +1,271 @@
+"""
+End-to-end benchmark of the prometrix clients against local synthetic Prometheus servers (see
+fake_prometheus.py): a plain Prometheus, and a SigV4-checking Amazon Managed Prometheus stand-in.
+
+Each scenario runs in a fresh process, so its peak RSS is not inflated by the others, and reports:
+  - latency of sequential calls (mean, p50, p95, p99)
+  - throughput of `--concurrency` threads sharing one client
+  - parse time of the response body (JSON decode, and PrometheusQueryResult construction)
+  - peak RSS of the process
+
+    python benchmarks/client_benchmark.py --series 500 --steps 720 --output report.json
+    python benchmarks/client_benchmark.py --output new.json --compare report.json
+"""
+import argparse
+import json
+import platform
+import resource
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+from typing import Callable, Dict, List, Optional
+
+from fake_prometheus import FakePrometheusServer, SigV4Credentials
+
+from prometrix import (AWSPrometheusConfig, PrometheusConfig,
+                       PrometheusQueryResult, get_custom_prometheus_connect)
+from prometrix.decoding import get_json_loads
+
+AMP_CREDENTIALS = SigV4Credentials(access_key="benchmark", secret_key="benchmark-secret")
+SCENARIOS = ["query", "query_range", "get_series", "query_result", "query_result_columnar"]
+BACKENDS = ["prometheus", "amp"]
+RANGE_START = datetime.fromtimestamp(1_700_000_000)
+RANGE_STEP_SECONDS = 60
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _percentile(sorted_values: List[float], percentile: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(percentile / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def _latency_stats(timings: List[float]) -> Dict[str, float]:
+    timings = sorted(timings)
+    return {
+        "mean_ms": round(statistics.mean(timings) * 1000, 3),
+        "p50_ms": round(_percentile(timings, 50) * 1000, 3),
+        "p95_ms": round(_percentile(timings, 95) * 1000, 3),
+        "p99_ms": round(_percentile(timings, 99) * 1000, 3),
+    }
+
+
+def _make_client(backend: str, url: str):
+    if backend == "amp":
+        config: PrometheusConfig = AWSPrometheusConfig(
+            url=url,
+            access_key=AMP_CREDENTIALS.access_key,
+            secret_access_key=AMP_CREDENTIALS.secret_key,
+            aws_region=AMP_CREDENTIALS.region,
+            pool_maxsize=32,
+        )
+    else:
+        config = PrometheusConfig(url=url, pool_maxsize=32)
+    return get_custom_prometheus_connect(config)
+
+
+def _scenario_call(scenario: str, client, steps: int) -> Callable[[], object]:
+    end = datetime.fromtimestamp(RANGE_START.timestamp() + (steps - 1) * RANGE_STEP_SECONDS)
+    if scenario == "query":
+        return lambda: client.safe_custom_query("benchmark_metric")
+    if scenario == "get_series":
+        return lambda: client.get_series(["benchmark_metric"])
+
+    def query_range():
+        return client.safe_custom_query_range(
+            "benchmark_metric", RANGE_START, end, f"{RANGE_STEP_SECONDS}s"
+        )
+
+    if scenario == "query_result":
+        return lambda: PrometheusQueryResult(query_range())
+    if scenario == "query_result_columnar":
+        return lambda: PrometheusQueryResult(query_range(), columnar=True)
+    return query_range
+
+
+def _raw_body(scenario: str, client, steps: int) -> bytes:
+    """ Fetch the undecoded response body of the request the scenario sends """
+    if scenario == "query":
+        response = client._custom_query("benchmark_metric")
+    elif scenario == "get_series":
+        response = client._send_series(data={"match[]": ["benchmark_metric"]}, params={})
+    else:
+        response = client._send_query_range(
+            data={
+                "query": "benchmark_metric",
+                "start": round(RANGE_START.timestamp()),
+                "end": round(RANGE_START.timestamp()) + (steps - 1) * RANGE_STEP_SECONDS,
+                "step": f"{RANGE_STEP_SECONDS}s",
+            }
+        )
+    response.raise_for_status()
+    return response.content
+
+
+def _parse_stats(scenario: str, body: bytes, iterations: int) -> Dict[str, float]:
+    loads = get_json_loads()
+    decode_timings = []
+    result_timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        data = loads(body)["data"]
+        decode_timings.append(time.perf_counter() - start)
+        if scenario in ("query_result", "query_result_columnar"):
+            start = time.perf_counter()
+            PrometheusQueryResult(data, columnar=scenario == "query_result_columnar")
+            result_timings.append(time.perf_counter() - start)
+    stats = {"body_bytes": len(body), "json_decode_ms": round(min(decode_timings) * 1000, 3)}
+    if result_timings:
+        stats["result_construction_ms"] = round(min(result_timings) * 1000, 3)
+    return stats
+
+
+def run_scenario(
+    scenario: str, backend: str, url: str, steps: int, iterations: int, concurrency: int
+) -> Dict:
+    """ Run one scenario against a running server. Meant to be called in a fresh process """
+    client = _make_client(backend, url)
+    call = _scenario_call(scenario, client, steps)
+    call()  # warm up the connection pool
+
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - start)
+
+    total_calls = iterations * concurrency
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        start = time.perf_counter()
+        list(executor.map(lambda _: call(), range(total_calls)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "latency": _latency_stats(timings),
+        "throughput_rps": round(total_calls / elapsed, 2),
+        "parse": _parse_stats(scenario, _raw_body(scenario, client, steps), iterations),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def run(
+    series: int,
+    steps: int,
+    label_cardinality: int,
+    labels_per_series: int,
+    iterations: int,
+    concurrency: int,
+    scenarios: List[str],
+    backends: List[str],
+) -> Dict:
+    report: Dict = {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "prometrix": _prometrix_version(),
+        },
+        "parameters": {
+            "series": series,
+            "steps": steps,
+            "label_cardinality": label_cardinality,
+            "labels_per_series": labels_per_series,
+            "iterations": iterations,
+            "concurrency": concurrency,
+        },
+        "results": {},
+    }
+    context = get_context("spawn")
+    for backend in backends:
+        server = FakePrometheusServer(
+            series=series,
+            steps=steps,
+            label_cardinality=label_cardinality,
+            labels_per_series=labels_per_series,
+            sigv4=AMP_CREDENTIALS if backend == "amp" else None,
+        )
+        with server:
+            for scenario in scenarios:
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    result = executor.submit(
+                        run_scenario, scenario, backend, server.url, steps, iterations, concurrency
+                    ).result()
+                report["results"][f"{backend}/{scenario}"] = result
+    return report
+
+
+def _prometrix_version() -> str:
+    try:
+        from importlib.metadata import version
+
+        return version("prometrix")
+    except Exception:
+        return "unknown"
+
+
+def _flatten(prefix: str, value) -> Dict[str, float]:
+    if isinstance(value, dict):
+        flat: Dict[str, float] = {}
+        for key, nested in value.items():
+            flat.update(_flatten(f"{prefix}.{key}" if prefix else key, nested))
+        return flat
+    return {prefix: value}
+
+
+def compare(baseline: Dict, report: Dict) -> List[str]:
+    """ Lines describing the relative change of every metric present in both reports """
+    old = _flatten("", baseline["results"])
+    new = _flatten("", report["results"])
+    lines = []
+    for metric in sorted(old.keys() & new.keys()):
+        if old[metric]:
+            change = (new[metric] - old[metric]) / old[metric] * 100
+            lines.append(f"{metric:<65} {old[metric]:>12} -> {new[metric]:>12}  ({change:+.1f}%)")
+    return lines
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--series", type=int, default=200)
+    parser.add_argument("--steps", type=int, default=360)
+    parser.add_argument("--label-cardinality", type=int, default=10)
+    parser.add_argument("--labels-per-series", type=int, default=6)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="repeatable, defaults to all")
+    parser.add_argument("--backend", action="append", choices=BACKENDS, help="repeatable, defaults to all")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--compare", metavar="BASELINE", help="print the changes against a previous report")
+    args = parser.parse_args(argv)
+
+    report = run(
+        series=args.series,
+        steps=args.steps,
+        label_cardinality=args.label_cardinality,
+        labels_per_series=args.labels_per_series,
+        iterations=args.iterations,
+        concurrency=args.concurrency,
+        scenarios=args.scenario or SCENARIOS,
+        backends=args.backend or BACKENDS,
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print("\n".join(compare(baseline, report)), file=sys.stderr if not args.output else sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
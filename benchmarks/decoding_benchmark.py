@@ -0,0 +1,119 @@
+"""
+Compare the bytes on the wire and the decode time of large query_range (matrix) responses
+for each content encoding and JSON backend available in this environment.
+
+    python benchmarks/decoding_benchmark.py --series 2000 --steps 1000
+    python benchmarks/decoding_benchmark.py --json > decoding.json
+"""
+import argparse
+import gzip
+import json
+import random
+import sys
+import time
+import zlib
+from typing import Callable, Dict, List, Optional, Tuple
+
+from prometrix.decoding import available_json_backends
+
+try:
+    from compression import zstd
+except ImportError:
+    try:
+        from backports import zstd
+    except ImportError:
+        zstd = None
+
+
+def generate_matrix_response(series: int, steps: int, step_seconds: int = 60) -> bytes:
+    rng = random.Random(0)
+    start = 1_700_000_000
+    result = []
+    for index in range(series):
+        result.append(
+            {
+                "metric": {
+                    "__name__": "container_cpu_usage_seconds_total",
+                    "namespace": f"namespace-{index % 20}",
+                    "pod": f"pod-{index}",
+                    "container": f"container-{index % 3}",
+                },
+                "values": [
+                    [start + step * step_seconds, str(round(rng.random() * 4, 6))]
+                    for step in range(steps)
+                ],
+            }
+        )
+    body = {"status": "success", "data": {"resultType": "matrix", "result": result}}
+    return json.dumps(body, separators=(",", ":")).encode()
+
+
+def _encoders() -> List[Tuple[str, Callable[[bytes], bytes], Callable[[bytes], bytes]]]:
+    encoders = [
+        ("identity", lambda data: data, lambda data: data),
+        ("gzip", lambda data: gzip.compress(data, 6), gzip.decompress),
+        ("deflate", lambda data: zlib.compress(data, 6), zlib.decompress),
+    ]
+    if zstd is not None:
+        encoders.append(("zstd", zstd.compress, zstd.decompress))
+    return encoders
+
+
+def _best_of(repeat: int, fn: Callable[[], object]) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(series: int, steps: int, repeat: int) -> Dict:
+    payload = generate_matrix_response(series, steps)
+    report: Dict = {
+        "series": series,
+        "steps": steps,
+        "raw_bytes": len(payload),
+        "encodings": {},
+        "json_backends": {},
+    }
+    for name, compress, decompress in _encoders():
+        compressed = compress(payload)
+        report["encodings"][name] = {
+            "wire_bytes": len(compressed),
+            "ratio": round(len(payload) / len(compressed), 2),
+            "decompress_seconds": round(_best_of(repeat, lambda: decompress(compressed)), 4),
+        }
+    for name, loads in available_json_backends().items():
+        report["json_backends"][name] = {
+            "decode_seconds": round(_best_of(repeat, lambda: loads(payload)), 4)
+        }
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--series", type=int, default=1000)
+    parser.add_argument("--steps", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="print a machine-readable report")
+    args = parser.parse_args(argv)
+
+    report = run(args.series, args.steps, args.repeat)
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return
+
+    print(f"matrix {args.series} series x {args.steps} steps, {report['raw_bytes'] / 1e6:.1f} MB raw")
+    for name, stats in report["encodings"].items():
+        print(
+            f"  {name:<9} {stats['wire_bytes'] / 1e6:8.2f} MB on the wire"
+            f"  (x{stats['ratio']}), decompress {stats['decompress_seconds']:.3f}s"
+        )
+    for name, stats in report["json_backends"].items():
+        print(f"  {name:<9} decode {stats['decode_seconds']:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,459 @@
+"""
+A synthetic Prometheus HTTP API served on localhost, for benchmarks that must not depend on real backends.
+
+Serves /api/v1/query (vector), /api/v1/query_range (matrix), /api/v1/series, /api/v1/label/<name>/values
+and /api/v1/status/flags with `series` series of `labels_per_series` labels, whose non unique labels take
+`label_cardinality` distinct values. Matrix responses hold `steps` samples from the requested start.
+/api/v1/read (and /api/v1/remote_read) answers remote read requests with streamed XOR chunk frames holding
+the same series, scraped every 15s, encoded as Prometheus does.
+With `sigv4` set, the server behaves like Amazon Managed Prometheus and rejects requests that are not
+signed with the given credentials.
+
+    python benchmarks/fake_prometheus.py --series 1000 --steps 720 --port 9090
+"""
+import argparse
+import gzip
+import json
+import random
+import struct
+import threading
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from botocore.auth import SigV4Auth
+from botocore.awsrequest import AWSRequest
+from botocore.credentials import Credentials
+
+from prometrix.remote_read import crc32c, iter_fields, read_uvarint
+
+SCRAPE_INTERVAL_MS = 15_000
+# Samples per XOR chunk, as in the Prometheus TSDB
+SAMPLES_PER_CHUNK = 120
+REMOTE_READ_CONTENT_TYPE = "application/x-streamed-protobuf; proto=prometheus.ChunkedReadResponse"
+
+
+class SigV4Credentials(NamedTuple):
+    access_key: str
+    secret_key: str
+    region: str = "us-east-1"
+    service_name: str = "aps"
+
+
+def _parse_step(step: str) -> float:
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, "d": 86400}
+    for unit in sorted(units, key=len, reverse=True):
+        if step.endswith(unit):
+            return float(step[: -len(unit)]) * units[unit]
+    return float(step)
+
+
+class SyntheticData:
+    def __init__(self, series: int, steps: int, label_cardinality: int, labels_per_series: int):
+        self.series = series
+        self.steps = steps
+        self.label_cardinality = label_cardinality
+        self.labels_per_series = labels_per_series
+
+    def series_labels(self, metric_name: str) -> List[Dict[str, str]]:
+        return [self._labels(metric_name, index) for index in range(self.series)]
+
+    def _labels(self, metric_name: str, index: int) -> Dict[str, str]:
+        labels = {"__name__": metric_name, "pod": f"pod-{index}"}
+        # Extra labels cycle through label_cardinality values, pod keeps each series unique
+        for label in range(max(self.labels_per_series - 2, 0)):
+            labels[f"label_{label}"] = f"value-{(index + label) % self.label_cardinality}"
+        return labels
+
+    def vector(self, metric_name: str, timestamp: float) -> Dict:
+        rng = random.Random(0)
+        return {
+            "resultType": "vector",
+            "result": [
+                {"metric": labels, "value": [timestamp, str(round(rng.random() * 100, 4))]}
+                for labels in self.series_labels(metric_name)
+            ],
+        }
+
+    def raw_samples(self, start_ms: int, end_ms: int) -> List[Tuple[int, float]]:
+        """ Up to `steps` samples of one series, every SCRAPE_INTERVAL_MS from the first scrape after start """
+        first = -(-start_ms // SCRAPE_INTERVAL_MS) * SCRAPE_INTERVAL_MS
+        rng = random.Random(0)
+        return [
+            (t, round(rng.random() * 100, 4))
+            for t in range(first, end_ms + 1, SCRAPE_INTERVAL_MS)[: self.steps]
+        ]
+
+    def remote_read_frames(self, metric_name: str, start_ms: int, end_ms: int) -> bytes:
+        """ A streamed remote read body, one ChunkedReadResponse frame per series """
+        chunks = b""
+        samples = self.raw_samples(start_ms, end_ms)
+        for offset in range(0, len(samples), SAMPLES_PER_CHUNK):
+            part = samples[offset:offset + SAMPLES_PER_CHUNK]
+            chunks += _proto_field(
+                2,
+                _proto_varint(1, part[0][0])
+                + _proto_varint(2, part[-1][0])
+                + _proto_varint(3, 1)
+                + _proto_field(4, encode_xor_chunk(part)),
+            )
+        frames = []
+        for labels in self.series_labels(metric_name):
+            encoded_labels = b"".join(
+                _proto_field(1, _proto_field(1, name.encode()) + _proto_field(2, value.encode()))
+                for name, value in sorted(labels.items())
+            )
+            message = _proto_field(1, encoded_labels + chunks)
+            frames.append(_uvarint(len(message)) + struct.pack(">I", crc32c(message)) + message)
+        return b"".join(frames)
+
+    def matrix(self, metric_name: str, start: float, step: float) -> Dict:
+        rng = random.Random(0)
+        timestamps = [start + index * step for index in range(self.steps)]
+        return {
+            "resultType": "matrix",
+            "result": [
+                {
+                    "metric": labels,
+                    "values": [[t, str(round(rng.random() * 100, 4))] for t in timestamps],
+                }
+                for labels in self.series_labels(metric_name)
+            ],
+        }
+
+
+def _uvarint(value: int) -> bytes:
+    value &= (1 << 64) - 1
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _proto_field(number: int, payload: bytes) -> bytes:
+    return _uvarint(number << 3 | 2) + _uvarint(len(payload)) + payload
+
+
+def _proto_varint(number: int, value: int) -> bytes:
+    return _uvarint(number << 3) + _uvarint(value)
+
+
+def _float_bits(value: float) -> int:
+    return struct.unpack(">Q", struct.pack(">d", value))[0]
+
+
+def encode_xor_chunk(samples: List[Tuple[int, float]]) -> bytes:
+    """ A Prometheus XOR chunk (tsdb/chunkenc/xor.go) holding `samples`, (timestamp ms, value) pairs """
+    bits: List[str] = []
+
+    def write(value: int, width: int) -> None:
+        bits.append(format(value & ((1 << width) - 1), f"0{width}b"))
+
+    leading, trailing = 0xFF, 0
+    previous_t = previous_delta = previous_bits = 0
+    for index, (t, value) in enumerate(samples):
+        value_bits = _float_bits(value)
+        if index == 0:
+            for byte in _uvarint((t << 1) ^ (t >> 63)):
+                write(byte, 8)
+            write(value_bits, 64)
+        else:
+            delta = t - previous_t
+            if index == 1:
+                for byte in _uvarint(delta):
+                    write(byte, 8)
+            else:
+                dod = delta - previous_delta
+                if dod == 0:
+                    write(0, 1)
+                else:
+                    for prefix, prefix_width, width in ((0b10, 2, 14), (0b110, 3, 17), (0b1110, 4, 20)):
+                        if -((1 << (width - 1)) - 1) <= dod <= 1 << (width - 1):
+                            write(prefix, prefix_width)
+                            write(dod, width)
+                            break
+                    else:
+                        write(0b1111, 4)
+                        write(dod, 64)
+            previous_delta = delta
+            xor = value_bits ^ previous_bits
+            if xor == 0:
+                write(0, 1)
+            else:
+                write(1, 1)
+                new_leading = min(64 - xor.bit_length(), 31)
+                new_trailing = (xor & -xor).bit_length() - 1
+                if leading != 0xFF and new_leading >= leading and new_trailing >= trailing:
+                    write(0, 1)
+                    write(xor >> trailing, 64 - leading - trailing)
+                else:
+                    leading, trailing = new_leading, new_trailing
+                    significant = 64 - leading - trailing
+                    write(1, 1)
+                    write(leading, 5)
+                    write(significant, 6)
+                    write(xor >> trailing, significant)
+        previous_t, previous_bits = t, value_bits
+    stream = "".join(bits)
+    stream += "0" * (-len(stream) % 8)
+    body = int(stream, 2).to_bytes(len(stream) // 8, "big") if stream else b""
+    return len(samples).to_bytes(2, "big") + body
+
+
+def snappy_decompress(data: bytes) -> bytes:
+    """ Decode a snappy block (literals and back references) """
+    size, pos = read_uvarint(data, 0)
+    out = bytearray()
+    while pos < len(data):
+        tag = data[pos]
+        pos += 1
+        kind = tag & 3
+        if kind == 0:
+            length = tag >> 2
+            if length >= 60:
+                extra = length - 59
+                length = int.from_bytes(data[pos:pos + extra], "little")
+                pos += extra
+            length += 1
+            out += data[pos:pos + length]
+            pos += length
+            continue
+        if kind == 1:
+            length = 4 + ((tag >> 2) & 7)
+            offset = ((tag >> 5) << 8) | data[pos]
+            pos += 1
+        else:
+            width = 2 if kind == 2 else 4
+            length = (tag >> 2) + 1
+            offset = int.from_bytes(data[pos:pos + width], "little")
+            pos += width
+        for _ in range(length):
+            out.append(out[-offset])
+    if len(out) != size:
+        raise ValueError("Corrupt snappy block")
+    return bytes(out)
+
+
+def parse_read_request(body: bytes) -> Tuple[str, int, int]:
+    """ The metric name, start and end (ms) of the first query of a snappy prompb ReadRequest """
+    for number, _, query in iter_fields(snappy_decompress(body)):
+        if number != 1:
+            continue
+        start = end = 0
+        name = ""
+        for field, _, value in iter_fields(query):
+            if field == 1:
+                start = value
+            elif field == 2:
+                end = value
+            elif field == 3:
+                matcher = {number: value for number, _, value in iter_fields(value)}
+                if bytes(matcher.get(2, b"")) == b"__name__" and not matcher.get(1, 0):
+                    name = bytes(matcher.get(3, b"")).decode()
+        return name, start, end
+    raise ValueError("ReadRequest without query")
+
+
+def verify_sigv4(
+    credentials: SigV4Credentials, method: str, url: str, body: bytes, headers: Dict[str, str]
+) -> bool:
+    """ Recompute the SigV4 signature of a received request and compare it to the sent one """
+    authorization = headers.get("Authorization", "")
+    if not authorization.startswith("AWS4-HMAC-SHA256 "):
+        return False
+    fields = dict(
+        part.strip().split("=", 1) for part in authorization[len("AWS4-HMAC-SHA256 "):].split(",")
+    )
+    if not fields.get("Credential", "").startswith(credentials.access_key + "/"):
+        return False
+    signed_headers = fields.get("SignedHeaders", "").split(";")
+    request = AWSRequest(
+        method=method,
+        url=url,
+        data=body,
+        headers={k: v for k, v in headers.items() if k.lower() in signed_headers},
+    )
+    request.context["timestamp"] = headers.get("X-Amz-Date", "")
+    auth = SigV4Auth(
+        Credentials(credentials.access_key, credentials.secret_key),
+        credentials.service_name,
+        credentials.region,
+    )
+    string_to_sign = auth.string_to_sign(request, auth.canonical_request(request))
+    return fields.get("Signature") == auth.signature(string_to_sign, request)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, avoid delayed ACK stalls on keep-alive connections
+    disable_nagle_algorithm = True
+    server: "FakePrometheusServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def _handle(self, method: str):
+        parsed = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        if self.server.sigv4 is not None:
+            url = f"http://{self.headers['Host']}{self.path}"
+            if not verify_sigv4(self.server.sigv4, method, url, body, dict(self.headers)):
+                self._send(403, b'{"message":"The request signature we calculated does not match"}')
+                return
+
+        if parsed.path in ("/api/v1/read", "/api/v1/remote_read"):
+            self.server.requests += 1
+            name, start, end = parse_read_request(body)
+            body = self.server.response_body(("read", name or "synthetic_metric", start, end), False)
+            self._send(200, body, content_type=REMOTE_READ_CONTENT_TYPE)
+            return
+
+        params = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+        params.update({k: v[-1] for k, v in parse_qs(body.decode()).items()})
+        self.server.requests += 1
+        path = parsed.path
+        if path == "/api/v1/query":
+            key: Tuple = ("vector", params.get("query", ""), float(params.get("time", 0)))
+        elif path == "/api/v1/query_range":
+            key = (
+                "matrix",
+                params.get("query", ""),
+                float(params["start"]),
+                _parse_step(params["step"]),
+            )
+        elif path == "/api/v1/series":
+            key = ("series", params.get("match[]", ""))
+        elif path.startswith("/api/v1/label/") and path.endswith("/values"):
+            key = ("label_values", path[len("/api/v1/label/"): -len("/values")])
+        elif path == "/api/v1/status/flags":
+            key = ("flags",)
+        else:
+            self._send(404, b'{"status":"error","error":"not found"}')
+            return
+
+        use_gzip = self.server.gzip_responses and "gzip" in self.headers.get("Accept-Encoding", "")
+        self._send(200, self.server.response_body(key, use_gzip), use_gzip)
+
+    def _send(
+        self, status: int, body: bytes, gzipped: bool = False, content_type: str = "application/json"
+    ):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        if gzipped:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakePrometheusServer(ThreadingHTTPServer):
+    """
+    Local synthetic Prometheus. Responses are generated once per distinct request shape and then
+    served from memory, so the server adds as little as possible to the measured latencies.
+    Use as a context manager, or call start() and stop().
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        series: int = 100,
+        steps: int = 100,
+        label_cardinality: int = 10,
+        labels_per_series: int = 6,
+        sigv4: Optional[SigV4Credentials] = None,
+        gzip_responses: bool = True,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        super().__init__((host, port), _Handler)
+        self.data = SyntheticData(series, steps, label_cardinality, labels_per_series)
+        self.sigv4 = sigv4
+        self.gzip_responses = gzip_responses
+        self.requests = 0
+        self.response_body = lru_cache(maxsize=64)(self._response_body)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakePrometheusServer":
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-prometheus", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self) -> "FakePrometheusServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def _response_body(self, key: Tuple, use_gzip: bool) -> bytes:
+        kind = key[0]
+        if kind == "read":
+            return self.data.remote_read_frames(key[1], key[2], key[3])
+        if kind == "vector":
+            data = self.data.vector(_metric_name(key[1]), key[2])
+        elif kind == "matrix":
+            data = self.data.matrix(_metric_name(key[1]), key[2], key[3])
+        elif kind == "series":
+            data = self.data.series_labels(_metric_name(key[1]))
+        elif kind == "label_values":
+            data = sorted({labels.get(key[1], "") for labels in self.data.series_labels("synthetic")} - {""})
+        else:
+            data = {"storage.tsdb.retention.time": "15d"}
+        body = json.dumps({"status": "success", "data": data}, separators=(",", ":")).encode()
+        return gzip.compress(body, 6) if use_gzip else body
+
+
+def _metric_name(query: str) -> str:
+    name = query.split("{", 1)[0].strip()
+    return name if name.replace("_", "").replace(":", "").isalnum() else "synthetic_metric"
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--series", type=int, default=100)
+    parser.add_argument("--steps", type=int, default=100)
+    parser.add_argument("--label-cardinality", type=int, default=10)
+    parser.add_argument("--labels-per-series", type=int, default=6)
+    parser.add_argument("--port", type=int, default=9090)
+    parser.add_argument("--sigv4", metavar="ACCESS_KEY:SECRET_KEY", help="only accept requests signed with these")
+    parser.add_argument("--no-gzip", action="store_true")
+    args = parser.parse_args(argv)
+
+    sigv4 = SigV4Credentials(*args.sigv4.split(":", 1)) if args.sigv4 else None
+    server = FakePrometheusServer(
+        series=args.series,
+        steps=args.steps,
+        label_cardinality=args.label_cardinality,
+        labels_per_series=args.labels_per_series,
+        sigv4=sigv4,
+        gzip_responses=not args.no_gzip,
+        port=args.port,
+    )
+    print(f"Serving synthetic Prometheus on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Measure the cold import time of prometrix for common entry points, each in fresh interpreters, and check that
+no entry point loads heavy dependencies it does not need (boto3 for plain clients, httpx for sync ones...).
+Exits with status 1 when a check fails, so it can guard against import time regressions in CI.
+
+    python benchmarks/import_benchmark.py
+    python benchmarks/import_benchmark.py --max-ms 50 --json > imports.json
+    python benchmarks/import_benchmark.py --max-ms package=50 --max-ms plain_client=400
+
+`--max-ms` fails the run when the median import time of a scenario is over budget, a bare number applies to
+the `package` scenario.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Optional, Tuple
+
+# (name, statement, modules the statement must not load)
+SCENARIOS: List[Tuple[str, str, Tuple[str, ...]]] = [
+    (
+        "package",
+        "import prometrix",
+        ("boto3", "botocore", "httpx", "numpy", "pydantic", "requests", "prometheus_api_client"),
+    ),
+    (
+        "query_result",
+        "from prometrix import PrometheusQueryResult",
+        ("boto3", "botocore", "httpx", "numpy", "pydantic", "requests", "prometheus_api_client"),
+    ),
+    (
+        "plain_client",
+        "from prometrix import PrometheusConfig, PrometheusQueryResult, get_custom_prometheus_connect",
+        ("boto3", "botocore", "httpx", "numpy"),
+    ),
+    ("aws_config", "from prometrix import AWSPrometheusConfig", ("boto3", "botocore")),
+    ("async_client", "from prometrix import get_async_custom_prometheus_connect", ("boto3", "botocore", "numpy")),
+    ("aws_client", "from prometrix import AWSPrometheusConnect", ("httpx", "numpy")),
+]
+
+_PROBE = """
+import sys, time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(repr((elapsed, [name for name in {modules!r} if name in sys.modules])))
+"""
+
+
+def measure(statement: str, modules: Tuple[str, ...]) -> Tuple[float, List[str]]:
+    """ Seconds `statement` takes in a fresh interpreter, and which of `modules` it loaded """
+    output = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(statement=statement, modules=modules)],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    elapsed, loaded = eval(output)
+    return elapsed, loaded
+
+
+def parse_budget(value: str) -> Tuple[str, float]:
+    """ `--max-ms` value: `SCENARIO=MS`, or `MS` for the package scenario """
+    name, _, ms = value.rpartition("=")
+    name = name or "package"
+    if name not in {scenario[0] for scenario in SCENARIOS}:
+        raise argparse.ArgumentTypeError(f"unknown scenario {name!r}")
+    try:
+        return name, float(ms)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid time {ms!r}")
+
+
+def run(repeat: int, max_ms: Dict[str, float]) -> Dict:
+    report: Dict = {"scenarios": {}, "failures": []}
+    for name, statement, forbidden in SCENARIOS:
+        timings = []
+        loaded: List[str] = []
+        for _ in range(repeat):
+            elapsed, loaded = measure(statement, forbidden)
+            timings.append(elapsed)
+        median_ms = statistics.median(timings) * 1000
+        report["scenarios"][name] = {
+            "statement": statement,
+            "median_ms": round(median_ms, 1),
+            "min_ms": round(min(timings) * 1000, 1),
+            "unexpected_modules": loaded,
+        }
+        if loaded:
+            report["failures"].append(f"{name}: `{statement}` loads {', '.join(loaded)}")
+        budget = max_ms.get(name)
+        if budget is not None and median_ms > budget:
+            report["failures"].append(f"{name}: `{statement}` takes {round(median_ms, 1)}ms, over {budget}ms")
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--max-ms",
+        type=parse_budget,
+        action="append",
+        default=[],
+        metavar="[SCENARIO=]MS",
+        help="fail when the scenario (default `package`) takes longer (median), may be repeated",
+    )
+    parser.add_argument("--json", action="store_true", help="print a machine-readable report")
+    args = parser.parse_args(argv)
+
+    report = run(args.repeat, dict(args.max_ms))
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        for name, stats in report["scenarios"].items():
+            print(f"  {name:<13} {stats['median_ms']:7.1f} ms  (min {stats['min_ms']:.1f})  {stats['statement']}")
+        for failure in report["failures"]:
+            print(f"FAIL {failure}")
+    if report["failures"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
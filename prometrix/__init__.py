@@ -1,15 +1,149 @@
-from prometrix.auth import PrometheusAuthorization
-from prometrix.connect.aws_connect import AWSPrometheusConnect
-from prometrix.connect.custom_connect import CustomPrometheusConnect
-from prometrix.exceptions import (MetricsNotFound,
-                                  PrometheusFlagsConnectionError,
-                                  PrometheusNotFound, ThanosMetricsNotFound,
-                                  VictoriaMetricsNotFound)
-from prometrix.models.prometheus_config import (
-    AWSPrometheusConfig, AzurePrometheusConfig, CoralogixPrometheusConfig,
-    PrometheusApis, PrometheusConfig, VictoriaMetricsPrometheusConfig)
-from prometrix.models.prometheus_result import (PrometheusMetric,
-                                                PrometheusQueryResult,
-                                                PrometheusScalarValue,
-                                                PrometheusSeries)
-from prometrix.utils import get_custom_prometheus_connect
+"""
+Public names are imported on first access (PEP 562), so `import prometrix` stays fast and a client only loads
+what it uses: boto3 / botocore for the AWS clients, httpx for the async ones, NumPy for columnar results.
+"""
+from importlib import import_module
+from typing import TYPE_CHECKING, Dict, List
+
+# Public name -> module defining it
+_LAZY_IMPORTS: Dict[str, str] = {
+    "SeriesMatrix": "prometrix.analytics",
+    "align_results": "prometrix.analytics",
+    "PrometheusAuthorization": "prometrix.auth",
+    "AsyncAWSPrometheusConnect": "prometrix.connect.async_aws_connect",
+    "AsyncCustomPrometheusConnect": "prometrix.connect.async_custom_connect",
+    "AWSPrometheusConnect": "prometrix.connect.aws_connect",
+    "CustomPrometheusConnect": "prometrix.connect.custom_connect",
+    "MetricsNotFound": "prometrix.exceptions",
+    "PrometheusFlagsConnectionError": "prometrix.exceptions",
+    "PrometheusNotFound": "prometrix.exceptions",
+    "ThanosMetricsNotFound": "prometrix.exceptions",
+    "VictoriaMetricsNotFound": "prometrix.exceptions",
+    "FederatedPrometheusConnect": "prometrix.federation",
+    "FederatedQueryResult": "prometrix.federation",
+    "MetricsCollector": "prometrix.instrumentation",
+    "RequestEvent": "prometrix.instrumentation",
+    "LabelSet": "prometrix.labels",
+    "intern_labels": "prometrix.labels",
+    "AWSPrometheusConfig": "prometrix.models.prometheus_config",
+    "AzurePrometheusConfig": "prometrix.models.prometheus_config",
+    "CoralogixPrometheusConfig": "prometrix.models.prometheus_config",
+    "OverBudgetAction": "prometrix.models.prometheus_config",
+    "PrometheusApis": "prometrix.models.prometheus_config",
+    "PrometheusConfig": "prometrix.models.prometheus_config",
+    "ResiliencePolicy": "prometrix.models.prometheus_config",
+    "VictoriaMetricsPrometheusConfig": "prometrix.models.prometheus_config",
+    "ClusterQueryResult": "prometrix.models.prometheus_query",
+    "InstantQuery": "prometrix.models.prometheus_query",
+    "QueryBatchResult": "prometrix.models.prometheus_query",
+    "QueryPlan": "prometrix.models.prometheus_query",
+    "QuerySpec": "prometrix.models.prometheus_query",
+    "RangeQuery": "prometrix.models.prometheus_query",
+    "PrometheusColumnarSeries": "prometrix.models.prometheus_result",
+    "PrometheusMetric": "prometrix.models.prometheus_result",
+    "PrometheusQueryResult": "prometrix.models.prometheus_result",
+    "PrometheusScalarValue": "prometrix.models.prometheus_result",
+    "PrometheusSeries": "prometrix.models.prometheus_result",
+    "join_results": "prometrix.models.prometheus_result",
+    "PersistentRangeQueryCache": "prometrix.persistent_cache",
+    "RangeQueryCache": "prometrix.range_cache",
+    "get_async_custom_prometheus_connect": "prometrix.utils",
+    "get_custom_prometheus_connect": "prometrix.utils",
+}
+
+# Spelled out, so linters see the TYPE_CHECKING imports below as re-exports
+__all__ = [
+    "SeriesMatrix",
+    "align_results",
+    "PrometheusAuthorization",
+    "AsyncAWSPrometheusConnect",
+    "AsyncCustomPrometheusConnect",
+    "AWSPrometheusConnect",
+    "CustomPrometheusConnect",
+    "MetricsNotFound",
+    "PrometheusFlagsConnectionError",
+    "PrometheusNotFound",
+    "ThanosMetricsNotFound",
+    "VictoriaMetricsNotFound",
+    "FederatedPrometheusConnect",
+    "FederatedQueryResult",
+    "MetricsCollector",
+    "RequestEvent",
+    "LabelSet",
+    "intern_labels",
+    "AWSPrometheusConfig",
+    "AzurePrometheusConfig",
+    "CoralogixPrometheusConfig",
+    "OverBudgetAction",
+    "PrometheusApis",
+    "PrometheusConfig",
+    "ResiliencePolicy",
+    "VictoriaMetricsPrometheusConfig",
+    "ClusterQueryResult",
+    "InstantQuery",
+    "QueryBatchResult",
+    "QueryPlan",
+    "QuerySpec",
+    "RangeQuery",
+    "PrometheusColumnarSeries",
+    "PrometheusMetric",
+    "PrometheusQueryResult",
+    "PrometheusScalarValue",
+    "PrometheusSeries",
+    "join_results",
+    "PersistentRangeQueryCache",
+    "RangeQueryCache",
+    "get_async_custom_prometheus_connect",
+    "get_custom_prometheus_connect",
+]
+
+
+def __getattr__(name: str):
+    module = _LAZY_IMPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(module), name)
+    # Cache it, later lookups no longer go through __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(__all__))
+
+
+if TYPE_CHECKING:
+    from prometrix.analytics import SeriesMatrix, align_results
+    from prometrix.auth import PrometheusAuthorization
+    from prometrix.connect.async_aws_connect import AsyncAWSPrometheusConnect
+    from prometrix.connect.async_custom_connect import \
+        AsyncCustomPrometheusConnect
+    from prometrix.connect.aws_connect import AWSPrometheusConnect
+    from prometrix.connect.custom_connect import CustomPrometheusConnect
+    from prometrix.exceptions import (MetricsNotFound,
+                                      PrometheusFlagsConnectionError,
+                                      PrometheusNotFound,
+                                      ThanosMetricsNotFound,
+                                      VictoriaMetricsNotFound)
+    from prometrix.federation import (FederatedPrometheusConnect,
+                                      FederatedQueryResult)
+    from prometrix.instrumentation import MetricsCollector, RequestEvent
+    from prometrix.labels import LabelSet, intern_labels
+    from prometrix.models.prometheus_config import (
+        AWSPrometheusConfig, AzurePrometheusConfig, CoralogixPrometheusConfig,
+        OverBudgetAction, PrometheusApis, PrometheusConfig, ResiliencePolicy,
+        VictoriaMetricsPrometheusConfig)
+    from prometrix.models.prometheus_query import (ClusterQueryResult,
+                                                   InstantQuery,
+                                                   QueryBatchResult, QueryPlan,
+                                                   QuerySpec, RangeQuery)
+    from prometrix.models.prometheus_result import (PrometheusColumnarSeries,
+                                                    PrometheusMetric,
+                                                    PrometheusQueryResult,
+                                                    PrometheusScalarValue,
+                                                    PrometheusSeries,
+                                                    join_results)
+    from prometrix.persistent_cache import PersistentRangeQueryCache
+    from prometrix.range_cache import RangeQueryCache
+    from prometrix.utils import (get_async_custom_prometheus_connect,
+                                 get_custom_prometheus_connect)
@@ -0,0 +1,242 @@
+import warnings
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from prometrix.labels import LabelSet, intern_labels
+from prometrix.models.prometheus_result import (PrometheusMetric,
+                                                PrometheusQueryResult,
+                                                to_float64_buffer)
+from prometrix.sharding import parse_duration_seconds
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+AGGREGATIONS = ("sum", "avg", "min", "max", "count", "stddev", "last", "quantile")
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise ImportError("prometrix.analytics requires numpy, install it with `pip install prometrix[columnar]`")
+
+
+def _item_samples(item: Dict) -> Tuple["np.ndarray", "np.ndarray"]:
+    """ Timestamps and values of a raw or formatted (plain or columnar) series as float64 arrays """
+    if "timestamps" in item:
+        timestamps = item["timestamps"]
+        values = item["values"]
+        if isinstance(values, np.ndarray):
+            return np.asarray(timestamps, dtype=np.float64), values
+        return np.asarray(timestamps, dtype=np.float64), to_float64_buffer(values, len(values))
+    samples = item["values"]
+    return (
+        to_float64_buffer((sample[0] for sample in samples), len(samples)),
+        to_float64_buffer((sample[1] for sample in samples), len(samples)),
+    )
+
+
+def _infer_step(timestamps: "np.ndarray") -> float:
+    distinct = np.unique(timestamps)
+    if len(distinct) < 2:
+        return 1.0
+    return float(np.min(np.diff(distinct)))
+
+
+def _reduce(values: "np.ndarray", how: str, axis: int, q: Optional[float] = None) -> "np.ndarray":
+    """
+    Reduce along `axis` ignoring NaN gaps. Slices holding no sample give NaN, as PromQL returns no value
+    for them, except `count` which gives 0.
+    """
+    if how not in AGGREGATIONS:
+        raise ValueError(f"Unknown aggregation {how!r}, expected one of {', '.join(AGGREGATIONS)}")
+    present = ~np.isnan(values)
+    counts = present.sum(axis=axis)
+    if how == "count":
+        return counts.astype(np.float64)
+    if how == "last":
+        size = values.shape[axis]
+        # Position of the last sample of each slice, counted from the end
+        from_end = np.argmax(np.flip(present, axis=axis), axis=axis)
+        reduced = np.take_along_axis(
+            values, np.expand_dims(size - 1 - from_end, axis), axis=axis
+        ).squeeze(axis)
+    else:
+        with warnings.catch_warnings(), np.errstate(invalid="ignore"):
+            # All-NaN slices warn, they are set to NaN below anyway
+            warnings.simplefilter("ignore", RuntimeWarning)
+            if how == "quantile":
+                if q is None:
+                    raise ValueError("The quantile aggregation needs q")
+                reduced = np.nanquantile(values, q, axis=axis)
+            else:
+                reduced = {
+                    "sum": np.nansum,
+                    "avg": np.nanmean,
+                    "min": np.nanmin,
+                    "max": np.nanmax,
+                    "stddev": np.nanstd,
+                }[how](values, axis=axis)
+    return np.where(counts > 0, reduced, np.nan)
+
+
+class SeriesMatrix:
+    """
+    The samples of a matrix result as one float64 array of shape (series, timestamps), on a common time grid
+    with NaN where a series has no sample (NaN sample values count as missing too). Aggregations, resampling
+    and gap filling are NumPy operations over the whole array, no Python object is created per sample.
+
+        matrix = SeriesMatrix.from_result(PrometheusQueryResult(data, columnar=True))
+        peaks = matrix.over_time("quantile", q=0.95)
+        per_namespace = matrix.aggregate("sum", by=["namespace"]).resample("1h", "max")
+
+    `labels[i]` are the labels of row `i` of `values`, `timestamps` the grid, `step` its spacing in seconds.
+    """
+
+    def __init__(
+        self, labels: List[PrometheusMetric], timestamps: "np.ndarray", values: "np.ndarray", step: float
+    ):
+        _require_numpy()
+        self.labels = labels
+        self.timestamps = timestamps
+        self.values = values
+        self.step = step
+
+    @classmethod
+    def from_result(
+        cls,
+        result: PrometheusQueryResult,
+        step: Optional[Union[str, float]] = None,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+    ) -> "SeriesMatrix":
+        """
+        Place the series of a matrix result on the grid `start + k * step` up to `end`. `step` defaults to the
+        smallest spacing between timestamps (the query's step), `start` and `end` to the first and last sample.
+        Samples are snapped to the nearest grid point, those outside [start, end] are dropped.
+        """
+        return align_results(result, step=step, start=start, end=end)[0]
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def series(self, index: int) -> Tuple[PrometheusMetric, "np.ndarray", "np.ndarray"]:
+        """ Labels, timestamps and values of one series, without its gaps """
+        row = self.values[index]
+        present = ~np.isnan(row)
+        return self.labels[index], self.timestamps[present], row[present]
+
+    def over_time(self, how: str, q: Optional[float] = None) -> "np.ndarray":
+        """
+        Aggregate each series over the whole range, like PromQL's <how>_over_time. Returns one value per
+        series, in the order of `labels`. `how` is one of AGGREGATIONS, `q` the quantile for "quantile".
+        """
+        return _reduce(self.values, how, axis=1, q=q)
+
+    def aggregate(
+        self,
+        how: str,
+        by: Optional[Iterable[str]] = None,
+        without: Optional[Iterable[str]] = None,
+        q: Optional[float] = None,
+    ) -> "SeriesMatrix":
+        """
+        Aggregate across series at each timestamp, like PromQL's `<how> by (...)` / `without (...)`.
+        Without either, all series are aggregated into one. The metric name is dropped, as in PromQL.
+        """
+        groups: Dict[LabelSet, List[int]] = {}
+        for row, labels in enumerate(self.labels):
+            if by is not None:
+                key = intern_labels(labels).project(on=set(by) - {"__name__"})
+            elif without is not None:
+                key = intern_labels(labels).project(ignoring={"__name__", *without})
+            else:
+                key = intern_labels({})
+            groups.setdefault(key, []).append(row)
+        group_labels = list(groups)
+        values = np.empty((len(group_labels), len(self.timestamps)), dtype=np.float64)
+        for position, rows in enumerate(groups.values()):
+            values[position] = _reduce(self.values[rows], how, axis=0, q=q)
+        return SeriesMatrix(group_labels, self.timestamps, values, self.step)
+
+    def resample(
+        self, step: Union[str, float], how: str = "avg", q: Optional[float] = None
+    ) -> "SeriesMatrix":
+        """
+        Aggregate the samples of each series into coarser steps (a duration like "1h" or seconds), `step` being
+        a multiple of the current one. Each bucket is labelled with its first timestamp, buckets without
+        samples are NaN.
+        """
+        step = parse_duration_seconds(step)
+        ratio = step / self.step
+        if ratio < 1 or abs(ratio - round(ratio)) > 1e-9:
+            raise ValueError(f"The new step {step} must be a multiple of the current step {self.step}")
+        ratio = int(round(ratio))
+        buckets = -(-len(self.timestamps) // ratio)
+        padded = np.full((len(self.labels), buckets * ratio), np.nan)
+        padded[:, : len(self.timestamps)] = self.values
+        values = _reduce(padded.reshape(len(self.labels), buckets, ratio), how, axis=2, q=q)
+        timestamps = self.timestamps[0] + np.arange(buckets) * step if len(self.timestamps) else self.timestamps
+        return SeriesMatrix(self.labels, timestamps, values, step)
+
+    def fill_gaps(self, max_gap: Optional[float] = None) -> "SeriesMatrix":
+        """
+        Fill missing samples with the previous sample of the series, if it is at most `max_gap` seconds old
+        (Prometheus uses 300, its lookback delta). Gaps before the first sample stay NaN.
+        """
+        present = ~np.isnan(self.values)
+        positions = np.where(present, np.arange(len(self.timestamps)), -1)
+        last = np.maximum.accumulate(positions, axis=1)
+        values = np.take_along_axis(self.values, np.maximum(last, 0), axis=1)
+        stale = last < 0
+        if max_gap is not None:
+            stale |= (self.timestamps - self.timestamps[np.maximum(last, 0)]) > max_gap
+        values[stale] = np.nan
+        return SeriesMatrix(self.labels, self.timestamps, values, self.step)
+
+
+def align_results(
+    *results: PrometheusQueryResult,
+    step: Optional[Union[str, float]] = None,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+) -> List[SeriesMatrix]:
+    """
+    Place the series of several matrix results on one common time grid, e.g. to compare the CPU usage and
+    requests of containers sampled with different steps or ranges. `step` defaults to the smallest step
+    found, `start` and `end` to the earliest and latest sample of all results. Points of the grid a series
+    has no sample for are NaN (see SeriesMatrix.fill_gaps).
+    """
+    _require_numpy()
+    parsed: List[Tuple[List[PrometheusMetric], List[Tuple["np.ndarray", "np.ndarray"]]]] = []
+    for result in results:
+        if result.result_type != "matrix":
+            raise ValueError(f"Only matrix results can be aligned, got {result.result_type}")
+        items = result.labelled_items()
+        parsed.append(([labels for labels, _ in items], [_item_samples(item) for _, item in items]))
+
+    all_timestamps = [timestamps for _, samples in parsed for timestamps, _ in samples if len(timestamps)]
+    if step is None:
+        steps = [_infer_step(timestamps) for timestamps in all_timestamps if len(timestamps) > 1]
+        step = min(steps) if steps else 1.0
+    else:
+        step = parse_duration_seconds(step)
+    if start is None:
+        start = min((float(timestamps[0]) for timestamps in all_timestamps), default=0.0)
+    if end is None:
+        end = max((float(timestamps[-1]) for timestamps in all_timestamps), default=start)
+    size = max(int(np.floor((end - start) / step + 1e-9)) + 1, 0)
+    grid = start + np.arange(size) * step
+
+    matrices = []
+    for labels, samples in parsed:
+        values = np.full((len(labels), size), np.nan)
+        if samples:
+            rows = np.repeat(np.arange(len(samples)), [len(timestamps) for timestamps, _ in samples])
+            timestamps = np.concatenate([timestamps for timestamps, _ in samples])
+            sample_values = np.concatenate([series_values for _, series_values in samples])
+            columns = np.rint((timestamps - start) / step).astype(np.int64)
+            inside = (columns >= 0) & (columns < size)
+            values[rows[inside], columns[inside]] = sample_values[inside]
+        matrices.append(SeriesMatrix(labels, grid, values, step))
+    return matrices
+
@@ -0,0 +1,227 @@
+import json
+from array import array
+from typing import Dict, Optional, Sequence, Tuple
+
+from prometrix.models.prometheus_result import (PrometheusMetric,
+                                                PrometheusQueryResult,
+                                                to_float64_buffer)
+from prometrix.promql import LabelMatcher
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # pragma: no cover - optional dependency
+    pa = None
+    pc = None
+
+LAYOUTS = ("long", "wide")
+TIMESTAMP_COLUMN = "timestamp"
+VALUE_COLUMN = "value"
+
+
+def _require_pyarrow() -> None:
+    if pa is None:
+        raise ImportError("Arrow export requires pyarrow, install it with `pip install prometrix[arrow]`")
+
+
+def series_name(labels: PrometheusMetric) -> str:
+    """ The PromQL notation of a series, like `up{job="api"}`, used as its column name in the wide layout """
+    matchers = ",".join(
+        str(LabelMatcher(name, "=", value)) for name, value in sorted(labels.items()) if name != "__name__"
+    )
+    return f"{labels.get('__name__', '')}{{{matchers}}}"
+
+
+def _float64_array(values) -> "pa.Array":
+    """
+    Wrap a float64 buffer (a NumPy array or array('d')) as an Arrow array without copying it,
+    parse Prometheus sample strings into a new one otherwise.
+    """
+    is_buffer = (isinstance(values, array) and values.typecode == "d") or (
+        getattr(values, "dtype", None) == "float64" and values.flags.c_contiguous
+    )
+    if not is_buffer:
+        values = to_float64_buffer(values, len(values))
+    return pa.Array.from_buffers(pa.float64(), len(values), [None, pa.py_buffer(values)])
+
+
+def _series_samples(item: Dict) -> Tuple["pa.Array", "pa.Array"]:
+    """ Timestamps and values of a raw or formatted matrix item """
+    if "timestamps" in item:
+        return _float64_array(item["timestamps"]), _float64_array(item["values"])
+    samples = item["values"]
+    return (
+        _float64_array(to_float64_buffer((sample[0] for sample in samples), len(samples))),
+        _float64_array(to_float64_buffer((sample[1] for sample in samples), len(samples))),
+    )
+
+
+def _vector_sample(item: Dict) -> Tuple[float, str]:
+    value = item["value"]
+    if isinstance(value, dict):
+        return value["timestamp"], value["value"]
+    return value[0], value[1]
+
+
+def _label_columns(
+    labels: Sequence[PrometheusMetric], label_prefix: str
+) -> Dict[str, Tuple["pa.Array", Dict[str, int]]]:
+    """ For each label name of the series, in sorted order, the dictionary of its values and their codes """
+    names = sorted({name for metric in labels for name in metric})
+    columns = {}
+    for name in names:
+        column = f"{label_prefix}{name}"
+        if column in (TIMESTAMP_COLUMN, VALUE_COLUMN):
+            raise ValueError(f"Label {name!r} clashes with the {column!r} column, set a label_prefix")
+        distinct = sorted({metric[name] for metric in labels if name in metric})
+        codes = {value: code for code, value in enumerate(distinct)}
+        columns[name] = (pa.array(distinct, type=pa.string()), codes)
+    return columns
+
+
+def _dictionary_column(dictionary: "pa.Array", code: Optional[int], length: int) -> "pa.DictionaryArray":
+    """ `length` repetitions of one dictionary value, or nulls when the series lacks the label """
+    indices = pa.nulls(length, type=pa.int32())
+    if code is not None:
+        indices = indices.fill_null(code)
+    return pa.DictionaryArray.from_arrays(indices, dictionary)
+
+
+def _long_table(result: PrometheusQueryResult, label_prefix: str, timestamp_unit: Optional[str]) -> "pa.Table":
+    labelled_items = result.labelled_items()
+    labels = [metric for metric, _ in labelled_items]
+    items = [item for _, item in labelled_items]
+    dictionaries = _label_columns(labels, label_prefix)
+    schema = pa.schema(
+        [pa.field(f"{label_prefix}{name}", pa.dictionary(pa.int32(), pa.string())) for name in dictionaries]
+        + [pa.field(TIMESTAMP_COLUMN, _timestamp_type(timestamp_unit)), pa.field(VALUE_COLUMN, pa.float64())]
+    )
+
+    if result.result_type == "vector":
+        samples = [_vector_sample(item) for item in items]
+        timestamps = _float64_array(to_float64_buffer((sample[0] for sample in samples), len(samples)))
+        values = _float64_array(to_float64_buffer((sample[1] for sample in samples), len(samples)))
+        columns = [
+            pa.DictionaryArray.from_arrays(
+                pa.array([codes.get(metric.get(name)) for metric in labels], type=pa.int32()), dictionary
+            )
+            for name, (dictionary, codes) in dictionaries.items()
+        ]
+        batches = [
+            pa.RecordBatch.from_arrays(columns + [_timestamps(timestamps, timestamp_unit), values], schema=schema)
+        ]
+    else:
+        # One record batch per series: its float64 sample buffers are referenced, not copied
+        batches = []
+        for metric, item in zip(labels, items):
+            timestamps, values = _series_samples(item)
+            columns = [
+                _dictionary_column(dictionary, codes.get(metric.get(name)), len(values))
+                for name, (dictionary, codes) in dictionaries.items()
+            ]
+            columns += [_timestamps(timestamps, timestamp_unit), values]
+            batches.append(pa.RecordBatch.from_arrays(columns, schema=schema))
+    return pa.Table.from_batches(batches, schema=schema)
+
+
+def _timestamp_type(timestamp_unit: Optional[str]) -> "pa.DataType":
+    return pa.timestamp(timestamp_unit, tz="UTC") if timestamp_unit else pa.float64()
+
+
+def _timestamps(seconds: "pa.Array", timestamp_unit: Optional[str]) -> "pa.Array":
+    """ Prometheus float seconds, kept as is or converted to an Arrow timestamp of `timestamp_unit` """
+    if not timestamp_unit:
+        return seconds
+    scale = {"s": 1, "ms": 1_000, "us": 1_000_000, "ns": 1_000_000_000}[timestamp_unit]
+    ticks = pc.cast(pc.round(pc.multiply(seconds, scale)), pa.int64())
+    return ticks.cast(_timestamp_type(timestamp_unit))
+
+
+def _wide_table(result: PrometheusQueryResult, timestamp_unit: Optional[str]) -> "pa.Table":
+    if result.result_type == "vector":
+        labelled_items = result.labelled_items()
+        labels = [metric for metric, _ in labelled_items]
+        samples = [_vector_sample(item) for _, item in labelled_items]
+        timestamp = max((float(sample[0]) for sample in samples), default=None)
+        timestamps = _float64_array(to_float64_buffer([] if timestamp is None else [timestamp]))
+        columns = [_float64_array(to_float64_buffer([sample[1]], 1)) for sample in samples]
+    else:
+        # Imported here so only the wide layout needs NumPy
+        from prometrix.analytics import SeriesMatrix
+
+        matrix = SeriesMatrix.from_result(result)
+        labels = matrix.labels
+        timestamps = _float64_array(matrix.timestamps)
+        # Rows of the C-contiguous matrix are contiguous, gaps become nulls
+        columns = [pa.array(row, from_pandas=True) for row in matrix.values]
+
+    names = [series_name(metric) for metric in labels]
+    if len(set(names)) != len(names):
+        raise ValueError("Series without distinct labels cannot be exported in the wide layout")
+    fields = [pa.field(TIMESTAMP_COLUMN, _timestamp_type(timestamp_unit))]
+    fields += [
+        pa.field(name, pa.float64(), metadata={"labels": json.dumps(dict(metric), sort_keys=True)})
+        for name, metric in zip(names, labels)
+    ]
+    return pa.Table.from_arrays([_timestamps(timestamps, timestamp_unit)] + columns, schema=pa.schema(fields))
+
+
+def to_arrow_table(
+    result: PrometheusQueryResult,
+    layout: str = "long",
+    label_prefix: str = "",
+    timestamp_unit: Optional[str] = None,
+) -> "pa.Table":
+    """
+    Convert a vector or matrix result to an Arrow table.
+    :param layout: "long" gives one row per sample, with a dictionary-encoded column per label name (null when
+        a series lacks the label) and the `timestamp` and `value` columns. "wide" gives one row per timestamp
+        of a common grid and one float64 column per series, named like `up{job="api"}`, with null for gaps;
+        the labels of each column are in its field metadata.
+    :param label_prefix: Prepended to the label column names, e.g. when a label is called "value".
+    :param timestamp_unit: "s", "ms", "us" or "ns" to store Arrow UTC timestamps instead of float seconds.
+    With columnar results the long layout references the series' float64 buffers instead of copying them.
+    """
+    _require_pyarrow()
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown layout {layout!r}, expected one of {', '.join(LAYOUTS)}")
+    if result.result_type not in ("vector", "matrix"):
+        raise ValueError(f"Only vector and matrix results can be exported, got {result.result_type}")
+    if layout == "wide":
+        return _wide_table(result, timestamp_unit)
+    return _long_table(result, label_prefix, timestamp_unit)
+
+
+def write_parquet(
+    result: PrometheusQueryResult,
+    path: str,
+    layout: str = "long",
+    label_prefix: str = "",
+    timestamp_unit: Optional[str] = None,
+    **parquet_kwargs,
+) -> "pa.Table":
+    """
+    Write a result to a Parquet file (see to_arrow_table) and return the written table.
+    :param parquet_kwargs: Passed to pyarrow.parquet.write_table, e.g. compression or row_group_size.
+    """
+    table = to_arrow_table(result, layout, label_prefix, timestamp_unit)
+    # Imported on use, most exports never touch Parquet
+    import pyarrow.parquet as pq
+
+    pq.write_table(table, path, **parquet_kwargs)
+    return table
+
+
+def write_arrow_ipc(
+    result: PrometheusQueryResult,
+    path: str,
+    layout: str = "long",
+    label_prefix: str = "",
+    timestamp_unit: Optional[str] = None,
+) -> "pa.Table":
+    """ Write a result to an Arrow IPC (Feather v2) file (see to_arrow_table) and return the written table """
+    table = to_arrow_table(result, layout, label_prefix, timestamp_unit)
+    with pa.OSFile(str(path), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    return table
@@ -1,15 +1,52 @@
 import logging
-from typing import Dict, no_type_check
+import threading
+import time
+from typing import Dict, Optional, Set, Tuple, no_type_check
 
 import requests
+from requests.auth import AuthBase
 
 from prometrix.models.prometheus_config import (AzurePrometheusConfig,
                                                 CoralogixPrometheusConfig,
                                                 PrometheusConfig)
 
+# Used when the token response carries neither expires_on nor expires_in
+DEFAULT_AZURE_TOKEN_LIFETIME_SECONDS = 3600
+# Lower bound between fetching a token and refreshing it, for tokens that live shorter than the refresh margin
+MIN_AZURE_TOKEN_REFRESH_DELAY_SECONDS = 10
+
+AzureIdentity = Tuple[Optional[str], Optional[str], str]
+
+
+class AzureToken:
+    def __init__(self, access_token: str, expires_on: float, refresh_at: Optional[float] = None):
+        self.access_token = access_token
+        self.expires_on = expires_on
+        # When the first request past this time refreshes the token in the background
+        self.refresh_at = expires_on if refresh_at is None else refresh_at
+
+    @classmethod
+    def from_response(cls, token_response: Dict) -> "AzureToken":
+        now = time.time()
+        expires_on = None
+        try:
+            expires_on = float(token_response["expires_on"])
+        except (KeyError, TypeError, ValueError):
+            try:
+                expires_on = now + float(token_response["expires_in"])
+            except (KeyError, TypeError, ValueError):
+                expires_on = now + DEFAULT_AZURE_TOKEN_LIFETIME_SECONDS
+        return cls(token_response.get("access_token", ""), expires_on)
+
 
 class PrometheusAuthorization:
+    # The last generated azure token, kept for backwards compatibility. Tokens are cached per identity below.
     bearer_token: str = ""
+    _azure_tokens: Dict[AzureIdentity, AzureToken] = {}
+    _refreshing: Set[AzureIdentity] = set()
+    # Held while requesting a token, so each identity has at most one token request in flight
+    _identity_locks: Dict[AzureIdentity, threading.Lock] = {}
+    _lock = threading.Lock()
 
     @classmethod
     def azure_authorization(cls, config: PrometheusConfig) -> bool:
@@ -26,10 +63,83 @@ class PrometheusAuthorization:
         elif config.prometheus_auth:
             return {"Authorization": config.prometheus_auth.get_secret_value()}
         elif cls.azure_authorization(config):
-            return {"Authorization": (f"Bearer {cls.bearer_token}")}
+            return {"Authorization": (f"Bearer {cls.get_azure_token(config)}")}
         else:
             return {}
 
+    @staticmethod
+    def _azure_identity(config: AzurePrometheusConfig) -> AzureIdentity:
+        return config.azure_tenant_id, config.azure_client_id, config.azure_resource
+
+    @classmethod
+    def _identity_lock(cls, identity: AzureIdentity) -> threading.Lock:
+        with cls._lock:
+            return cls._identity_locks.setdefault(identity, threading.Lock())
+
+    @classmethod
+    def _valid_azure_token(cls, identity: AzureIdentity) -> Optional[AzureToken]:
+        with cls._lock:
+            token = cls._azure_tokens.get(identity)
+        if token is None or token.expires_on <= time.time():
+            return None
+        return token
+
+    @classmethod
+    def has_azure_token(cls, config: AzurePrometheusConfig) -> bool:
+        """ Whether get_azure_token would return without requesting a token """
+        return cls._valid_azure_token(cls._azure_identity(config)) is not None
+
+    @classmethod
+    def get_azure_token(cls, config: AzurePrometheusConfig) -> str:
+        """
+        Return the cached token of the config's identity. Once a token is within its refresh margin, the next
+        call starts a background refresh and keeps using it until the new one arrives, so this only blocks on the
+        token endpoint when the identity has no valid token yet (first use, or failed refreshes). Concurrent
+        callers then share a single token request.
+        """
+        identity = cls._azure_identity(config)
+        token = cls._valid_azure_token(identity)
+        if token is not None and token.refresh_at <= time.time():
+            cls.refresh_token_in_background(config)
+        elif token is None:
+            with cls._identity_lock(identity):
+                token = cls._valid_azure_token(identity)
+                if token is None and cls.request_new_token(config):
+                    token = cls._valid_azure_token(identity)
+        return token.access_token if token else ""
+
+    @classmethod
+    def refresh_rejected_token(cls, config: AzurePrometheusConfig, rejected_token: str) -> bool:
+        """
+        Called after a 401: fetch a new token unless another caller already replaced the rejected one.
+        Concurrent callers rejected with the same token, and an in flight refresh, share a single token request.
+        """
+        identity = cls._azure_identity(config)
+        with cls._identity_lock(identity):
+            with cls._lock:
+                token = cls._azure_tokens.get(identity)
+            if token is not None and token.access_token != rejected_token:
+                return True
+            return cls.request_new_token(config)
+
+    @classmethod
+    def refresh_token_in_background(cls, config: AzurePrometheusConfig) -> None:
+        identity = cls._azure_identity(config)
+        with cls._lock:
+            if identity in cls._refreshing:
+                return
+            cls._refreshing.add(identity)
+
+        def refresh():
+            try:
+                with cls._identity_lock(identity):
+                    cls.request_new_token(config)
+            finally:
+                with cls._lock:
+                    cls._refreshing.discard(identity)
+
+        threading.Thread(target=refresh, name="azure-token-refresh", daemon=True).start()
+
     @no_type_check
     @classmethod
     def _get_azure_metadata_endpoint(cls, config: PrometheusConfig):
@@ -79,8 +189,64 @@ class PrometheusAuthorization:
                 logging.error(f"Could not generate an azure access token. {res.reason}")
                 return False
 
-            cls.bearer_token = res.json().get("access_token")
+            token = AzureToken.from_response(res.json())
+            token.refresh_at = cls._refresh_time(config, token)
+            cls._store_token(config, token)
             logging.info("Generated new azure access token.")
             return True
 
         return False
+
+    @staticmethod
+    def _refresh_time(config: AzurePrometheusConfig, token: AzureToken) -> float:
+        now = time.time()
+        remaining = token.expires_on - now
+        return now + max(
+            remaining - config.azure_token_refresh_margin,
+            remaining / 2,
+            MIN_AZURE_TOKEN_REFRESH_DELAY_SECONDS,
+        )
+
+    @classmethod
+    def _store_token(cls, config: AzurePrometheusConfig, token: AzureToken) -> None:
+        identity = cls._azure_identity(config)
+        with cls._lock:
+            cls._azure_tokens[identity] = token
+            cls.bearer_token = token.access_token
+
+
+class AzureBearerAuth(AuthBase):
+    """
+    requests auth for Azure managed Prometheus: sets the cached bearer token on every request,
+    and on a 401 refreshes the token and retries the request once.
+    """
+
+    def __init__(self, config: AzurePrometheusConfig):
+        self.config = config
+
+    def __call__(self, r: requests.PreparedRequest) -> requests.PreparedRequest:
+        r.headers["Authorization"] = (
+            f"Bearer {PrometheusAuthorization.get_azure_token(self.config)}"
+        )
+        r.register_hook("response", self.handle_401)
+        return r
+
+    def handle_401(self, r: requests.Response, **kwargs) -> requests.Response:
+        if r.status_code != 401:
+            return r
+
+        sent_token = r.request.headers.get("Authorization", "").replace("Bearer ", "", 1)
+        if not PrometheusAuthorization.refresh_rejected_token(self.config, sent_token):
+            return r
+
+        # Consume content and release the original connection before retrying
+        r.content
+        r.close()
+        prep = r.request.copy()
+        prep.headers["Authorization"] = (
+            f"Bearer {PrometheusAuthorization.get_azure_token(self.config)}"
+        )
+        _r = r.connection.send(prep, **kwargs)
+        _r.history.append(r)
+        _r.request = prep
+        return _r
@@ -0,0 +1,221 @@
+import asyncio
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from prometrix.exceptions import PrometheusCircuitOpen
+
+# Smoothing of the short and long term latency averages compared by the latency signal
+SHORT_LATENCY_ALPHA = 0.3
+LONG_LATENCY_ALPHA = 0.02
+# Latency samples an endpoint needs before its latency signal is trusted
+LATENCY_WARMUP_SAMPLES = 10
+
+
+class AdaptiveLimit:
+    """
+    AIMD concurrency limit: grows by one every `limit` healthy responses while the limit is being used,
+    and is multiplied by `decrease_factor` on congestion, at most once per round trip (only requests
+    started after the last decrease can trigger another one).
+    Congestion is a throttled or overloaded response, a timeout, or, with `latency_tolerance` set, an
+    endpoint's short term average latency rising above `latency_tolerance` times its long term average.
+    Not thread safe, the limiters below serialize access to it.
+    """
+
+    def __init__(
+        self,
+        min_limit: int,
+        max_limit: int,
+        initial_limit: Optional[int] = None,
+        decrease_factor: float = 0.5,
+        latency_tolerance: Optional[float] = 2.0,
+    ):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        initial = initial_limit if initial_limit is not None else self.max_limit
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.decreases = 0
+        self._last_decrease = float("-inf")
+        # endpoint -> (samples, short term average, long term average)
+        self._latencies: Dict[str, Tuple[int, float, float]] = {}
+
+    @property
+    def value(self) -> int:
+        return int(self.limit)
+
+    def on_sample(
+        self,
+        endpoint: str,
+        started_at: float,
+        in_flight: int,
+        dropped: bool,
+        latency: Optional[float] = None,
+    ) -> None:
+        """ Update the limit with the outcome of a request, `in_flight` including the request itself """
+        congested = dropped or (latency is not None and self._latency_congested(endpoint, latency))
+        if congested:
+            if started_at >= self._last_decrease:
+                self.limit = max(float(self.min_limit), self.limit * self.decrease_factor)
+                self._last_decrease = time.monotonic()
+                self.decreases += 1
+        elif in_flight * 2 >= self.value:
+            # Only grow a limit that is actually used, an idle client says nothing about the backend
+            self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+
+    def _latency_congested(self, endpoint: str, latency: float) -> bool:
+        samples, short, long = self._latencies.get(endpoint, (0, latency, latency))
+        short += SHORT_LATENCY_ALPHA * (latency - short)
+        long += LONG_LATENCY_ALPHA * (latency - long)
+        self._latencies[endpoint] = (samples + 1, short, long)
+        return (
+            self.latency_tolerance is not None
+            and samples >= LATENCY_WARMUP_SAMPLES
+            and short > self.latency_tolerance * long
+        )
+
+
+class ConcurrencyLimiter:
+    """ Blocks requests beyond the adaptive limit until a request in flight completes """
+
+    def __init__(self, limit: AdaptiveLimit):
+        self._limit = limit
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self) -> float:
+        """ Wait for a free slot and take it, returns the time it was taken """
+        with self._condition:
+            while self.in_flight >= self._limit.value:
+                self._condition.wait()
+            self.in_flight += 1
+            return time.monotonic()
+
+    def release(
+        self,
+        endpoint: str,
+        started_at: float,
+        dropped: bool,
+        latency: Optional[float] = None,
+        sample: bool = True,
+    ) -> None:
+        """ Free the slot, updating the limit with the request's outcome unless `sample` is False """
+        with self._condition:
+            if sample:
+                self._limit.on_sample(endpoint, started_at, self.in_flight, dropped, latency)
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def has_capacity(self) -> bool:
+        with self._condition:
+            return self.in_flight < self._limit.value
+
+    def stats(self) -> Dict[str, int]:
+        with self._condition:
+            return {
+                "limit": self._limit.value,
+                "in_flight": self.in_flight,
+                "decreases": self._limit.decreases,
+            }
+
+
+class AsyncConcurrencyLimiter:
+    """ asyncio counterpart of ConcurrencyLimiter, waiting coroutines instead of threads """
+
+    def __init__(self, limit: AdaptiveLimit):
+        self._limit = limit
+        self.in_flight = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self) -> float:
+        async with self._condition:
+            while self.in_flight >= self._limit.value:
+                await self._condition.wait()
+            self.in_flight += 1
+            return time.monotonic()
+
+    async def release(
+        self,
+        endpoint: str,
+        started_at: float,
+        dropped: bool,
+        latency: Optional[float] = None,
+        sample: bool = True,
+    ) -> None:
+        """ Free the slot, updating the limit with the request's outcome unless `sample` is False """
+        async with self._condition:
+            if sample:
+                self._limit.on_sample(endpoint, started_at, self.in_flight, dropped, latency)
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def has_capacity(self) -> bool:
+        return self.in_flight < self._limit.value
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "limit": self._limit.value,
+            "in_flight": self.in_flight,
+            "decreases": self._limit.decreases,
+        }
+
+
+class CircuitBreaker:
+    """
+    Fails requests fast while the backend is down. After `failure_threshold` consecutive failures the
+    circuit opens and requests raise PrometheusCircuitOpen without being sent. Once `reset_timeout`
+    seconds have passed a single trial request is let through: success closes the circuit, failure
+    opens it for another `reset_timeout`.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float, name: str = "Prometheus"):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.name = name
+        self.opened = 0
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def before_request(self) -> None:
+        """ Raise PrometheusCircuitOpen if the request must not be sent """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+            if self._state == self.OPEN and remaining <= 0:
+                # Let this request through as the trial, the others keep failing until it completes
+                self._state = self.HALF_OPEN
+                return
+            raise PrometheusCircuitOpen(
+                f"Circuit to {self.name} is open after {self._failures} consecutive failures, "
+                f"retrying in {max(remaining, 0):.1f}s"
+            )
+
+    def record(self, success: bool) -> None:
+        with self._lock:
+            if success:
+                self._state = self.CLOSED
+                self._failures = 0
+                return
+            self._failures += 1
+            if self._state == self.HALF_OPEN or (
+                self._state == self.CLOSED and self._failures >= self.failure_threshold
+            ):
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self.opened += 1
+
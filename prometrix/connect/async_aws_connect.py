@@ -0,0 +1,55 @@
+from typing import Optional
+from urllib.parse import urlencode
+
+from prometrix.connect.async_custom_connect import AsyncCustomPrometheusConnect
+from prometrix.connect.aws_connect import AWSSigV4Mixin
+from prometrix.instrumentation import current_request_event, httpx_trace
+
+
+class AsyncAWSPrometheusConnect(AWSSigV4Mixin, AsyncCustomPrometheusConnect):
+    def __init__(
+        self,
+        access_key: Optional[str],
+        secret_key: Optional[str],
+        region: str,
+        service_name: str,
+        token: Optional[str] = None,
+        assume_role_arn: Optional[str] = None,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self._init_aws_credentials(
+            access_key=access_key,
+            secret_key=secret_key,
+            region=region,
+            service_name=service_name,
+            token=token,
+            assume_role_arn=assume_role_arn,
+        )
+
+    async def _request(
+        self,
+        method: str,
+        url: str,
+        data: Optional[dict] = None,
+        params: Optional[dict] = None,
+    ):
+        # Sign exactly what is sent: the form-encoded body and the final query string,
+        # including the parameters merged from prometheus_url_query_string
+        body = urlencode(data, doseq=True) if data is not None else None
+        headers = dict(self.headers)
+        if body is not None:
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        query_string = str(self._client.params.merge(params or {}))
+        signed_url = f"{url}?{query_string}" if query_string else url
+        signed_headers = self._sign_headers(
+            method, signed_url, data=body, headers=headers
+        )
+        event = current_request_event()
+        return await self._client.request(
+            method,
+            signed_url,
+            content=body,
+            headers=signed_headers,
+            extensions={"trace": httpx_trace(event)} if event is not None else None,
+        )
@@ -0,0 +1,348 @@
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from prometheus_api_client import PrometheusApiClientException
+
+from prometrix.auth import PrometheusAuthorization
+from prometrix.connect.custom_connect import text_config_to_dict
+from prometrix.decoding import get_json_loads
+from prometrix.exceptions import (PrometheusFlagsConnectionError,
+                                  PrometheusNotFound, VictoriaMetricsNotFound)
+from prometrix.instrumentation import (RequestEvent, RequestListener,
+                                       current_request_event, httpx_trace,
+                                       track_request)
+from prometrix.models.prometheus_config import PrometheusApis, PrometheusConfig
+from prometrix.promql import (LabelMatchers, additional_label_matchers,
+                              inject_label_matchers, to_label_matchers)
+from prometrix.resilience import AsyncResilientSender
+from prometrix.sharding import (merge_matrix_data, parse_duration_seconds,
+                                split_time_range)
+from prometrix.singleflight import AsyncSingleFlight, make_call_key
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - optional dependency
+    httpx = None
+
+
+class AsyncCustomPrometheusConnect:
+    """
+    asyncio counterpart of CustomPrometheusConnect, built on a pooled httpx.AsyncClient.
+    Concurrent queries share the client's connection pool and cost coroutines rather than threads.
+    """
+
+    def __init__(self, config: PrometheusConfig):
+        if httpx is None:
+            raise ImportError(
+                "AsyncCustomPrometheusConnect requires httpx, install it with `pip install prometrix[async]`"
+            )
+        self.config = config
+        self.url = config.url
+        self.headers = config.headers
+        self.ssl_verification = not config.disable_ssl
+        self._client = httpx.AsyncClient(
+            verify=self.ssl_verification,
+            timeout=httpx.Timeout(
+                None,
+                connect=config.resilience.connect_timeout,
+                read=config.resilience.read_timeout,
+            ),
+            limits=httpx.Limits(max_connections=config.async_max_connections),
+        )
+        if config.accept_encoding:
+            self._client.headers["Accept-Encoding"] = config.accept_encoding
+        self._json_loads = get_json_loads(config.json_backend)
+        self.single_flight: Optional[AsyncSingleFlight] = (
+            AsyncSingleFlight() if config.single_flight else None
+        )
+        self.request_listeners: List[RequestListener] = []
+        self.scope_matchers = additional_label_matchers(config)
+        self.resilience = AsyncResilientSender(
+            config.resilience, pool_size=config.async_max_connections, name=self.url
+        )
+
+    def add_request_listener(self, listener: RequestListener) -> None:
+        """
+        Register a callback receiving a RequestEvent after every request sent to the backend.
+        Listeners run synchronously in the event loop and must not block.
+        """
+        self.request_listeners.append(listener)
+
+    def remove_request_listener(self, listener: RequestListener) -> None:
+        self.request_listeners.remove(listener)
+
+    def _scope_query(self, query: str, label_matchers: LabelMatchers = None) -> str:
+        matchers = self.scope_matchers + to_label_matchers(label_matchers)
+        return inject_label_matchers(str(query), matchers)
+
+    def _track(self, endpoint: str, query: Optional[str] = None):
+        return track_request(self.request_listeners, type(self.config).__name__, endpoint, query)
+
+    @staticmethod
+    def _record_response(event: RequestEvent, response: "httpx.Response") -> None:
+        # Bytes read from the wire, before decompression
+        event.response_received(response.status_code, response.num_bytes_downloaded)
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
+    async def _request(
+        self,
+        method: str,
+        url: str,
+        data: Optional[dict] = None,
+        params: Optional[dict] = None,
+    ) -> "httpx.Response":
+        if PrometheusAuthorization.azure_authorization(
+            self.config
+        ) and not PrometheusAuthorization.has_azure_token(self.config):
+            # Requesting the first token blocks, keep it off the event loop
+            await asyncio.to_thread(PrometheusAuthorization.get_azure_token, self.config)
+        headers = self._auth_headers()
+        event = current_request_event()
+        extensions = {"trace": httpx_trace(event)} if event is not None else None
+        response = await self._client.request(
+            method, url, data=data, params=params or {}, headers=headers, extensions=extensions
+        )
+        if response.status_code == 401 and PrometheusAuthorization.azure_authorization(
+            self.config
+        ):
+            # The cached azure token expired or was revoked, refresh it and retry once
+            rejected_token = headers.get("Authorization", "").replace("Bearer ", "", 1)
+            if await asyncio.to_thread(
+                PrometheusAuthorization.refresh_rejected_token, self.config, rejected_token
+            ):
+                if event is not None:
+                    event.retries += 1
+                response = await self._client.request(
+                    method,
+                    url,
+                    data=data,
+                    params=params or {},
+                    headers=self._auth_headers(),
+                    extensions=extensions,
+                )
+        return response
+
+    def _auth_headers(self) -> Dict[str, str]:
+        if PrometheusAuthorization.azure_authorization(self.config):
+            return {
+                **self.headers,
+                **PrometheusAuthorization.get_authorization_headers(self.config),
+            }
+        return self.headers
+
+    async def safe_custom_query_range(
+        self,
+        query: str,
+        start_time: datetime,
+        end_time: datetime,
+        step: str,
+        params: dict = None,
+        label_matchers: LabelMatchers = None,
+    ) -> Dict:
+        start = round(start_time.timestamp())
+        end = round(end_time.timestamp())
+        params = params or {}
+        query = self._scope_query(query, label_matchers)
+        if self.single_flight is not None:
+            return await self.single_flight.do(
+                make_call_key("query_range", query, params, start, end, str(step)),
+                lambda: self._execute_query_range(query, start, end, step, params),
+            )
+        return await self._execute_query_range(query, start, end, step, params)
+
+    async def _execute_query_range(
+        self, query: str, start: float, end: float, step: str, params: dict
+    ) -> Dict:
+        shard_points = self.config.query_range_shard_points
+        if shard_points:
+            ranges = split_time_range(start, end, parse_duration_seconds(step), shard_points)
+            if len(ranges) > 1:
+                return await self._sharded_query_range(query, ranges, step, params)
+        return await self._query_range(query, start, end, step, params)
+
+    async def _sharded_query_range(
+        self, query: str, ranges: List[Tuple[float, float]], step: str, params: dict
+    ) -> Dict:
+        semaphore = asyncio.Semaphore(max(1, self.config.query_range_shard_workers))
+
+        async def run_shard(time_range: Tuple[float, float]) -> Dict:
+            async with semaphore:
+                return await self._query_range(
+                    query, time_range[0], time_range[1], step, params
+                )
+
+        parts = await asyncio.gather(*(run_shard(time_range) for time_range in ranges))
+        return merge_matrix_data(parts)
+
+    async def _query_range(
+        self, query: str, start: float, end: float, step: str, params: dict
+    ) -> Dict:
+        with self._track("query_range", query) as event:
+            response = await self.resilience.send(
+                "query_range",
+                lambda: self._request(
+                    "POST",
+                    f"{self.url}/api/v1/query_range",
+                    data={"query": query, "start": start, "end": end, "step": step, **params},
+                ),
+            )
+            self._record_response(event, response)
+            if response.status_code == 200:
+                return event.decode(self._json_loads, response.content)["data"]
+            else:
+                raise PrometheusApiClientException(
+                    "HTTP Status Code {} ({!r})".format(
+                        response.status_code, response.content
+                    )
+                )
+
+    async def _custom_query(self, query: str, params: dict = None) -> "httpx.Response":
+        params = params or {}
+        return await self._request(
+            "POST", f"{self.url}/api/v1/query", data={"query": str(query), **params}
+        )
+
+    async def safe_custom_query(
+        self, query: str, params: dict = None, label_matchers: LabelMatchers = None
+    ) -> Dict:
+        query = self._scope_query(query, label_matchers)
+        if self.single_flight is not None:
+            return await self.single_flight.do(
+                make_call_key("query", query, params),
+                lambda: self._fetch_query(query, params),
+            )
+        return await self._fetch_query(query, params)
+
+    async def _fetch_query(self, query: str, params: dict = None) -> Dict:
+        with self._track("query", str(query)) as event:
+            response = await self.resilience.send(
+                "query", lambda: self._custom_query(query, params)
+            )
+            self._record_response(event, response)
+            if response.status_code == 200:
+                return event.decode(self._json_loads, response.content)["data"]
+            else:
+                raise PrometheusApiClientException(
+                    "HTTP Status Code {} ({!r})".format(
+                        response.status_code, response.content
+                    )
+                )
+
+    async def get_label_values(self, label_name: str, params: dict = None) -> List[str]:
+        if PrometheusApis.LABELS not in self.config.supported_apis:
+            raise PrometheusApiClientException("Labels Api not supported")
+        with self._track("label_values", label_name) as event:
+            response = await self.resilience.send(
+                "label_values",
+                lambda: self._request(
+                    "GET", f"{self.url}/api/v1/label/{label_name}/values", params=params
+                ),
+            )
+            self._record_response(event, response)
+            if response.status_code == 200:
+                return event.decode(self._json_loads, response.content)["data"]
+            else:
+                raise PrometheusApiClientException(
+                    "HTTP Status Code {} ({!r})".format(
+                        response.status_code, response.content
+                    )
+                )
+
+    async def all_metrics(self, params: dict = None) -> List[str]:
+        return await self.get_label_values(label_name="__name__", params=params)
+
+    async def get_series(
+        self,
+        match: List[str],
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        params: dict = None,
+        label_matchers: LabelMatchers = None,
+    ) -> Dict:
+        match = [self._scope_query(selector, label_matchers) for selector in match]
+        data = {"match[]": match}
+        if start_time:
+            data["start"] = round(start_time.timestamp())
+        if end_time:
+            data["end"] = round(end_time.timestamp())
+
+        with self._track("series", ", ".join(match)) as event:
+            response = await self.resilience.send(
+                "series",
+                lambda: self._request(
+                    "POST", f"{self.url}/api/v1/series", data=data, params=params
+                ),
+            )
+            self._record_response(event, response)
+            if response.status_code == 200:
+                return event.decode(self._json_loads, response.content)["data"]
+            else:
+                raise PrometheusApiClientException(
+                    f"Failed to retrieve `series` data from Prometheus. "
+                    f"Response status: {response.status_code!r}. "
+                    f"Response content: {response.content!r}.  "
+                )
+
+    async def check_prometheus_connection(self, params: dict = None) -> None:
+        params = params or {}
+        try:
+            response = await self._custom_query(query="example", params=params)
+            if response.status_code == 401:
+                if await asyncio.to_thread(
+                    PrometheusAuthorization.request_new_token, self.config
+                ):
+                    self.headers = PrometheusAuthorization.get_authorization_headers(
+                        self.config
+                    )
+                    response = await self._custom_query(query="example", params=params)
+            response.raise_for_status()
+        except (httpx.HTTPError, PrometheusApiClientException) as e:
+            raise PrometheusNotFound(
+                f"Couldn't connect to Prometheus found under {self.url}\nCaused by {e.__class__.__name__}: {e})"
+            ) from e
+
+    async def get_prometheus_flags(self) -> Optional[Dict]:
+        try:
+            if PrometheusApis.FLAGS in self.config.supported_apis:
+                return await self.fetch_prometheus_flags()
+            if PrometheusApis.VM_FLAGS in self.config.supported_apis:
+                return await self.fetch_victoria_metrics_flags()
+        except Exception as e:
+            service_name = (
+                "Prometheus"
+                if PrometheusApis.FLAGS in self.config.supported_apis
+                else "Victoria Metrics"
+            )
+            raise PrometheusFlagsConnectionError(
+                f"Couldn't connect to the url: {self.url}\n\t\t{service_name}: {e}"
+            )
+
+    async def fetch_prometheus_flags(self) -> Dict:
+        try:
+            response = await self._request("GET", f"{self.url}/api/v1/status/flags")
+            response.raise_for_status()
+            return self._json_loads(response.content).get("data", {})
+        except Exception as e:
+            raise PrometheusNotFound(
+                f"Couldn't connect to Prometheus found under {self.url}\nCaused by {e.__class__.__name__}: {e})"
+            ) from e
+
+    async def fetch_victoria_metrics_flags(self) -> Dict:
+        try:
+            # connecting to VictoriaMetrics
+            response = await self._request("GET", f"{self.url}/flags")
+            response.raise_for_status()
+            return text_config_to_dict(response.text)
+        except Exception as e:
+            raise VictoriaMetricsNotFound(
+                f"Couldn't connect to VictoriaMetrics found under {self.url}\nCaused by {e.__class__.__name__}: {e})"
+            ) from e
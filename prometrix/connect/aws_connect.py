@@ -1,6 +1,5 @@
 import os
-from datetime import datetime
-from typing import Any, Dict, Optional
+from typing import Dict, Optional
 import logging
 
 import requests
@@ -8,16 +7,21 @@ import boto3
 from botocore.auth import SigV4Auth
 from botocore.awsrequest import AWSRequest
 from botocore.credentials import Credentials
-from prometheus_api_client import PrometheusApiClientException
 from botocore.exceptions import BotoCoreError, ClientError
 
 from prometrix.connect.custom_connect import CustomPrometheusConnect
+from prometrix.remote_read import REMOTE_READ_HEADERS
 
 SA_TOKEN_PATH = os.environ.get("SA_TOKEN_PATH", "/var/run/secrets/eks.amazonaws.com/serviceaccount/token")
 AWS_ASSUME_ROLE = os.environ.get("AWS_ASSUME_ROLE")
 
-class AWSPrometheusConnect(CustomPrometheusConnect):
-    def __init__(
+class AWSSigV4Mixin:
+    """
+    Resolves AWS credentials (static keys, IRSA and an optional assumed role) and signs requests with SigV4.
+    Shared by the sync and async AWS Prometheus connect classes.
+    """
+
+    def _init_aws_credentials(
         self,
         access_key: Optional[str],
         secret_key: Optional[str],
@@ -25,9 +29,7 @@ class AWSPrometheusConnect(CustomPrometheusConnect):
         service_name: str,
         token: Optional[str] = None,
         assume_role_arn: Optional[str] = None,
-        **kwargs,
-    ):
-        super().__init__(**kwargs)
+    ) -> None:
         self.region = region
         self.service_name = service_name
 
@@ -78,21 +80,52 @@ class AWSPrometheusConnect(CustomPrometheusConnect):
         frozen = self._credentials.get_frozen_credentials()
         return SigV4Auth(frozen, self.service_name, self.region)
 
-    def signed_request(
-        self, method, url, data=None, params=None, verify=False, headers=None
-    ):
+    def _sign_headers(
+        self, method: str, url: str, data=None, params=None, headers=None
+    ) -> Dict[str, str]:
         request = AWSRequest(method=method, url=url, data=data, params=params, headers=headers)
         auth = self._build_auth()
         auth.add_auth(request)
-        return requests.request(
-            method=method,
-            url=url,
-            headers=dict(request.headers),
-            verify=verify,
-            data=data,
-            params=params,
+        return dict(request.headers)
+
+
+class AWSPrometheusConnect(AWSSigV4Mixin, CustomPrometheusConnect):
+    def __init__(
+        self,
+        access_key: Optional[str],
+        secret_key: Optional[str],
+        region: str,
+        service_name: str,
+        token: Optional[str] = None,
+        assume_role_arn: Optional[str] = None,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self._init_aws_credentials(
+            access_key=access_key,
+            secret_key=secret_key,
+            region=region,
+            service_name=service_name,
+            token=token,
+            assume_role_arn=assume_role_arn,
         )
 
+    def signed_request(
+        self, method, url, data=None, params=None, verify=False, headers=None, stream=False
+    ):
+        # Prepare through the pooled session so its query string params are merged in,
+        # then sign the exact url and body that are sent. Credentials are re-read on every call.
+        prepared = self._session.prepare_request(
+            requests.Request(method=method, url=url, data=data, params=params, headers=headers)
+        )
+        prepared.headers.update(
+            self._sign_headers(method, prepared.url, data=prepared.body, headers=headers)
+        )
+        settings = self._session.merge_environment_settings(
+            prepared.url, {}, stream, verify, None
+        )
+        return self._session.send(prepared, timeout=self._timeout, **settings)
+
     def _custom_query(self, query: str, params: dict = None):
         """
         Send a custom query to a Prometheus Host.
@@ -123,71 +156,36 @@ class AWSPrometheusConnect(CustomPrometheusConnect):
         )
         return response
 
-    def safe_custom_query_range(
-        self,
-        query: str,
-        start_time: datetime,
-        end_time: datetime,
-        step: str,
-        params: Optional[Dict[str, Any]] = None,
-    ):
-        """
-        Send a query_range to a Prometheus Host.
-        This method takes as input a string which will be sent as a query to
-        the specified Prometheus Host. This query is a PromQL query.
-        :param query: (str) This is a PromQL query, a few examples can be found
-            at https://prometheus.io/docs/prometheus/latest/querying/examples/
-        :param start_time: (datetime) A datetime object that specifies the query range start time.
-        :param end_time: (datetime) A datetime object that specifies the query range end time.
-        :param step: (str) Query resolution step width in duration format or float number of seconds - i.e 100s, 3d, 2w, 170.3
-        :param params: (dict) Optional dictionary containing GET parameters to be
-            sent along with the API request, such as "timeout"
-        :returns: (dict) A dict of metric data received in response of the query sent
-        :raises:
-            (RequestException) Raises an exception in case of a connection error
-            (PrometheusApiClientException) Raises in case of non 200 response status code
-        """
-        start = round(start_time.timestamp())
-        end = round(end_time.timestamp())
-        params = params or {}
-
-        query = str(query)
-        response = self.signed_request(
+    def _send_query_range(self, data: dict, stream: bool = False) -> requests.Response:
+        return self.signed_request(
             method="POST",
             url="{0}/api/v1/query_range".format(self.url),
-            data={
-                **{"query": query, "start": start, "end": end, "step": step},
-                **params,
-            },
+            data=data,
             params={},
+            verify=self.ssl_verification,
             headers=self.headers,
+            stream=stream,
         )
-        if response.status_code == 200:
-            return response.json()["data"]
-        else:
-            raise PrometheusApiClientException(
-                "HTTP Status Code {} ({!r})".format(
-                    response.status_code, response.content
-                )
-            )
 
-    def get_label_values(self, label_name: str, params: dict = None):
-        params = params or {}
-        response = self.signed_request(
+    def _send_remote_read(self, body: bytes) -> requests.Response:
+        return self.signed_request(
+            method="POST",
+            url="{0}{1}".format(self.url, self.config.remote_read_path),
+            data=body,
+            params={},
+            verify=self.ssl_verification,
+            headers={**self.headers, **REMOTE_READ_HEADERS},
+            stream=True,
+        )
+
+    def _send_label_values(self, label_name: str, params: dict) -> requests.Response:
+        return self.signed_request(
             method="GET",
             url="{0}/api/v1/label/{1}/values".format(self.url, label_name),
             verify=self.ssl_verification,
             headers=self.headers,
             params=params,
         )
-        if response.status_code == 200:
-            return response.json()["data"]
-        else:
-            raise PrometheusApiClientException(
-                "HTTP Status Code {} ({!r})".format(
-                    response.status_code, response.content
-                )
-            )
 
     def all_metrics(self, params: dict = None):
         """
@@ -1,27 +1,146 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import closing
 from datetime import datetime
-from typing import Dict, Optional, List
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import requests
 from prometheus_api_client import (PrometheusApiClientException,
                                    PrometheusConnect)
-from requests.adapters import HTTPAdapter
 from requests.exceptions import ConnectionError, HTTPError
 
-from prometrix.auth import PrometheusAuthorization
+from prometrix.auth import AzureBearerAuth, PrometheusAuthorization
+from prometrix.decoding import SUPPORTED_ACCEPT_ENCODING, get_json_loads
 from prometrix.exceptions import (PrometheusFlagsConnectionError,
-                                  PrometheusNotFound, VictoriaMetricsNotFound)
-from prometrix.models.prometheus_config import PrometheusApis, PrometheusConfig
+                                  PrometheusNotFound, QueryBudgetExceeded,
+                                  VictoriaMetricsNotFound)
+from prometrix.instrumentation import (RequestEvent, RequestListener,
+                                       TimedHTTPAdapter, track_request)
+from prometrix.metadata_cache import MetadataCache
+from prometrix.models.prometheus_config import (OverBudgetAction,
+                                                PrometheusApis,
+                                                PrometheusConfig)
+from prometrix.models.prometheus_query import (QueryBatchResult, QueryPlan,
+                                               QuerySpec, RangeQuery)
+from prometrix.persistent_cache import (DEFAULT_PERSISTENT_CACHE_MAX_BYTES,
+                                        PersistentRangeQueryCache)
+from prometrix.planner import plan_range
+from prometrix.promql import (LabelMatchers, additional_label_matchers,
+                              inject_label_matchers, parse_series_selector,
+                              to_label_matchers)
+from prometrix.range_cache import RangeQueryCache, align_to_step
+from prometrix.remote_read import (REMOTE_READ_HEADERS, STREAMED_CONTENT_TYPE,
+                                   encode_read_request,
+                                   iter_remote_read_series,
+                                   snappy_literal_block)
+from prometrix.resilience import ResilientSender
+from prometrix.sharding import (merge_matrix_data, parse_duration_seconds,
+                                split_time_range)
+from prometrix.singleflight import SingleFlight, make_call_key
+from prometrix.streaming import iter_result_items
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def text_config_to_dict(text: str) -> Dict:
+    conf = {}
+    lines = text.strip().split("\n")
+    for line in lines:
+        key, val = line.strip().split("=")
+        conf[key] = val.strip('"')
+
+    return conf
 
 
 class CustomPrometheusConnect(PrometheusConnect):
     def __init__(self, config: PrometheusConfig):
         super().__init__(
-            url=config.url, disable_ssl=config.disable_ssl, headers=config.headers
+            url=config.url,
+            disable_ssl=config.disable_ssl,
+            headers=config.headers,
+            timeout=(config.resilience.connect_timeout, config.resilience.read_timeout),
         )
         self.config = config
         self.ssl_verification = not config.disable_ssl
         self._session = requests.Session()
-        self._session.mount(self.url, HTTPAdapter(pool_maxsize=10, pool_block=True))
+        self._session.mount(
+            self.url, TimedHTTPAdapter(pool_maxsize=config.pool_maxsize, pool_block=True)
+        )
+        self._session.headers["Accept-Encoding"] = (
+            config.accept_encoding or SUPPORTED_ACCEPT_ENCODING
+        )
+        self._json_loads = get_json_loads(config.json_backend)
+        if PrometheusAuthorization.azure_authorization(config):
+            self._session.auth = AzureBearerAuth(config)
+        self.single_flight: Optional[SingleFlight] = (
+            SingleFlight() if config.single_flight else None
+        )
+        self.range_cache: Optional[RangeQueryCache] = None
+        if config.range_cache_path:
+            self.range_cache = PersistentRangeQueryCache(
+                path=config.range_cache_path,
+                max_bytes=(
+                    config.range_cache_max_bytes
+                    if config.range_cache_max_bytes is not None
+                    else DEFAULT_PERSISTENT_CACHE_MAX_BYTES
+                ),
+                mutable_window_seconds=parse_duration_seconds(
+                    config.range_cache_mutable_window
+                ),
+                max_age_seconds=(
+                    parse_duration_seconds(config.range_cache_max_age)
+                    if config.range_cache_max_age
+                    else None
+                ),
+            )
+        elif config.range_cache_max_bytes:
+            self.range_cache = RangeQueryCache(
+                max_bytes=config.range_cache_max_bytes,
+                mutable_window_seconds=parse_duration_seconds(
+                    config.range_cache_mutable_window
+                ),
+            )
+
+        self.metadata_cache: Optional[MetadataCache] = None
+        if config.metadata_cache_ttl:
+            self.metadata_cache = MetadataCache(
+                ttl_seconds=parse_duration_seconds(config.metadata_cache_ttl),
+                max_entries=config.metadata_cache_max_entries,
+            )
+        self.request_listeners: List[RequestListener] = []
+        self.scope_matchers = additional_label_matchers(config)
+        self.resilience = ResilientSender(
+            config.resilience, pool_size=config.pool_maxsize, name=self.url
+        )
+
+    def add_request_listener(self, listener: RequestListener) -> None:
+        """
+        Register a callback receiving a RequestEvent after every request sent to the backend.
+        Listeners run synchronously on the requesting thread and should return quickly.
+        """
+        self.request_listeners.append(listener)
+
+    def remove_request_listener(self, listener: RequestListener) -> None:
+        self.request_listeners.remove(listener)
+
+    def _scope_query(self, query: str, label_matchers: LabelMatchers = None) -> str:
+        matchers = self.scope_matchers + to_label_matchers(label_matchers)
+        return inject_label_matchers(str(query), matchers)
+
+    def _track(self, endpoint: str, query: Optional[str] = None):
+        return track_request(self.request_listeners, type(self.config).__name__, endpoint, query)
+
+    @staticmethod
+    def _record_response(event: RequestEvent, response: requests.Response) -> None:
+        content = response.content
+        # Bytes read from the wire, before decompression
+        wire_bytes = response.raw.tell() if hasattr(response.raw, "tell") else len(content)
+        event.response_received(
+            response.status_code,
+            wire_bytes or len(content),
+            response.elapsed.total_seconds(),
+            retries=len(response.history),
+        )
 
     def safe_custom_query_range(
         self,
@@ -30,36 +149,216 @@ class CustomPrometheusConnect(PrometheusConnect):
         end_time: datetime,
         step: str,
         params: dict = None,
+        label_matchers: LabelMatchers = None,
     ):
         """
         The main difference here is that the method here is POST and the prometheus_cli is GET
+        When `query_range_shard_points` is configured, long ranges are split into step-aligned shards
+        that are queried concurrently and merged back into a single matrix result.
+        When `range_cache_max_bytes` is configured, only the parts of the range missing from the range cache
+        are fetched.
+        When `single_flight` is enabled, concurrent identical calls share one request and result.
+        `label_matchers` (and the config's additional_labels, with `inject_additional_labels`) are added
+        to every selector of the query.
         """
         start = round(start_time.timestamp())
         end = round(end_time.timestamp())
         params = params or {}
-        data = None
-        query = str(query)
-        # using the query_range API to get raw data
-        response = self._session.post(
-            "{0}/api/v1/query_range".format(self.url),
-            data={
-                "query": query,
-                "start": start,
-                "end": end,
-                "step": step,
-                **params,
-            },
+        query = self._scope_query(query, label_matchers)
+        if self.single_flight is not None:
+            return self.single_flight.do(
+                make_call_key("query_range", query, params, start, end, str(step)),
+                lambda: self._fetch_query_range(query, start, end, step, params),
+            )
+        return self._fetch_query_range(query, start, end, step, params)
+
+    def _fetch_query_range(
+        self, query: str, start: float, end: float, step: str, params: dict
+    ) -> Dict:
+        if self.range_cache is not None:
+            # Prometheus evaluates at start + k * step: the last of these up to `end` gives the same samples,
+            # and windows sliding by whole steps share the cached grid
+            step_seconds = parse_duration_seconds(step)
+            return self.range_cache.query_range(
+                key=RangeQueryCache.make_key(self.url, query, step, params, step_offset=start % step_seconds),
+                start=start,
+                end=align_to_step(end, step_seconds, origin=start),
+                step_seconds=step_seconds,
+                fetch=lambda fetch_start, fetch_end: self._execute_query_range(
+                    query, fetch_start, fetch_end, step, params
+                ),
+            )
+        return self._execute_query_range(query, start, end, step, params)
+
+    def _execute_query_range(
+        self, query: str, start: float, end: float, step: str, params: dict
+    ) -> Dict:
+        shard_points = self.config.query_range_shard_points
+        if shard_points:
+            ranges = split_time_range(start, end, parse_duration_seconds(step), shard_points)
+            if len(ranges) > 1:
+                return self._sharded_query_range(query, ranges, step, params)
+        return self._query_range(query, start, end, step, params)
+
+    def _sharded_query_range(
+        self, query: str, ranges: List[Tuple[float, float]], step: str, params: dict
+    ) -> Dict:
+        workers = max(1, min(self.config.query_range_shard_workers, len(ranges)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            parts = list(
+                executor.map(
+                    lambda time_range: self._query_range(
+                        query, time_range[0], time_range[1], step, params
+                    ),
+                    ranges,
+                )
+            )
+        return merge_matrix_data(parts)
+
+    def _query_range(
+        self, query: str, start: float, end: float, step: str, params: dict
+    ) -> Dict:
+        with self._track("query_range", query) as event:
+            # using the query_range API to get raw data
+            response = self.resilience.send(
+                "query_range",
+                lambda: self._send_query_range(
+                    data={
+                        "query": query,
+                        "start": start,
+                        "end": end,
+                        "step": step,
+                        **params,
+                    }
+                ),
+            )
+            self._record_response(event, response)
+            if response.status_code == 200:
+                return event.decode(self._json_loads, response.content)["data"]
+            else:
+                raise PrometheusApiClientException(
+                    "HTTP Status Code {} ({!r})".format(
+                        response.status_code, response.content
+                    )
+                )
+
+    def _send_query_range(self, data: dict, stream: bool = False) -> requests.Response:
+        return self._session.post(
+            f"{self.url}/api/v1/query_range",
+            data=data,
             verify=self.ssl_verification,
+            timeout=self._timeout,
             headers=self.headers,
+            stream=stream,
         )
-        if response.status_code == 200:
-            return response.json()["data"]
-        else:
-            raise PrometheusApiClientException(
-                "HTTP Status Code {} ({!r})".format(
-                    response.status_code, response.content
-                )
+
+    def stream_custom_query_range(
+        self,
+        query: str,
+        start_time: datetime,
+        end_time: datetime,
+        step: str,
+        params: dict = None,
+        chunk_size: int = STREAM_CHUNK_SIZE,
+        label_matchers: LabelMatchers = None,
+    ) -> Iterator[Dict]:
+        """
+        Send a query_range and parse the response body incrementally while it is downloaded.
+        Yields one series dict (`metric` labels and `values` samples) at a time, so peak memory is bounded
+        by the largest single series instead of the whole response.
+        The request is sent when iteration starts.
+        """
+        params = params or {}
+        query = self._scope_query(query, label_matchers)
+        with self._track("query_range", str(query)) as event:
+            response = self.resilience.send(
+                "query_range",
+                lambda: self._send_query_range(
+                    data={
+                        "query": str(query),
+                        "start": round(start_time.timestamp()),
+                        "end": round(end_time.timestamp()),
+                        "step": step,
+                        **params,
+                    },
+                    stream=True,
+                ),
             )
+            with closing(response):
+                event.status_code = response.status_code
+                if response.status_code != 200:
+                    raise PrometheusApiClientException(
+                        "HTTP Status Code {} ({!r})".format(
+                            response.status_code, response.content
+                        )
+                    )
+                event.series, event.samples = 0, 0
+                for item in iter_result_items(response.iter_content(chunk_size=chunk_size)):
+                    event.series += 1
+                    event.samples += len(item.get("values", ())) + len(item.get("histograms", ()))
+                    yield item
+                event.response_received(
+                    response.status_code, response.raw.tell(), response.elapsed.total_seconds()
+                )
+
+    def stream_remote_read(
+        self,
+        selector: LabelMatchers,
+        start_time: datetime,
+        end_time: datetime,
+        label_matchers: LabelMatchers = None,
+        chunk_size: int = STREAM_CHUNK_SIZE,
+        verify_checksums: bool = True,
+    ) -> Iterator[Dict]:
+        """
+        Read the raw samples of the series matching `selector` (like `'{__name__="up", job="api"}'`) through
+        the remote read API, at full resolution and without PromQL evaluation. The response is streamed as
+        XOR chunks, which are decoded while downloaded into one series dict at a time: `metric` labels,
+        `timestamps` (seconds) and `values`, as float64 buffers.
+        `label_matchers` (and the config's additional_labels, with `inject_additional_labels`) are added to
+        the selector. The request is sent when iteration starts.
+        """
+        matchers = to_label_matchers(selector) + self.scope_matchers + to_label_matchers(label_matchers)
+        start_ms = int(start_time.timestamp() * 1000)
+        end_ms = int(end_time.timestamp() * 1000)
+        body = snappy_literal_block(encode_read_request(start_ms, end_ms, matchers))
+        selector_text = "{" + ", ".join(str(matcher) for matcher in matchers) + "}"
+        with self._track("read", selector_text) as event:
+            response = self.resilience.send("read", lambda: self._send_remote_read(body))
+            with closing(response):
+                event.status_code = response.status_code
+                if response.status_code != 200:
+                    raise PrometheusApiClientException(
+                        "HTTP Status Code {} ({!r})".format(
+                            response.status_code, response.content
+                        )
+                    )
+                content_type = response.headers.get("Content-Type", "")
+                if not content_type.startswith(STREAMED_CONTENT_TYPE):
+                    raise PrometheusApiClientException(
+                        f"Remote read answered with {content_type!r} instead of streamed chunks, "
+                        "the server must support STREAMED_XOR_CHUNKS (Prometheus 2.13 or later)"
+                    )
+                event.series, event.samples = 0, 0
+                for item in iter_remote_read_series(
+                    response.iter_content(chunk_size=chunk_size), start_ms, end_ms, verify_checksums
+                ):
+                    event.series += 1
+                    event.samples += len(item["values"])
+                    yield item
+                event.response_received(
+                    response.status_code, response.raw.tell(), response.elapsed.total_seconds()
+                )
+
+    def _send_remote_read(self, body: bytes) -> requests.Response:
+        return self._session.post(
+            f"{self.url}{self.config.remote_read_path}",
+            data=body,
+            verify=self.ssl_verification,
+            timeout=self._timeout,
+            headers={**self.headers, **REMOTE_READ_HEADERS},
+            stream=True,
+        )
 
     def _custom_query(self, query: str, params: dict = None):
         """
@@ -73,27 +372,218 @@ class CustomPrometheusConnect(PrometheusConnect):
             "{0}/api/v1/query".format(self.url),
             data={"query": query, **params},
             verify=self.ssl_verification,
+            timeout=self._timeout,
             headers=self.headers,
         )
         return response
 
     def get_label_values(self, label_name: str, params: dict = None):
+        """
+        Get the values of a label, served from the metadata cache when `metadata_cache_ttl` is configured.
+        `all_metrics` is cached through this method as well.
+        """
         if PrometheusApis.LABELS not in self.config.supported_apis:
             raise PrometheusApiClientException("Labels Api not supported")
-        return super().get_label_values(label_name, params)
-
-    def safe_custom_query(self, query: str, params: dict = None):
-        response = self._custom_query(query, params)
-        if response.status_code == 200:
-            data = response.json()["data"]
-        else:
-            raise PrometheusApiClientException(
-                "HTTP Status Code {} ({!r})".format(
-                    response.status_code, response.content
+        if self.metadata_cache is not None:
+            return self.metadata_cache.get_label_values(
+                label_name, params, lambda: self._fetch_label_values(label_name, params)
+            )
+        return self._fetch_label_values(label_name, params)
+
+    def _fetch_label_values(self, label_name: str, params: dict = None) -> List[str]:
+        with self._track("label_values", label_name) as event:
+            response = self.resilience.send(
+                "label_values", lambda: self._send_label_values(label_name, params or {})
+            )
+            self._record_response(event, response)
+            if response.status_code == 200:
+                return event.decode(self._json_loads, response.content)["data"]
+            else:
+                raise PrometheusApiClientException(
+                    "HTTP Status Code {} ({!r})".format(
+                        response.status_code, response.content
+                    )
                 )
+
+    def _send_label_values(self, label_name: str, params: dict) -> requests.Response:
+        return self._session.get(
+            f"{self.url}/api/v1/label/{label_name}/values",
+            verify=self.ssl_verification,
+            timeout=self._timeout,
+            headers=self.headers,
+            params=params,
+        )
+
+    def safe_custom_query(
+        self, query: str, params: dict = None, label_matchers: LabelMatchers = None
+    ):
+        query = self._scope_query(query, label_matchers)
+        if self.single_flight is not None:
+            return self.single_flight.do(
+                make_call_key("query", query, params),
+                lambda: self._fetch_query(query, params),
             )
+        return self._fetch_query(query, params)
+
+    def _fetch_query(self, query: str, params: dict = None) -> Dict:
+        with self._track("query", str(query)) as event:
+            response = self.resilience.send("query", lambda: self._custom_query(query, params))
+            self._record_response(event, response)
+            if response.status_code == 200:
+                data = event.decode(self._json_loads, response.content)["data"]
+            else:
+                raise PrometheusApiClientException(
+                    "HTTP Status Code {} ({!r})".format(
+                        response.status_code, response.content
+                    )
+                )
         return data
 
+    def safe_custom_query_batch(
+        self, queries: List[QuerySpec], max_workers: Optional[int] = None
+    ) -> List[QueryBatchResult]:
+        """
+        Run instant and range queries concurrently over the shared session.
+        Results are returned in the order of `queries`. A failing query is reported through its
+        QueryBatchResult.error and does not abort the rest of the batch.
+        :param max_workers: Max queries in flight, defaults to the config's `batch_max_workers`.
+        """
+        results = list(self.iter_custom_query_batch(queries, max_workers))
+        return sorted(results, key=lambda result: result.index)
+
+    def iter_custom_query_batch(
+        self, queries: List[QuerySpec], max_workers: Optional[int] = None
+    ) -> Iterator[QueryBatchResult]:
+        """
+        Same as safe_custom_query_batch, but yields each QueryBatchResult as soon as its query completes.
+        Queries that have not started yet are cancelled if the iterator is closed early.
+        """
+        if not queries:
+            return
+        workers = max(1, min(max_workers or self.config.batch_max_workers, len(queries)))
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            futures = [
+                executor.submit(self._run_batch_query, index, spec)
+                for index, spec in enumerate(queries)
+            ]
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def plan_query_range(
+        self,
+        query: str,
+        start_time: datetime,
+        end_time: datetime,
+        step: str,
+        params: dict = None,
+        label_matchers: LabelMatchers = None,
+    ) -> QueryPlan:
+        """
+        Preflight a range query against the config's `max_points_per_series` and `query_sample_budget`.
+        With a sample budget, the series count is estimated first: by a series lookup over the range when
+        the query is a plain selector, otherwise by a `count()` instant query at the end time.
+        Queries over the budget are planned according to `over_budget_action`, run the plan with
+        execute_query_plan.
+        """
+        query = self._scope_query(query, label_matchers)
+        series = None
+        if self.config.query_sample_budget is not None:
+            series = self._estimate_series(query, start_time, end_time, params or {})
+        plan = plan_range(
+            query=query,
+            start=round(start_time.timestamp()),
+            end=round(end_time.timestamp()),
+            step=step,
+            series=series,
+            base_step=self.config.query_step,
+            sample_budget=self.config.query_sample_budget,
+            max_points_per_series=self.config.max_points_per_series,
+            action=self.config.over_budget_action,
+        )
+        if plan.action != "run":
+            logging.info(f"Planned Prometheus query {query!r} as {plan.action}: {plan.reason}")
+        return plan
+
+    def _estimate_series(
+        self, query: str, start_time: datetime, end_time: datetime, params: dict
+    ) -> int:
+        try:
+            parse_series_selector(query)
+        except ValueError:
+            data = self.safe_custom_query(
+                f"count({query})", params={**params, "time": round(end_time.timestamp())}
+            )
+            result = data.get("result") or []
+            return int(float(result[0]["value"][1])) if result else 0
+        return len(self.get_series([query], start_time, end_time))
+
+    def execute_query_plan(self, plan: QueryPlan, params: dict = None) -> Dict:
+        """
+        Run a range query as planned by plan_query_range. Shards run concurrently, up to
+        `query_range_shard_workers`, and are merged into a single matrix.
+        :raises: (QueryBudgetExceeded) If the plan rejected the query.
+        """
+        if plan.action == OverBudgetAction.REJECT.value:
+            raise QueryBudgetExceeded(f"Query {plan.query!r} rejected: {plan.reason}", plan)
+        if plan.shards <= 1:
+            return self.safe_custom_query_range(
+                plan.query,
+                datetime.fromtimestamp(plan.start),
+                datetime.fromtimestamp(plan.end),
+                plan.step,
+                params,
+            )
+        ranges = split_time_range(
+            plan.start, plan.end, parse_duration_seconds(plan.step), plan.shard_points
+        )
+        workers = max(1, min(self.config.query_range_shard_workers, len(ranges)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            parts = list(
+                executor.map(
+                    lambda time_range: self.safe_custom_query_range(
+                        plan.query,
+                        datetime.fromtimestamp(time_range[0]),
+                        datetime.fromtimestamp(time_range[1]),
+                        plan.step,
+                        params,
+                    ),
+                    ranges,
+                )
+            )
+        return merge_matrix_data(parts)
+
+    def planned_custom_query_range(
+        self,
+        query: str,
+        start_time: datetime,
+        end_time: datetime,
+        step: str,
+        params: dict = None,
+        label_matchers: LabelMatchers = None,
+    ) -> Tuple[QueryPlan, Dict]:
+        """ plan_query_range then execute_query_plan, returns the plan with the query's `data` """
+        plan = self.plan_query_range(query, start_time, end_time, step, params, label_matchers)
+        return plan, self.execute_query_plan(plan, params)
+
+    def _run_batch_query(self, index: int, spec: QuerySpec) -> QueryBatchResult:
+        try:
+            if isinstance(spec, RangeQuery):
+                data = self.safe_custom_query_range(
+                    query=spec.query,
+                    start_time=spec.start_time,
+                    end_time=spec.end_time,
+                    step=spec.step,
+                    params=spec.params,
+                )
+            else:
+                data = self.safe_custom_query(query=spec.query, params=spec.params)
+        except Exception as e:
+            return QueryBatchResult(index=index, query=spec.query, error=e)
+        return QueryBatchResult(index=index, query=spec.query, data=data)
+
     def check_prometheus_connection(self, params: dict = None):
         params = params or {}
         try:
@@ -110,15 +600,6 @@ class CustomPrometheusConnect(PrometheusConnect):
                 f"Couldn't connect to Prometheus found under {self.url}\nCaused by {e.__class__.__name__}: {e})"
             ) from e
 
-    def __text_config_to_dict(self, text: str) -> Dict:
-        conf = {}
-        lines = text.strip().split("\n")
-        for line in lines:
-            key, val = line.strip().split("=")
-            conf[key] = val.strip('"')
-
-        return conf
-
     def get_prometheus_flags(self) -> Optional[Dict]:
         try:
             if PrometheusApis.FLAGS in self.config.supported_apis:
@@ -140,12 +621,13 @@ class CustomPrometheusConnect(PrometheusConnect):
             response = self._session.get(
                 f"{self.url}/api/v1/status/flags",
                 verify=self.ssl_verification,
+                timeout=self._timeout,
                 headers=self.headers,
                 # This query should return empty results, but is correct
                 params={},
             )
             response.raise_for_status()
-            return response.json().get("data", {})
+            return self._json_loads(response.content).get("data", {})
         except Exception as e:
             raise PrometheusNotFound(
                 f"Couldn't connect to Prometheus found under {self.url}\nCaused by {e.__class__.__name__}: {e})"
@@ -157,13 +639,14 @@ class CustomPrometheusConnect(PrometheusConnect):
             response = self._session.get(
                 f"{self.url}/flags",
                 verify=self.ssl_verification,
+                timeout=self._timeout,
                 headers=self.headers,
                 # This query should return empty results, but is correct
                 params={},
             )
             response.raise_for_status()
 
-            configuration = self.__text_config_to_dict(response.text)
+            configuration = text_config_to_dict(response.text)
             return configuration
         except Exception as e:
             raise VictoriaMetricsNotFound(
@@ -175,12 +658,14 @@ class CustomPrometheusConnect(PrometheusConnect):
             f"{self.url}/api/v1/series",
             data=data,
             verify=self.ssl_verification,
+            timeout=self._timeout,
             headers=self.headers,
             params=params,
         )
 
     def get_series(self, match: List[str], start_time: Optional[datetime] = None,
-                   end_time: Optional[datetime] = None, params: dict = None) -> Dict:
+                   end_time: Optional[datetime] = None, params: dict = None,
+                   label_matchers: LabelMatchers = None) -> Dict:
         """
         Retrieves a dictionary of series that match the specified label sets from Prometheus.
 
@@ -188,15 +673,20 @@ class CustomPrometheusConnect(PrometheusConnect):
         :param start_time: (Optional[datetime]) The start time for the query as a datetime object.
         :param end_time: (Optional[datetime]) The end time for the query as a datetime object.
         :param params: (Optional[dict]) Additional parameters to be sent in the query.
+        :param label_matchers: Label matchers added to every selector, with the config's additional_labels
+            when `inject_additional_labels` is set.
         :returns: (dict) A dictionary of the query results, which includes the series of matched metrics.
         :raises:
             (PrometheusApiClientException) Raises an exception with details of the response, in case of a non 200 HTTP status code.
+
+        When `metadata_cache_ttl` is configured, answers are cached, and a lookup with narrower selectors
+        and time range than a cached one is answered by filtering the cached series.
         """
         params = params or {}
 
         # The data to be sent with the POST request
         data = {
-            'match[]': match,
+            'match[]': [self._scope_query(selector, label_matchers) for selector in match],
         }
 
         # Include start and end time in the data if provided
@@ -205,13 +695,28 @@ class CustomPrometheusConnect(PrometheusConnect):
         if end_time:
             data['end'] = round(end_time.timestamp())
 
-        response = self._send_series(data=data, params=params)
-        if response.status_code == 200:
-            return response.json()["data"]
-        else:
-            raise PrometheusApiClientException(
-                f"Failed to retrieve `series` data from Prometheus. "
-                f"Response status: {response.status_code!r}. "
-                f"Response content: {response.content!r}.  "
+        if self.metadata_cache is not None:
+            return self.metadata_cache.get_series(
+                match=list(data['match[]']),
+                start=data.get('start'),
+                end=data.get('end'),
+                params=params,
+                fetch=lambda: self._fetch_series(data, params),
             )
+        return self._fetch_series(data, params)
+
+    def _fetch_series(self, data: dict, params: dict) -> Dict:
+        with self._track("series", ", ".join(data["match[]"])) as event:
+            response = self.resilience.send(
+                "series", lambda: self._send_series(data=data, params=params)
+            )
+            self._record_response(event, response)
+            if response.status_code == 200:
+                return event.decode(self._json_loads, response.content)["data"]
+            else:
+                raise PrometheusApiClientException(
+                    f"Failed to retrieve `series` data from Prometheus. "
+                    f"Response status: {response.status_code!r}. "
+                    f"Response content: {response.content!r}.  "
+                )
 
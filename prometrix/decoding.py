@@ -0,0 +1,60 @@
+import json
+import logging
+from typing import Any, Callable, Dict
+
+from urllib3.util.request import ACCEPT_ENCODING
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+JsonLoads = Callable[[bytes], Any]
+
+# Content encodings urllib3 can decode in this environment: gzip and deflate, plus br and zstd
+# when the brotli / zstd packages are installed
+SUPPORTED_ACCEPT_ENCODING = ", ".join(ACCEPT_ENCODING.split(","))
+
+
+def _json_loads(content: bytes) -> Any:
+    return json.loads(content)
+
+
+def _available_backends() -> Dict[str, JsonLoads]:
+    backends: Dict[str, JsonLoads] = {}
+    if orjson is not None:
+        backends["orjson"] = orjson.loads
+    if msgspec is not None:
+        backends["msgspec"] = msgspec.json.decode
+    backends["json"] = _json_loads
+    return backends
+
+
+_BACKENDS = _available_backends()
+_warned_missing = set()
+
+
+def available_json_backends() -> Dict[str, JsonLoads]:
+    """ The installed JSON backends, fastest first """
+    return dict(_BACKENDS)
+
+
+def get_json_loads(backend: str = "auto") -> JsonLoads:
+    """
+    Return the loads function of a JSON backend: "orjson", "msgspec", "json", or "auto" for the fastest
+    installed one. Falls back to the stdlib json module when the requested backend is not installed.
+    """
+    if backend == "auto":
+        return next(iter(_BACKENDS.values()))
+    loads = _BACKENDS.get(backend)
+    if loads is None:
+        if backend not in _warned_missing:
+            _warned_missing.add(backend)
+            logging.warning(f"JSON backend {backend} is not installed, falling back to json")
+        return _json_loads
+    return loads
@@ -1,3 +1,6 @@
+from prometheus_api_client import PrometheusApiClientException
+
+
 class MetricsNotFound(Exception):
     """
     An exception raised when Metrics service is not found.
@@ -36,3 +39,21 @@ class PrometheusFlagsConnectionError(Exception):
     """
 
     pass
+
+
+class PrometheusCircuitOpen(PrometheusApiClientException):
+    """
+    An exception raised instead of sending a request while the circuit breaker of the backend is open.
+    """
+
+    pass
+
+
+class QueryBudgetExceeded(PrometheusApiClientException):
+    """
+    An exception raised when a range query cannot fit the configured sample budget, or the planner is set to reject it.
+    """
+
+    def __init__(self, message: str, plan=None):
+        super().__init__(message)
+        self.plan = plan
@@ -0,0 +1,229 @@
+import time
+from concurrent.futures import (FIRST_COMPLETED, Future, ThreadPoolExecutor,
+                                wait)
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence
+
+from prometrix.connect.custom_connect import CustomPrometheusConnect
+from prometrix.models.prometheus_config import PrometheusConfig
+from prometrix.models.prometheus_query import ClusterQueryResult
+from prometrix.models.prometheus_result import PrometheusQueryResult
+from prometrix.utils import get_custom_prometheus_connect
+
+
+def tag_result_data(data: Dict, labels: Dict[str, str]) -> Dict:
+    """
+    Copy of a query response `data` with `labels` added to every item, as a vector or matrix.
+    Like Prometheus external labels, labels already present on an item are kept. Scalar and string
+    results become a single vector item carrying `labels`.
+    """
+    result_type = data.get("resultType")
+    result = data.get("result")
+    if result_type in ("scalar", "string"):
+        return {"resultType": "vector", "result": [{"metric": dict(labels), "value": result}]}
+    if not labels:
+        return data
+    tagged = []
+    for item in result:
+        metric = item.get("metric", {})
+        missing = {name: value for name, value in labels.items() if name not in metric}
+        tagged.append({**item, "metric": {**metric, **missing}} if missing else item)
+    return {"resultType": result_type, "result": tagged}
+
+
+def merge_cluster_data(clusters: Sequence[ClusterQueryResult], default_type: str) -> Dict:
+    """ Concatenate the tagged results of the clusters that answered into one vector or matrix `data` """
+    result_type = None
+    items: List[Dict] = []
+    for cluster in clusters:
+        if not cluster.ok:
+            continue
+        tagged = tag_result_data(cluster.data, cluster.labels)
+        if result_type is None:
+            result_type = tagged["resultType"]
+        elif tagged["resultType"] != result_type:
+            raise ValueError(
+                f"Cannot merge {tagged['resultType']} results of {cluster.url} with {result_type} results"
+            )
+        items.extend(tagged["result"])
+    return {"resultType": result_type or default_type, "result": items}
+
+
+class FederatedQueryResult:
+    """
+    The merged result of a query sent to several clusters, and the outcome on each of them.
+    `result` holds the series of the clusters that answered, tagged with their additional_labels.
+    When `partial` is True some clusters failed or timed out, see `errors`.
+    """
+
+    def __init__(self, clusters: List[ClusterQueryResult], result: PrometheusQueryResult):
+        self.clusters = clusters
+        self.result = result
+
+    @property
+    def partial(self) -> bool:
+        return any(not cluster.ok for cluster in self.clusters)
+
+    @property
+    def errors(self) -> Dict[str, Exception]:
+        """ The error of every cluster that failed, keyed by url """
+        return {cluster.url: cluster.error for cluster in self.clusters if not cluster.ok}
+
+
+class FederatedPrometheusConnect:
+    """
+    Runs queries against many Prometheus-compatible backends at once, one client per config (AWS, Azure,
+    VictoriaMetrics, Coralogix and plain configs can be mixed), and merges their answers into one result.
+    Each config's `additional_labels` are added to the series it returns, so the clusters can be told apart.
+
+        federated = FederatedPrometheusConnect(configs, cluster_timeout=10)
+        answer = federated.safe_custom_query("sum by (namespace) (up)")
+        answer.result.vector_result, answer.partial, answer.errors
+    """
+
+    def __init__(
+        self,
+        configs: Sequence[PrometheusConfig],
+        max_workers: Optional[int] = None,
+        cluster_timeout: Optional[float] = None,
+    ):
+        """
+        :param max_workers: Clusters queried at once, defaults to all of them.
+        :param cluster_timeout: Seconds each cluster gets to answer before it is reported as timed out
+            and left out of the merged result. None waits for every cluster. It also caps the connect and
+            read timeouts of the clients, so the request of a cluster that timed out ends soon after instead
+            of keeping a worker thread and a pooled connection busy.
+        """
+        self.clients: List[CustomPrometheusConnect] = [
+            get_custom_prometheus_connect(config) for config in configs
+        ]
+        self.max_workers = max_workers
+        self.cluster_timeout = cluster_timeout
+        if cluster_timeout is not None:
+            for client in self.clients:
+                client._timeout = tuple(
+                    cluster_timeout if timeout is None else min(timeout, cluster_timeout)
+                    for timeout in client._timeout
+                )
+
+    def safe_custom_query(
+        self,
+        query: str,
+        params: dict = None,
+        cluster_timeout: Optional[float] = None,
+        **result_kwargs,
+    ) -> FederatedQueryResult:
+        """
+        Run an instant query on every cluster.
+        :param cluster_timeout: Overrides the cluster timeout of this query. The client timeouts stay
+            capped by the one given to the constructor.
+        :param result_kwargs: Passed to PrometheusQueryResult (columnar, lazy, intern_labels).
+        """
+        clusters = self._fan_out(
+            lambda client, params: client.safe_custom_query(query, params=params),
+            params,
+            cluster_timeout,
+        )
+        return FederatedQueryResult(
+            clusters, PrometheusQueryResult(merge_cluster_data(clusters, "vector"), **result_kwargs)
+        )
+
+    def safe_custom_query_range(
+        self,
+        query: str,
+        start_time: datetime,
+        end_time: datetime,
+        step: str,
+        params: dict = None,
+        cluster_timeout: Optional[float] = None,
+        **result_kwargs,
+    ) -> FederatedQueryResult:
+        """
+        Run a range query on every cluster.
+        :param cluster_timeout: Overrides the cluster timeout of this query. The client timeouts stay
+            capped by the one given to the constructor.
+        :param result_kwargs: Passed to PrometheusQueryResult (columnar, lazy, intern_labels).
+        """
+        clusters = self._fan_out(
+            lambda client, params: client.safe_custom_query_range(
+                query, start_time, end_time, step, params=params
+            ),
+            params,
+            cluster_timeout,
+        )
+        return FederatedQueryResult(
+            clusters, PrometheusQueryResult(merge_cluster_data(clusters, "matrix"), **result_kwargs)
+        )
+
+    def _fan_out(
+        self,
+        call: Callable[[CustomPrometheusConnect, Dict], Dict],
+        params: Optional[Dict],
+        cluster_timeout: Optional[float],
+    ) -> List[ClusterQueryResult]:
+        timeout = cluster_timeout if cluster_timeout is not None else self.cluster_timeout
+        params = dict(params or {})
+        if timeout is not None:
+            # Prometheus stops evaluating the query once the cluster has timed out, `timeout` is in seconds
+            params.setdefault("timeout", str(float(timeout)))
+        results: List[Optional[ClusterQueryResult]] = [None] * len(self.clients)
+        started: Dict[int, float] = {}
+
+        def run(index: int) -> ClusterQueryResult:
+            started[index] = time.monotonic()
+            client = self.clients[index]
+            result = self._cluster_result(index)
+            try:
+                result.data = call(client, params)
+            except Exception as e:
+                result.error = e
+            result.duration = time.monotonic() - started[index]
+            return result
+
+        workers = max(1, min(self.max_workers or len(self.clients), len(self.clients)))
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prometrix-federation")
+        try:
+            pending: Dict[Future, int] = {
+                executor.submit(run, index): index for index in range(len(self.clients))
+            }
+            while pending:
+                done, _ = wait(
+                    pending,
+                    timeout=self._next_deadline(pending, started, timeout),
+                    return_when=FIRST_COMPLETED,
+                )
+                for future in done:
+                    results[pending.pop(future)] = future.result()
+                if timeout is None:
+                    continue
+                # Clusters that used up their time are reported now, their requests finish in the background
+                now = time.monotonic()
+                for future, index in list(pending.items()):
+                    if index in started and now - started[index] >= timeout:
+                        del pending[future]
+                        results[index] = self._cluster_result(index)
+                        results[index].error = TimeoutError(
+                            f"{self.clients[index].url} did not answer within {timeout}s"
+                        )
+                        results[index].duration = now - started[index]
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        return results
+
+    @staticmethod
+    def _next_deadline(
+        pending: Dict[Future, int], started: Dict[int, float], timeout: Optional[float]
+    ) -> Optional[float]:
+        """ Seconds until the earliest running cluster times out """
+        if timeout is None:
+            return None
+        deadlines = [started[index] + timeout for index in pending.values() if index in started]
+        if not deadlines:
+            return timeout
+        return max(0.0, min(deadlines) - time.monotonic())
+
+    def _cluster_result(self, index: int) -> ClusterQueryResult:
+        client = self.clients[index]
+        return ClusterQueryResult(
+            index=index, url=client.url, labels=client.config.additional_labels or {}
+        )
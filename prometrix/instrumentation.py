@@ -0,0 +1,371 @@
+import heapq
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import (Any, Callable, Dict, Iterator, List, Optional, Sequence,
+                    Tuple)
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from prometrix.models.prometheus_result import PrometheusQueryResult
+
+# Prometheus client's default buckets, extended for slow range queries
+DEFAULT_LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+
+class RequestEvent:
+    """
+    Timings and outcome of one HTTP request to the backend, passed to the request listeners.
+
+    `phases` holds the seconds spent in each phase the client could observe:
+    connect (DNS resolution and TCP handshake, only when a new connection was opened),
+    tls (TLS handshake), wait (request sent until the response headers arrived, mostly server
+    evaluation), download (response body), decode (JSON parsing) and backoff (sleeping before retries).
+    wait and download are those of the attempt whose response was returned.
+    `duration` covers the whole call, including the time spent in auth and retries.
+    """
+
+    def __init__(self, backend: str, endpoint: str, query: Optional[str] = None):
+        self.backend = backend
+        self.endpoint = endpoint
+        self.query = query
+        self.status_code: Optional[int] = None
+        self.response_bytes = 0
+        self.series: Optional[int] = None
+        self.samples: Optional[int] = None
+        self.retries = 0
+        self.error: Optional[BaseException] = None
+        self.phases: Dict[str, float] = {}
+        self.duration = 0.0
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        # perf_counter() when the attempt whose response is returned was sent, set by the resilience layer
+        self._attempt_start = self._start
+        # (perf_counter() when opened, seconds) of the connect and tls phases
+        self._openings: List[Tuple[float, float]] = []
+
+    def add_phase(self, phase: str, seconds: float) -> None:
+        self.phases[phase] = self.phases.get(phase, 0.0) + max(seconds, 0.0)
+
+    def connection_opened(self, phase: str, seconds: float) -> None:
+        """ Record a connect or tls phase """
+        self.add_phase(phase, seconds)
+        self._openings.append((time.perf_counter(), seconds))
+
+    def attempt_started(self, start: float) -> None:
+        """ Set the perf_counter() at which the attempt that produced the response was sent """
+        self._attempt_start = start
+
+    def response_received(
+        self,
+        status_code: int,
+        response_bytes: int,
+        headers_seconds: Optional[float] = None,
+        retries: int = 0,
+    ) -> None:
+        """
+        Record a response whose body was fully read just now. `headers_seconds` is the time from
+        sending the request to receiving the response headers, when the HTTP library measures it.
+        """
+        self.status_code = status_code
+        self.response_bytes = response_bytes
+        self.retries += retries
+        if headers_seconds is not None:
+            # Earlier attempts, hedged duplicates and backoff sleeps are not part of this response's phases
+            opened = sum(seconds for opened_at, seconds in self._openings if opened_at >= self._attempt_start)
+            self.add_phase("wait", headers_seconds - opened)
+            self.add_phase("download", time.perf_counter() - self._attempt_start - headers_seconds)
+
+    def decode(self, loads: Callable[[bytes], Any], content: bytes) -> Any:
+        """ Decode a JSON response body, timing it and counting the series and samples it holds """
+        start = time.perf_counter()
+        body = loads(content)
+        self.add_phase("decode", time.perf_counter() - start)
+        if isinstance(body, dict):
+            self.series, self.samples = count_series_and_samples(body.get("data"))
+        return body
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "endpoint": self.endpoint,
+            "query": self.query,
+            "status_code": self.status_code,
+            "response_bytes": self.response_bytes,
+            "series": self.series,
+            "samples": self.samples,
+            "retries": self.retries,
+            "error": repr(self.error) if self.error is not None else None,
+            "phases": {phase: round(seconds, 6) for phase, seconds in self.phases.items()},
+            "duration": round(self.duration, 6),
+            "started_at": self.started_at,
+        }
+
+
+RequestListener = Callable[[RequestEvent], None]
+
+_active_event: ContextVar[Optional[RequestEvent]] = ContextVar(
+    "prometrix_active_request_event", default=None
+)
+
+
+def current_request_event() -> Optional[RequestEvent]:
+    return _active_event.get()
+
+
+def count_series_and_samples(data: Any) -> Tuple[Optional[int], Optional[int]]:
+    """ Series and sample counts of a query, query_range or series response `data` """
+    if isinstance(data, list):
+        # The series API returns label sets, the label values API returns strings
+        if data and not isinstance(data[0], dict):
+            return None, None
+        return len(data), None
+    if not isinstance(data, dict) or "result" not in data:
+        return None, None
+    result = data["result"]
+    if data.get("resultType") == "matrix":
+        samples = sum(len(item.get("values", ())) + len(item.get("histograms", ())) for item in result)
+        return len(result), samples
+    if data.get("resultType") == "vector":
+        return len(result), len(result)
+    return 1, 1
+
+
+@contextmanager
+def track_request(
+    listeners: Sequence[RequestListener], backend: str, endpoint: str, query: Optional[str] = None
+) -> Iterator[RequestEvent]:
+    """
+    Track one request: the yielded event is filled in by the caller and by the HTTP layer,
+    then passed to every listener once the block exits. Listener errors are logged and ignored.
+    """
+    event = RequestEvent(backend, endpoint, query)
+    token = _active_event.set(event)
+    try:
+        yield event
+    except BaseException as e:
+        event.error = e
+        raise
+    finally:
+        event.duration = time.perf_counter() - event._start
+        try:
+            _active_event.reset(token)
+        except ValueError:
+            # A generator closed from another context, e.g. a streamed response garbage collected elsewhere
+            pass
+        for listener in listeners:
+            try:
+                listener(event)
+            except Exception:
+                logging.exception("Prometheus request listener failed")
+
+
+class _TimedConnectionMixin:
+    def _new_conn(self):
+        start = time.perf_counter()
+        try:
+            return super()._new_conn()
+        finally:
+            self._connect_seconds = time.perf_counter() - start
+            event = _active_event.get()
+            if event is not None:
+                event.connection_opened("connect", self._connect_seconds)
+
+
+class _TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    def connect(self) -> None:
+        self._connect_seconds = 0.0
+        start = time.perf_counter()
+        super().connect()
+        event = _active_event.get()
+        if event is not None:
+            event.connection_opened("tls", time.perf_counter() - start - self._connect_seconds)
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """ HTTPAdapter whose new connections report their connect and TLS handshake time to the tracked request """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+
+def httpx_trace(event: RequestEvent) -> Callable:
+    """ An httpx `trace` extension recording the connect, tls, wait and download phases into the event """
+    started: Dict[str, float] = {}
+    phases = {
+        "connection.connect_tcp": "connect",
+        "connection.start_tls": "tls",
+        "receive_response_headers": "wait",
+        "receive_response_body": "download",
+    }
+
+    async def trace(name: str, info: Dict) -> None:
+        step, _, state = name.rpartition(".")
+        phase = phases.get(step) or phases.get(step.partition(".")[2])
+        if phase is None:
+            return
+        if state == "started":
+            started[phase] = time.perf_counter()
+        elif phase in started:
+            event.add_phase(phase, time.perf_counter() - started.pop(phase))
+
+    return trace
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """ Cumulative bucket counts keyed by their upper bound, as in the Prometheus exposition format """
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip([*map(str, self.buckets), "+Inf"], self.counts):
+            cumulative += count
+            buckets[bound] = cumulative
+        return {"buckets": buckets, "sum": self.sum, "count": self.count}
+
+
+class MetricsCollector:
+    """
+    A request listener aggregating events into latency histograms per backend and endpoint (overall and
+    per phase), request, byte, series, sample and retry counters, and a log of the slowest requests.
+
+        collector = MetricsCollector(slow_query_seconds=2)
+        prom.add_request_listener(collector)
+        ...
+        collector.snapshot()
+    """
+
+    def __init__(
+        self,
+        slow_query_seconds: float = 5.0,
+        slow_query_log_size: int = 100,
+        buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS,
+    ):
+        self.slow_query_seconds = slow_query_seconds
+        self.buckets = buckets
+        self.slow_query_log_size = slow_query_log_size
+        # Min-heap of (duration, sequence number, event dict), the fastest of the kept requests on top
+        self._slow_queries: List[Tuple[float, int, Dict[str, Any]]] = []
+        self._slow_query_sequence = 0
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._latency: Dict[Tuple[str, str], Histogram] = {}
+            self._phases: Dict[Tuple[str, str, str], Histogram] = {}
+            self._result_format = Histogram(self.buckets)
+            self._requests: Dict[Tuple[str, str, str], int] = defaultdict(int)
+            self._counters: Dict[Tuple[str, str], Dict[str, int]] = defaultdict(
+                lambda: {"response_bytes": 0, "series": 0, "samples": 0, "retries": 0}
+            )
+            self._slow_queries.clear()
+
+    def __call__(self, event: RequestEvent) -> None:
+        key = (event.backend, event.endpoint)
+        if event.error is not None and event.status_code is None:
+            status = "error"
+        else:
+            status = str(event.status_code)
+        slow = event.duration >= self.slow_query_seconds
+        with self._lock:
+            self._histogram(self._latency, key).observe(event.duration)
+            for phase, seconds in event.phases.items():
+                self._histogram(self._phases, (*key, phase)).observe(seconds)
+            self._requests[(*key, status)] += 1
+            counters = self._counters[key]
+            counters["response_bytes"] += event.response_bytes
+            counters["series"] += event.series or 0
+            counters["samples"] += event.samples or 0
+            counters["retries"] += event.retries
+            if slow:
+                self._slow_query_sequence += 1
+                entry = (event.duration, self._slow_query_sequence, event.to_dict())
+                if len(self._slow_queries) < self.slow_query_log_size:
+                    heapq.heappush(self._slow_queries, entry)
+                elif self._slow_queries and entry > self._slow_queries[0]:
+                    heapq.heapreplace(self._slow_queries, entry)
+        if slow:
+            logging.warning(
+                f"Slow Prometheus {event.endpoint} request to {event.backend} took {event.duration:.2f}s: "
+                f"{event.query}"
+            )
+
+    def _histogram(self, histograms: Dict, key: Tuple) -> Histogram:
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = Histogram(self.buckets)
+        return histogram
+
+    def time_query_result(self, data: Dict, **kwargs) -> PrometheusQueryResult:
+        """ Build a PrometheusQueryResult from a response `data`, recording the time it took """
+        start = time.perf_counter()
+        result = PrometheusQueryResult(data, **kwargs)
+        with self._lock:
+            self._result_format.observe(time.perf_counter() - start)
+        return result
+
+    def slow_queries(self) -> List[Dict[str, Any]]:
+        """ The `slow_query_log_size` slowest requests over `slow_query_seconds`, slowest first """
+        with self._lock:
+            return self._sorted_slow_queries()
+
+    def _sorted_slow_queries(self) -> List[Dict[str, Any]]:
+        return [entry for _, _, entry in sorted(self._slow_queries, key=lambda item: item[:2], reverse=True)]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": [
+                    {"backend": backend, "endpoint": endpoint, "status": status, "count": count}
+                    for (backend, endpoint, status), count in self._requests.items()
+                ],
+                "latency_seconds": [
+                    {"backend": backend, "endpoint": endpoint, **histogram.snapshot()}
+                    for (backend, endpoint), histogram in self._latency.items()
+                ],
+                "phase_seconds": [
+                    {"backend": backend, "endpoint": endpoint, "phase": phase, **histogram.snapshot()}
+                    for (backend, endpoint, phase), histogram in self._phases.items()
+                ],
+                "totals": [
+                    {"backend": backend, "endpoint": endpoint, **counters}
+                    for (backend, endpoint), counters in self._counters.items()
+                ],
+                "result_format_seconds": self._result_format.snapshot(),
+                "slow_queries": self._sorted_slow_queries(),
+            }
@@ -0,0 +1,71 @@
+import sys
+import threading
+from typing import Iterable, Mapping, Optional, Tuple
+from weakref import ReferenceType, WeakKeyDictionary, ref
+
+
+class LabelSet(dict):
+    """
+    An immutable, hashable set of labels. Being a dict, it can be used anywhere a metric's labels dict is,
+    and serializes the same way. Get instances through intern_labels so identical label sets share storage.
+    """
+
+    __slots__ = ("_hash", "__weakref__")
+
+    def __init__(self, labels: Iterable[Tuple[str, str]] = ()):
+        super().__init__(labels)
+        self._hash = hash(frozenset(self.items()))
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __reduce__(self):
+        return LabelSet, (list(self.items()),)
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("LabelSet is immutable")
+
+    __setitem__ = __delitem__ = __ior__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+
+    def project(
+        self, on: Optional[Iterable[str]] = None, ignoring: Optional[Iterable[str]] = None
+    ) -> "LabelSet":
+        """ The interned label set keeping only the `on` labels, or all labels but the `ignoring` ones """
+        if on is not None:
+            names = set(on)
+            return intern_labels({name: value for name, value in self.items() if name in names})
+        ignored = set(ignoring or ())
+        return intern_labels({name: value for name, value in self.items() if name not in ignored})
+
+
+# Maps each interned label set to a weak reference to itself, entries live as long as some result
+# still references the label set
+_label_sets: "WeakKeyDictionary[LabelSet, ReferenceType]" = WeakKeyDictionary()
+_label_sets_lock = threading.Lock()
+
+
+def intern_labels(labels: Mapping[str, str]) -> LabelSet:
+    """
+    Return the shared LabelSet equal to `labels`, creating it on first use.
+    Label names and values are interned too, so they are stored once across all label sets.
+    """
+    if isinstance(labels, LabelSet):
+        candidate = labels
+    else:
+        candidate = LabelSet((sys.intern(name), sys.intern(value)) for name, value in labels.items())
+    reference = _label_sets.get(candidate)
+    label_set = reference() if reference is not None else None
+    if label_set is None:
+        with _label_sets_lock:
+            reference = _label_sets.get(candidate)
+            label_set = reference() if reference is not None else None
+            if label_set is None:
+                label_set = candidate
+                _label_sets[label_set] = ref(label_set)
+    return label_set
+
+
+def interned_label_sets_count() -> int:
+    """ Number of distinct label sets currently interned """
+    return len(_label_sets)
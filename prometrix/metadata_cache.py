@@ -0,0 +1,191 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from prometrix.promql import LabelMatcher, parse_series_selector
+
+Selector = Tuple[LabelMatcher, ...]
+
+
+def _params_key(params: Optional[Dict]) -> Tuple:
+    params = params or {}
+    return tuple(sorted((k, str(v)) for k, v in params.items()))
+
+
+class _Entry:
+    def __init__(self, value: Any, expires_at: float):
+        self.value = value
+        self.expires_at = expires_at
+
+
+class _SeriesEntry(_Entry):
+    def __init__(
+        self,
+        value: List[Dict],
+        expires_at: float,
+        selectors: Optional[List[Selector]],
+        start: float,
+        end: float,
+    ):
+        super().__init__(value, expires_at)
+        # None when a match[] selector could not be parsed, such entries are only served as exact hits
+        self.selectors = selectors
+        self.start = start
+        self.end = end
+
+    def covers(self, selectors: List[Selector], start: float, end: float) -> bool:
+        """
+        True if every requested selector is at least as narrow as one of the cached selectors (it has all
+        of its matchers) and the time range is the cached one. A lookup over a narrower range cannot be
+        served, the cached series may have no samples in it.
+        """
+        if self.selectors is None or start != self.start or end != self.end:
+            return False
+        return all(
+            any(set(cached) <= set(requested) for cached in self.selectors)
+            for requested in selectors
+        )
+
+
+class MetadataCache:
+    """
+    TTL cache of label values, metric names and series lookups.
+
+    Entries expire `ttl_seconds` after they were fetched, and are evicted least recently used first
+    beyond `max_entries`. A series lookup can also be served from a cached lookup over the same time range
+    made with wider selectors, by filtering the cached series with the requested matchers.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int = 1024):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def invalidate_label_values(self, label_name: Optional[str] = None) -> None:
+        """ Drop the cached values of a label, or of every label when `label_name` is None """
+        self._invalidate(
+            lambda key: key[0] == "label_values" and (label_name is None or key[1] == label_name)
+        )
+
+    def invalidate_series(self) -> None:
+        self._invalidate(lambda key: key[0] == "series")
+
+    def _invalidate(self, predicate: Callable[[Tuple], bool]) -> None:
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+    def get_label_values(
+        self, label_name: str, params: Optional[Dict], fetch: Callable[[], List[str]]
+    ) -> List[str]:
+        key = ("label_values", label_name, _params_key(params))
+        with self._lock:
+            entry = self._get_entry(key)
+            self._record(entry is not None)
+        if entry is not None:
+            return list(entry.value)
+
+        values = fetch()
+        with self._lock:
+            self._put_entry(key, _Entry(values, time.monotonic() + self.ttl_seconds))
+        return list(values)
+
+    def get_series(
+        self,
+        match: List[str],
+        start: Optional[float],
+        end: Optional[float],
+        params: Optional[Dict],
+        fetch: Callable[[], List[Dict]],
+    ) -> List[Dict]:
+        params_key = _params_key(params)
+        key = ("series", tuple(match), start, end, params_key)
+        start = -math.inf if start is None else start
+        end = math.inf if end is None else end
+        try:
+            selectors: Optional[List[Selector]] = [parse_series_selector(s) for s in match]
+        except ValueError:
+            selectors = None
+
+        # A limited answer may be truncated, so it can neither serve nor be served by other lookups
+        reusable = selectors is not None and "limit" not in (params or {})
+        with self._lock:
+            entry = self._get_entry(key)
+            wider = None
+            if entry is None and reusable:
+                wider = self._find_covering_series(selectors, start, end, params_key)
+            self._record(entry is not None or wider is not None)
+        if entry is not None:
+            return list(entry.value)
+        if wider is not None:
+            return [
+                series for series in wider.value
+                if any(all(matcher.matches(series) for matcher in selector) for selector in selectors)
+            ]
+
+        series = fetch()
+        with self._lock:
+            self._put_entry(
+                key,
+                _SeriesEntry(
+                    series,
+                    time.monotonic() + self.ttl_seconds,
+                    selectors if reusable else None,
+                    start,
+                    end,
+                ),
+            )
+        return list(series)
+
+    def _find_covering_series(
+        self, selectors: List[Selector], start: float, end: float, params_key: Tuple
+    ) -> Optional[_SeriesEntry]:
+        now = time.monotonic()
+        for key, entry in reversed(self._entries.items()):
+            if key[0] != "series" or key[4] != params_key or entry.expires_at <= now:
+                continue
+            if isinstance(entry, _SeriesEntry) and entry.covers(selectors, start, end):
+                self._entries.move_to_end(key)
+                return entry
+        return None
+
+    def _get_entry(self, key: Hashable) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at <= time.monotonic():
+            del self._entries[key]
+            entry = None
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def _record(self, hit: bool) -> None:
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def _put_entry(self, key: Hashable, entry: _Entry) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
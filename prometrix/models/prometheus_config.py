@@ -17,6 +17,47 @@ class PrometheusApis(Enum):
     VM_FLAGS = 4
 
 
+class OverBudgetAction(str, Enum):
+    """ What the query planner does with a range query over the sample budget """
+
+    WIDEN_STEP = "widen_step"
+    SHARD = "shard"
+    REJECT = "reject"
+
+
+class ResiliencePolicy(BaseModel):
+    # Seconds to wait for a connection and between bytes of the response, None waits forever
+    connect_timeout: Optional[float] = None
+    read_timeout: Optional[float] = None
+    # Retries of query, query_range, series and label values requests failing with a timeout,
+    # a connection error or one of retry_status_codes
+    max_retries: int = 0
+    # Retries wait a random time up to backoff_base * 2^retry seconds, and at most backoff_max
+    backoff_base: float = 0.5
+    backoff_max: float = 30.0
+    retry_status_codes: List[int] = [429, 502, 503, 504]
+    # Wait at least as long as the server's Retry-After header asks, up to backoff_max
+    respect_retry_after: bool = True
+    # Send a duplicate request when the first has been pending longer than this percentile of the
+    # endpoint's recent latencies, and keep the first answer. None disables hedging
+    hedge_percentile: Optional[float] = None
+    hedge_min_samples: int = 20
+    hedge_min_delay: float = 0.05
+    # Adapt the number of requests in flight to the backend (AIMD): grow it while responses are healthy,
+    # shrink it by concurrency_decrease_factor on throttling, overload, timeouts, or when the recent latency
+    # exceeds latency_tolerance times the usual one. max_concurrency defaults to the connection pool size
+    adaptive_concurrency: bool = False
+    min_concurrency: int = 1
+    max_concurrency: Optional[int] = None
+    initial_concurrency: Optional[int] = None
+    concurrency_decrease_factor: float = 0.5
+    latency_tolerance: Optional[float] = 2.0
+    # Fail fast with PrometheusCircuitOpen after this many consecutive timeouts, connection errors or
+    # 5xx responses, trying again after circuit_reset_timeout seconds. None disables the circuit breaker
+    circuit_failure_threshold: Optional[int] = None
+    circuit_reset_timeout: float = 30.0
+
+
 class PrometheusConfig(BaseModel):
     url: str
     disable_ssl: bool = False
@@ -24,6 +65,8 @@ class PrometheusConfig(BaseModel):
     prometheus_auth: Optional[SecretStr] = None
     prometheus_url_query_string: Optional[str] = None
     additional_labels: Optional[Dict[str, str]] = None
+    # Add additional_labels as matchers to every selector of the queries and series lookups sent
+    inject_additional_labels: bool = False
     supported_apis: List[PrometheusApis] = [
         PrometheusApis.QUERY,
         PrometheusApis.QUERY_RANGE,
@@ -32,6 +75,42 @@ class PrometheusConfig(BaseModel):
     ]
     query_step: str = "5m"
     query_interval: str = "1d"
+    # Max points per series for each query_range shard, None disables sharding
+    query_range_shard_points: Optional[int] = None
+    query_range_shard_workers: int = 4
+    async_max_connections: int = 100
+    # Connections kept in the session pool, and max queries in flight for the batch APIs
+    pool_maxsize: int = 10
+    batch_max_workers: int = 10
+    # Max estimated size of the in-process query_range cache, None disables it
+    range_cache_max_bytes: Optional[int] = None
+    # Samples newer than this are always re-fetched, as recent data may still change
+    range_cache_mutable_window: str = "10m"
+    # Keep the range cache in this SQLite file instead of memory, so later runs re-use the fetched history.
+    # range_cache_max_bytes then caps its compressed size on disk, 1 GiB when not set
+    range_cache_path: Optional[str] = None
+    # Persistent cache entries not used for this long (e.g. "7d") are evicted, None keeps them
+    range_cache_max_age: Optional[str] = None
+    # Path of the remote read endpoint used by stream_remote_read
+    remote_read_path: str = "/api/v1/read"
+    # Concurrent identical query/query_range calls share a single request and parsed result
+    single_flight: bool = False
+    # Accept-Encoding sent to the server, defaults to every encoding the client can decode (gzip, deflate,
+    # and zstd / br when their packages are installed)
+    accept_encoding: Optional[str] = None
+    # JSON decoder for responses: "auto" (fastest installed), "orjson", "msgspec" or "json"
+    json_backend: str = "auto"
+    # How long label values, metric names and series lookups are cached (e.g. "5m"), None disables it
+    metadata_cache_ttl: Optional[str] = None
+    metadata_cache_max_entries: int = 1024
+    # Max samples (series x points) one query_range request may return, checked by plan_query_range,
+    # None only enforces max_points_per_series
+    query_sample_budget: Optional[int] = None
+    # Prometheus rejects range queries of more than 11,000 points per series
+    max_points_per_series: int = 11000
+    over_budget_action: OverBudgetAction = OverBudgetAction.WIDEN_STEP
+    # Timeouts, retries and hedging of the requests sent to the backend
+    resilience: ResiliencePolicy = ResiliencePolicy()
 
 
 class AWSPrometheusConfig(PrometheusConfig):
@@ -41,6 +120,7 @@ class AWSPrometheusConfig(PrometheusConfig):
     service_name: str = "aps"
     aws_region: str
     assume_role_arn: Optional[str] = None
+    remote_read_path: str = "/api/v1/remote_read"
     supported_apis: List[PrometheusApis] = [
         PrometheusApis.QUERY,
         PrometheusApis.QUERY_RANGE,
@@ -76,6 +156,8 @@ class AzurePrometheusConfig(PrometheusConfig):
     azure_client_id: Optional[str] = None
     azure_tenant_id: Optional[str] = None
     azure_client_secret: Optional[str] = None
+    # Tokens are refreshed in the background by the first request this many seconds before they expire
+    azure_token_refresh_margin: int = 300
     supported_apis: List[PrometheusApis] = [
         PrometheusApis.QUERY,
         PrometheusApis.QUERY_RANGE,
@@ -0,0 +1,88 @@
+from datetime import datetime
+from typing import Any, Dict, Optional, Union
+
+try:
+    # Works if Pydantic v2 is installed
+    from pydantic.v1 import BaseModel
+except ImportError:
+    # Fallback if running under Pydantic v1
+    from pydantic import BaseModel
+
+
+class InstantQuery(BaseModel):
+    query: str
+    params: Dict[str, Any] = {}
+
+
+class RangeQuery(BaseModel):
+    query: str
+    start_time: datetime
+    end_time: datetime
+    step: str
+    params: Dict[str, Any] = {}
+
+
+QuerySpec = Union[InstantQuery, RangeQuery]
+
+
+class QueryBatchResult(BaseModel):
+    """
+    The outcome of one query of a batch: the response `data` on success, or the raised exception.
+    `index` is the position of the query in the submitted batch.
+    """
+
+    index: int
+    query: str
+    data: Optional[Dict[str, Any]] = None
+    error: Optional[Exception] = None
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class ClusterQueryResult(BaseModel):
+    """
+    The outcome of a federated query on one cluster: the response `data` on success, or the raised exception
+    (a TimeoutError when the cluster did not answer within the cluster timeout).
+    `index` is the position of the cluster's config, `labels` its additional_labels.
+    """
+
+    index: int
+    url: str
+    labels: Dict[str, str] = {}
+    data: Optional[Dict[str, Any]] = None
+    error: Optional[Exception] = None
+    duration: Optional[float] = None
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class QueryPlan(BaseModel):
+    """
+    How plan_query_range decided to run a range query. `action` is "run" when the query fits the budget
+    as requested, otherwise the config's over_budget_action: "widen_step" (run once with `step`),
+    "shard" (run as `shards` requests of at most `shard_points` points per series) or "reject".
+    `series` is the estimated series count, None when no sample budget is configured.
+    """
+
+    query: str
+    start: float
+    end: float
+    requested_step: str
+    step: str
+    points_per_series: int
+    series: Optional[int] = None
+    estimated_samples: Optional[int] = None
+    action: str
+    shards: int = 1
+    shard_points: Optional[int] = None
+    reason: str
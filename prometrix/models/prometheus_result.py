@@ -1,9 +1,41 @@
 import json
-from typing import Dict, List, Optional
+from array import array
+from functools import lru_cache
+from typing import (Dict, Iterable, Iterator, List, Optional, Sequence, Tuple,
+                    Union)
 
+from prometrix.labels import LabelSet, intern_labels
+from prometrix.promql import LabelMatcher, to_label_matchers
+
+# The labels of a series. LabelSet, the interned form, is a dict too
 PrometheusMetric = Dict[str, str]
 
 
+def _labels(metric: PrometheusMetric, interned: bool) -> PrometheusMetric:
+    return intern_labels(metric) if interned else metric
+
+
+@lru_cache(maxsize=None)
+def load_numpy():
+    """ The numpy module when installed, None otherwise. Imported on first use, as it is slow to import """
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def to_float64_buffer(values: Iterable, count: int = -1) -> Sequence[float]:
+    """
+    Pack values into a contiguous float64 buffer: a NumPy array when NumPy is installed, array('d') otherwise.
+    Prometheus sample strings, including "NaN", "+Inf" and "-Inf", are parsed with float().
+    """
+    np = load_numpy()
+    if np is not None:
+        return np.fromiter((float(value) for value in values), dtype=np.float64, count=count)
+    return array("d", (float(value) for value in values))
+
+
 class PrometheusScalarValue:
     def __init__(self, raw_scalar_list: List):
         """
@@ -23,13 +55,14 @@ class PrometheusScalarValue:
         }
 
 class PrometheusSeries:
-    def __init__(self, metric: Dict[str, str], values: List):
+    def __init__(self, metric: Dict[str, str], values: List, intern_labels: bool = False):
         """
         Initialize a Prometheus series object.
         :param metric: Dictionary of metric labels.
         :param values: List of [timestamp, value] pairs.
+        :param intern_labels: Store the labels as their shared LabelSet (see prometrix.labels.intern_labels).
         """
-        self.metric = metric
+        self.metric = _labels(metric, intern_labels)
         self.timestamps = [float(value[0]) for value in values]
         self.values = [str(value[1]) for value in values]
 
@@ -42,8 +75,41 @@ class PrometheusSeries:
         }
 
 
+class PrometheusColumnarSeries:
+    def __init__(self, metric: Dict[str, str], values: List, intern_labels: bool = False):
+        """
+        Initialize a Prometheus series backed by contiguous float64 buffers.
+        :param metric: Dictionary of metric labels.
+        :param values: List of [timestamp, value] pairs.
+        :param intern_labels: Store the labels as their shared LabelSet (see prometrix.labels.intern_labels).
+        """
+        self.metric = _labels(metric, intern_labels)
+        self.timestamps = to_float64_buffer((value[0] for value in values), len(values))
+        self.values = to_float64_buffer((value[1] for value in values), len(values))
+
+    def to_dict(self):
+        """ Convert series object to a dictionary, keeping the float64 buffers """
+        return {
+            "metric": self.metric,
+            "timestamps": self.timestamps,
+            "values": self.values
+        }
+
+
 class PrometheusQueryResult:
-    def __init__(self, data: Dict):
+    def __init__(
+        self, data: Dict, columnar: bool = False, lazy: bool = False, intern_labels: bool = False
+    ):
+        """
+        :param data: The `data` dictionary of a Prometheus query response.
+        :param columnar: Store matrix samples as float64 buffers (see PrometheusColumnarSeries)
+            instead of Python lists of float timestamps and string values.
+        :param lazy: Keep the raw vector / matrix items and format them only when accessed.
+            `len()`, `labels()`, `filter()` and indexing then never touch the samples of the other items,
+            and `vector_result` / `series_list_result` are built on first access.
+        :param intern_labels: Replace each item's `metric` with the shared LabelSet of its labels, so results
+            of different queries share label storage and can be joined by label set (see join_results).
+        """
         result = data.get("result", None)
         result_type = data.get("resultType", None)
 
@@ -53,8 +119,13 @@ class PrometheusQueryResult:
             raise ValueError("result object missing")
 
         self.result_type = result_type
-        self.vector_result = None
-        self.series_list_result = None
+        self.columnar = columnar
+        self.lazy = lazy
+        self.intern_labels = intern_labels
+        # The raw items, only kept until they are formatted
+        self._items: Optional[List[Dict]] = None
+        self._vector_result = None
+        self._series_list_result = None
         self.scalar_result = None
         self.string_result = None
 
@@ -63,28 +134,145 @@ class PrometheusQueryResult:
         elif result_type == "scalar" and isinstance(result, list):
             self.scalar_result: Dict[str, any] = PrometheusScalarValue(result).to_dict()
         elif result_type == "vector" and isinstance(result, list):
-            self.vector_result: List[Dict[str, any]] = self._format_vector(result)
+            if lazy:
+                self._items = result
+            else:
+                self._vector_result = self._format_vector(result)
         elif result_type == "matrix" and isinstance(result, list):
-            self.series_list_result: List[Dict[str, any]] = self._format_series(result)
+            if lazy:
+                self._items = result
+            else:
+                self._series_list_result = self._format_series(result)
         else:
             raise ValueError("result or returnType is invalid")
 
+    @property
+    def vector_result(self) -> Optional[List[Dict[str, any]]]:
+        if self._vector_result is None and self.result_type == "vector" and self._items is not None:
+            self._vector_result = self._format_vector(self._items)
+            self._items = None
+        return self._vector_result
+
+    @vector_result.setter
+    def vector_result(self, value: Optional[List[Dict[str, any]]]):
+        self._vector_result = value
+
+    @property
+    def series_list_result(self) -> Optional[List[Dict[str, any]]]:
+        if self._series_list_result is None and self.result_type == "matrix" and self._items is not None:
+            self._series_list_result = self._format_series(self._items)
+            self._items = None
+        return self._series_list_result
+
+    @series_list_result.setter
+    def series_list_result(self, value: Optional[List[Dict[str, any]]]):
+        self._series_list_result = value
+
+    def _metric(self, item: Dict) -> PrometheusMetric:
+        return _labels(item["metric"], self.intern_labels)
+
+    def _format_vector_item(self, vector_item: Dict) -> Dict[str, any]:
+        return {
+            "metric": self._metric(vector_item),
+            "value": PrometheusScalarValue(vector_item["value"]).to_dict()
+        }
+
+    def _format_series_item(self, series_item: Dict) -> Dict[str, any]:
+        series_class = PrometheusColumnarSeries if self.columnar else PrometheusSeries
+        return series_class(series_item["metric"], series_item["values"], self.intern_labels).to_dict()
+
     def _format_vector(self, vector: List) -> List[Dict[str, any]]:
         """ Convert vector result into a list of dictionaries for JSON """
-        return [
-            {
-                "metric": vector_item["metric"],
-                "value": PrometheusScalarValue(vector_item["value"]).to_dict()
-            }
-            for vector_item in vector
-        ]
+        return [self._format_vector_item(vector_item) for vector_item in vector]
 
     def _format_series(self, series: List) -> List[Dict[str, any]]:
         """ Convert matrix (series) result into a list of PrometheusSeries dictionaries for JSON """
-        return [
-            PrometheusSeries(series_item["metric"], series_item["values"]).to_dict()
-            for series_item in series
+        return [self._format_series_item(series_item) for series_item in series]
+
+    def _formatted_items(self) -> Optional[List[Dict]]:
+        return self._vector_result if self.result_type == "vector" else self._series_list_result
+
+    def _current_items(self) -> List[Dict]:
+        """ The raw items while they are not formatted, the formatted ones after """
+        items = self._items if self._items is not None else self._formatted_items()
+        if items is None:
+            raise TypeError(f"{self.result_type} results have no series")
+        return items
+
+    def labelled_items(self) -> List[Tuple[PrometheusMetric, Dict]]:
+        """
+        The labels and item of each vector item or series, without formatting their samples: the raw
+        Prometheus items while they are not formatted, the formatted ones after. For converters reading
+        the samples of all items at once.
+        """
+        return [(self._metric(item), item) for item in self._current_items()]
+
+    def labels(self) -> Iterator[PrometheusMetric]:
+        """ Iterate over the label sets of the vector items or series, without formatting their samples """
+        return (self._metric(item) for item in self._current_items())
+
+    def filter(
+        self, matchers: Union[str, Dict[str, str], Iterable[LabelMatcher]]
+    ) -> "PrometheusQueryResult":
+        """
+        A new result holding only the items whose labels match, e.g. `'{namespace="default", pod=~"api-.*"}'`,
+        a dict of label values, or LabelMatcher instances. Samples of the other items are never formatted.
+        """
+        matchers = to_label_matchers(matchers)
+        items = [
+            item for item in self._current_items()
+            if all(matcher.matches(item["metric"]) for matcher in matchers)
         ]
+        filtered = PrometheusQueryResult(
+            {"resultType": self.result_type, "result": items if self._items is not None else []},
+            columnar=self.columnar,
+            lazy=self.lazy,
+            intern_labels=self.intern_labels,
+        )
+        if self._items is None:
+            # Already formatted, share the formatted items
+            if self.result_type == "vector":
+                filtered.vector_result = items
+            else:
+                filtered.series_list_result = items
+        return filtered
+
+    def index_by_labels(
+        self, on: Optional[Iterable[str]] = None, ignoring: Optional[Iterable[str]] = None
+    ) -> Dict[LabelSet, Dict[str, any]]:
+        """
+        Map the interned label set of each formatted item to the item. `on` / `ignoring` restrict the labels
+        used as key, as in PromQL vector matching. Raises ValueError if two items end up with the same key.
+        """
+        index: Dict[LabelSet, Dict[str, any]] = {}
+        for position in range(len(self)):
+            item = self[position]
+            key = intern_labels(item["metric"])
+            if on is not None or ignoring is not None:
+                key = key.project(on=on, ignoring=ignoring)
+            if key in index:
+                raise ValueError(f"Several items share the labels {dict(key)}")
+            index[key] = item
+        return index
+
+    def __len__(self) -> int:
+        """ Number of vector items or series """
+        return len(self._current_items())
+
+    def __bool__(self) -> bool:
+        # Results were always truthy before __len__ existed, keep it so for empty results
+        return True
+
+    def __getitem__(self, index: Union[int, slice]):
+        """ The formatted vector item or series at `index`, formatting only that one in lazy mode """
+        formatted = self._formatted_items()
+        if formatted is not None:
+            return formatted[index]
+        format_item = self._format_vector_item if self.result_type == "vector" else self._format_series_item
+        items = self._current_items()
+        if isinstance(index, slice):
+            return [format_item(item) for item in items[index]]
+        return format_item(items[index])
 
     def __iter__(self):
         """ Allows the object to be converted directly to a dictionary using dict() """
@@ -96,4 +284,27 @@ class PrometheusQueryResult:
 
     def __repr__(self):
         """ Provides a string representation of the object as a dictionary """
-        return str(dict(self))
\ No newline at end of file
+        return str(dict(self))
+
+
+def join_results(
+    *results: PrometheusQueryResult,
+    on: Optional[Iterable[str]] = None,
+    ignoring: Optional[Iterable[str]] = ("__name__",),
+) -> Dict[LabelSet, List[Dict[str, any]]]:
+    """
+    Join the items of several results on their labels, e.g. the CPU and memory series of each container.
+    Returns the matching items of every result, in order, for each label set present in all of them.
+    By default labels are compared ignoring the metric name; pass `on` to match on given labels only.
+    """
+    if not results:
+        return {}
+    if on is not None:
+        ignoring = None
+    indexes = [result.index_by_labels(on=on, ignoring=ignoring) for result in results]
+    smallest = min(indexes, key=len)
+    return {
+        key: [index[key] for index in indexes]
+        for key in smallest
+        if all(key in index for index in indexes)
+    }
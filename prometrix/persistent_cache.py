@@ -0,0 +1,136 @@
+import json
+import os
+import sqlite3
+import time
+import zlib
+from typing import Dict, Hashable, Optional
+
+from prometrix.range_cache import CachedExtent, RangeQueryCache, _series_key
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS extents (
+    key TEXT PRIMARY KEY,
+    start REAL NOT NULL,
+    end REAL NOT NULL,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS extents_used_at ON extents (used_at);
+"""
+
+# Size cap on disk when the config only sets range_cache_path
+DEFAULT_PERSISTENT_CACHE_MAX_BYTES = 1 << 30
+
+
+class PersistentRangeQueryCache(RangeQueryCache):
+    """
+    RangeQueryCache kept in a SQLite file, so short-lived processes re-use the history fetched by earlier
+    runs and only download the recent tail. Extents are stored as compressed JSON, `max_bytes` caps their
+    total compressed size on disk. Entries are evicted least recently used first once over the cap, and
+    when they were not used for `max_age_seconds`.
+    Several processes may share the file, SQLite serializes their writes.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = DEFAULT_PERSISTENT_CACHE_MAX_BYTES,
+        mutable_window_seconds: float = 600,
+        max_age_seconds: Optional[float] = None,
+    ):
+        super().__init__(max_bytes=max_bytes, mutable_window_seconds=mutable_window_seconds)
+        self.path = os.path.expanduser(path)
+        self.max_age_seconds = max_age_seconds
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Access is serialized by self._lock, so the connection can be shared by the client's threads
+        self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        # Apply the current limits to the entries left by earlier runs
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            self._evict(time.time())
+            self._db.execute("COMMIT")
+
+    @staticmethod
+    def _db_key(key: Hashable) -> str:
+        return json.dumps(key, separators=(",", ":"))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM extents").fetchone()
+            return {
+                "hits": self.hits,
+                "partial_hits": self.partial_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": entries,
+                "bytes": size,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM extents")
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def _get_entry(self, key: Hashable) -> Optional[CachedExtent]:
+        now = time.time()
+        db_key = self._db_key(key)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT start, end, data, used_at FROM extents WHERE key = ?", (db_key,)
+            ).fetchone()
+            if row is None:
+                return None
+            start, end, data, used_at = row
+            if self.max_age_seconds is not None and now - used_at > self.max_age_seconds:
+                self._db.execute("DELETE FROM extents WHERE key = ?", (db_key,))
+                self.evictions += 1
+                return None
+            self._db.execute("UPDATE extents SET used_at = ? WHERE key = ?", (now, db_key))
+        series = json.loads(zlib.decompress(data))
+        return CachedExtent(start, end, {_series_key(item["metric"]): item for item in series})
+
+    def _put_entry(self, key: Hashable, extent: CachedExtent) -> None:
+        now = time.time()
+        db_key = self._db_key(key)
+        data = zlib.compress(json.dumps(list(extent.series.values()), separators=(",", ":")).encode())
+        with self._lock:
+            if len(data) > self.max_bytes:
+                self._db.execute("DELETE FROM extents WHERE key = ?", (db_key,))
+                return
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO extents (key, start, end, data, size, used_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (db_key, extent.start, extent.end, data, len(data), now),
+                )
+                self._evict(now)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def _evict(self, now: float) -> None:
+        """ Drop the entries past max_age_seconds, then the least recently used ones until under max_bytes """
+        if self.max_age_seconds is not None:
+            self.evictions += self._db.execute(
+                "DELETE FROM extents WHERE used_at < ?", (now - self.max_age_seconds,)
+            ).rowcount
+        (size,) = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM extents").fetchone()
+        if size <= self.max_bytes:
+            return
+        evicted = []
+        for db_key, entry_size in self._db.execute("SELECT key, size FROM extents ORDER BY used_at"):
+            if size <= self.max_bytes:
+                break
+            evicted.append((db_key,))
+            size -= entry_size
+        self._db.executemany("DELETE FROM extents WHERE key = ?", evicted)
+        self.evictions += len(evicted)
@@ -0,0 +1,88 @@
+import math
+from typing import Optional
+
+from prometrix.models.prometheus_config import OverBudgetAction
+from prometrix.models.prometheus_query import QueryPlan
+from prometrix.sharding import format_duration_seconds, parse_duration_seconds
+
+
+def count_points(start: float, end: float, step_seconds: float) -> int:
+    """ Points per series of a range query, the evaluation timestamps start + k * step up to end """
+    if end < start:
+        return 0
+    return int((end - start) // step_seconds) + 1
+
+
+def plan_range(
+    query: str,
+    start: float,
+    end: float,
+    step: str,
+    series: Optional[int],
+    base_step: str,
+    sample_budget: Optional[int],
+    max_points_per_series: int,
+    action: OverBudgetAction,
+) -> QueryPlan:
+    """
+    Decide how to run a range query of `series` estimated series so each request stays within
+    `max_points_per_series` and `sample_budget` samples: as requested, with a wider step (a multiple of
+    the larger of `step` and `base_step`), split in time shards, or not at all.
+    """
+    step_seconds = parse_duration_seconds(step)
+    points = count_points(start, end, step_seconds)
+    request_points = max_points_per_series
+    if sample_budget is not None and series:
+        request_points = min(request_points, sample_budget // series)
+
+    def make_plan(action_name: str, reason: str, **fields) -> QueryPlan:
+        plan_points = fields.pop("points_per_series", points)
+        return QueryPlan(
+            query=query,
+            start=start,
+            end=end,
+            requested_step=step,
+            step=fields.pop("step", step),
+            points_per_series=plan_points,
+            series=series,
+            estimated_samples=series * plan_points if series is not None else None,
+            action=action_name,
+            reason=reason,
+            **fields,
+        )
+
+    if points <= request_points:
+        return make_plan("run", f"{points} points per series fit the limit of {request_points}")
+    if request_points < 1:
+        return make_plan(
+            OverBudgetAction.REJECT.value,
+            f"{series} series exceed the budget of {sample_budget} samples even with a single point each",
+        )
+    limit = (
+        f"the sample budget of {sample_budget} for {series} series"
+        if request_points < max_points_per_series
+        else f"the limit of {max_points_per_series} points per series"
+    )
+    if action == OverBudgetAction.REJECT:
+        return make_plan(action.value, f"{points} points per series exceed {limit}")
+
+    if action == OverBudgetAction.SHARD:
+        shards = math.ceil(points / request_points)
+        return make_plan(
+            action.value,
+            f"{points} points per series exceed {limit}, split in {shards} ranges",
+            shards=shards,
+            shard_points=request_points,
+        )
+
+    span = end - start
+    required_step = span / (request_points - 1) if request_points > 1 else span + 1
+    base = max(step_seconds, parse_duration_seconds(base_step))
+    wide_step = base * math.ceil(required_step / base)
+    wide_points = count_points(start, end, wide_step)
+    return make_plan(
+        action.value,
+        f"{points} points per series exceed {limit}, step widened to keep {wide_points}",
+        step=format_duration_seconds(wide_step),
+        points_per_series=wide_points,
+    )
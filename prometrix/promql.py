@@ -0,0 +1,294 @@
+import re
+from functools import lru_cache
+from typing import (TYPE_CHECKING, Dict, Iterable, NamedTuple, Pattern, Tuple,
+                    Union)
+
+if TYPE_CHECKING:
+    from prometrix.models.prometheus_config import PrometheusConfig
+
+_METRIC_NAME_RE = re.compile(r"[a-zA-Z_:][a-zA-Z0-9_:]*")
+_LABEL_NAME_RE = re.compile(r"[a-zA-Z_][a-zA-Z0-9_]*")
+_MATCH_OP_RE = re.compile(r"=~|!~|!=|=")
+_SIMPLE_ESCAPES = {
+    "a": "\a", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t", "v": "\v", "\\": "\\",
+}
+_HEX_ESCAPE_DIGITS = {"x": 2, "u": 4, "U": 8}
+
+
+class LabelMatcher(NamedTuple):
+    name: str
+    op: str
+    value: str
+
+    def matches(self, labels: Dict[str, str]) -> bool:
+        # A missing label matches like an empty one, as in Prometheus
+        value = labels.get(self.name, "")
+        if self.op == "=":
+            return value == self.value
+        if self.op == "!=":
+            return value != self.value
+        matched = _compile_regex(self.value).fullmatch(value) is not None
+        return matched if self.op == "=~" else not matched
+
+    def __str__(self) -> str:
+        escaped = self.value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        return f'{self.name}{self.op}"{escaped}"'
+
+
+@lru_cache(maxsize=1024)
+def _compile_regex(pattern: str) -> Pattern:
+    # Prometheus regexes are fully anchored and `.` matches new lines
+    return re.compile(pattern, re.DOTALL)
+
+
+def _skip_spaces(text: str, pos: int) -> int:
+    while pos < len(text) and text[pos].isspace():
+        pos += 1
+    return pos
+
+
+def parse_string_literal(text: str, pos: int) -> Tuple[str, int]:
+    """
+    Parse the PromQL string literal starting at `pos` (double, single or back quoted).
+    Returns the unescaped value and the position right after the closing quote.
+    """
+    quote = text[pos]
+    if quote not in "\"'`":
+        raise ValueError(f"Expected a string at position {pos} of {text!r}")
+    pos += 1
+    if quote == "`":
+        end = text.find("`", pos)
+        if end == -1:
+            raise ValueError(f"Unterminated string in {text!r}")
+        return text[pos:end], end + 1
+
+    chars = []
+    while pos < len(text):
+        char = text[pos]
+        if char == quote:
+            return "".join(chars), pos + 1
+        if char != "\\":
+            chars.append(char)
+            pos += 1
+            continue
+        if pos + 1 >= len(text):
+            break
+        escape = text[pos + 1]
+        if escape in _SIMPLE_ESCAPES:
+            chars.append(_SIMPLE_ESCAPES[escape])
+            pos += 2
+        elif escape == quote:
+            chars.append(quote)
+            pos += 2
+        elif escape in _HEX_ESCAPE_DIGITS:
+            digits = _HEX_ESCAPE_DIGITS[escape]
+            chars.append(chr(int(text[pos + 2: pos + 2 + digits], 16)))
+            pos += 2 + digits
+        elif escape in "01234567":
+            chars.append(chr(int(text[pos + 1: pos + 4], 8)))
+            pos += 4
+        else:
+            raise ValueError(f"Unknown escape sequence \\{escape} in {text!r}")
+    raise ValueError(f"Unterminated string in {text!r}")
+
+
+def parse_label_matchers(text: str, pos: int) -> Tuple[Tuple[LabelMatcher, ...], int]:
+    """
+    Parse the `{...}` label matchers block starting at `pos`.
+    Returns the matchers and the position right after the closing brace.
+    """
+    if text[pos] != "{":
+        raise ValueError(f"Expected '{{' at position {pos} of {text!r}")
+    matchers = []
+    pos = _skip_spaces(text, pos + 1)
+    while pos < len(text) and text[pos] != "}":
+        if text[pos] in "\"'`":
+            name, pos = parse_string_literal(text, pos)
+        else:
+            name_match = _LABEL_NAME_RE.match(text, pos)
+            if not name_match:
+                raise ValueError(f"Expected a label name at position {pos} of {text!r}")
+            name, pos = name_match.group(), name_match.end()
+        pos = _skip_spaces(text, pos)
+
+        op_match = _MATCH_OP_RE.match(text, pos)
+        if not op_match:
+            if text[pos] in ",}":
+                # A quoted metric name alone: {"metric.name"}
+                matchers.append(LabelMatcher("__name__", "=", name))
+            else:
+                raise ValueError(f"Expected a match operator at position {pos} of {text!r}")
+        else:
+            pos = _skip_spaces(text, op_match.end())
+            value, pos = parse_string_literal(text, pos)
+            matchers.append(LabelMatcher(name, op_match.group(), value))
+
+        pos = _skip_spaces(text, pos)
+        if pos < len(text) and text[pos] == ",":
+            pos = _skip_spaces(text, pos + 1)
+    if pos >= len(text):
+        raise ValueError(f"Unterminated label matchers in {text!r}")
+    return tuple(matchers), pos + 1
+
+
+@lru_cache(maxsize=4096)
+def parse_series_selector(selector: str) -> Tuple[LabelMatcher, ...]:
+    """
+    Parse a series selector such as `up{job="api", pod=~"api-.*"}` into its label matchers,
+    the metric name becoming a `__name__` matcher. Raises ValueError on anything else.
+    """
+    selector = selector.strip()
+    matchers: Tuple[LabelMatcher, ...] = ()
+    pos = 0
+    name_match = _METRIC_NAME_RE.match(selector)
+    if name_match:
+        matchers = (LabelMatcher("__name__", "=", name_match.group()),)
+        pos = _skip_spaces(selector, name_match.end())
+    if pos < len(selector):
+        label_matchers, pos = parse_label_matchers(selector, pos)
+        matchers += label_matchers
+    if not matchers or _skip_spaces(selector, pos) != len(selector):
+        raise ValueError(f"Invalid series selector {selector!r}")
+    for matcher in matchers:
+        if matcher.op in ("=~", "!~"):
+            try:
+                _compile_regex(matcher.value)
+            except re.error as e:
+                raise ValueError(f"Invalid regex in series selector {selector!r}: {e}") from e
+    return matchers
+
+
+LabelMatchers = Union[None, str, Dict[str, str], Iterable[LabelMatcher]]
+
+
+def to_label_matchers(matchers: LabelMatchers) -> Tuple[LabelMatcher, ...]:
+    """ Label matchers given as a selector string like `'{pod=~"api-.*"}'`, a dict of label values, or LabelMatchers """
+    if not matchers:
+        return ()
+    if isinstance(matchers, str):
+        return parse_series_selector(matchers)
+    if isinstance(matchers, dict):
+        return tuple(LabelMatcher(name, "=", value) for name, value in matchers.items())
+    return tuple(matchers)
+
+
+_NUMBER_RE = re.compile(r"[0-9.]+(?:[eE][+-]?[0-9]+)?[a-zA-Z0-9_]*")
+# Keywords are case insensitive, the label list following the grouping ones holds no selectors
+_GROUPING_KEYWORDS = frozenset(["by", "without", "on", "ignoring", "group_left", "group_right"])
+_KEYWORDS = frozenset(["and", "or", "unless", "bool", "offset", "atan2", "inf", "nan"])
+_AGGREGATION_OPERATORS = frozenset([
+    "sum", "min", "max", "avg", "group", "stddev", "stdvar", "count", "count_values",
+    "bottomk", "topk", "quantile", "limitk", "limit_ratio",
+])
+
+
+class VectorSelector(NamedTuple):
+    # Where injected matchers go: right after `{`, or after the metric name when there are no braces
+    insert_at: int
+    braces: bool
+    matchers: Tuple[LabelMatcher, ...]
+
+
+def _skip_past(text: str, pos: int, closing: str) -> int:
+    end = text.find(closing, pos)
+    if end == -1:
+        raise ValueError(f"Missing '{closing}' after position {pos} of {text!r}")
+    return end + 1
+
+
+def _keyword_at(text: str, pos: int) -> str:
+    word_match = _METRIC_NAME_RE.match(text, pos)
+    return word_match.group().lower() if word_match else ""
+
+
+@lru_cache(maxsize=4096)
+def find_vector_selectors(query: str) -> Tuple[VectorSelector, ...]:
+    """
+    Locate the vector selectors of a PromQL expression, without building a full syntax tree: strings,
+    comments, numbers and durations, `[...]` ranges, function and aggregation names, keywords and the label
+    lists of by / without / on / ignoring / group_left / group_right are skipped, every other identifier or
+    `{...}` block is a selector. Raises ValueError on malformed strings and label matchers.
+    """
+    selectors = []
+    pos = 0
+    while pos < len(query):
+        char = query[pos]
+        if char.isspace():
+            pos += 1
+        elif char == "#":
+            end = query.find("\n", pos)
+            pos = len(query) if end == -1 else end + 1
+        elif char in "\"'`":
+            pos = parse_string_literal(query, pos)[1]
+        elif char == "[":
+            pos = _skip_past(query, pos, "]")
+        elif char == "{":
+            matchers, end = parse_label_matchers(query, pos)
+            selectors.append(VectorSelector(pos + 1, True, matchers))
+            pos = end
+        elif char.isdigit() or (char == "." and query[pos + 1: pos + 2].isdigit()):
+            pos = _NUMBER_RE.match(query, pos).end()
+        elif char.isalpha() or char in "_:":
+            name_match = _METRIC_NAME_RE.match(query, pos)
+            word, end = name_match.group(), name_match.end()
+            following = _skip_spaces(query, end)
+            next_char = query[following: following + 1]
+            keyword = word.lower()
+            if keyword in _GROUPING_KEYWORDS:
+                pos = _skip_past(query, following, ")") if next_char == "(" else following
+            elif keyword in _KEYWORDS or next_char == "(":
+                # Keywords, functions and aggregations, whose arguments are scanned next
+                pos = end
+            elif keyword in _AGGREGATION_OPERATORS and _keyword_at(query, following) in ("by", "without"):
+                # `sum by (job) (...)`, the grouping comes before the arguments
+                pos = end
+            elif next_char == "{":
+                matchers, pos = parse_label_matchers(query, following)
+                selectors.append(VectorSelector(following + 1, True, matchers))
+            else:
+                selectors.append(VectorSelector(end, False, ()))
+                pos = end
+        else:
+            pos += 1
+    return tuple(selectors)
+
+
+@lru_cache(maxsize=4096)
+def _inject_label_matchers(query: str, matchers: Tuple[LabelMatcher, ...]) -> str:
+    parts = []
+    last = 0
+    for selector in find_vector_selectors(query):
+        missing = [matcher for matcher in matchers if matcher not in selector.matchers]
+        if not missing:
+            continue
+        injected = ", ".join(map(str, missing))
+        if selector.braces:
+            injected += ", " if selector.matchers else ""
+        else:
+            injected = "{" + injected + "}"
+        parts.append(query[last: selector.insert_at])
+        parts.append(injected)
+        last = selector.insert_at
+    parts.append(query[last:])
+    return "".join(parts)
+
+
+def inject_label_matchers(query: str, matchers: Iterable[LabelMatcher]) -> str:
+    """
+    Add label matchers to every vector selector of a PromQL expression, e.g. with `cluster="a"`,
+    `sum(rate(http_requests_total{code="500"}[5m])) / sum(up)` becomes
+    `sum(rate(http_requests_total{cluster="a", code="500"}[5m])) / sum(up{cluster="a"})`.
+    Selectors already holding an identical matcher are left as is. Selector positions and rewritten
+    queries are cached, so repeated queries are rewritten in microseconds.
+    """
+    matchers = tuple(matchers)
+    if not matchers:
+        return query
+    return _inject_label_matchers(query, matchers)
+
+
+def additional_label_matchers(config: "PrometheusConfig") -> Tuple[LabelMatcher, ...]:
+    """ The matchers injected into every query of a client of `config` """
+    if not config.inject_additional_labels:
+        return ()
+    return to_label_matchers(config.additional_labels)
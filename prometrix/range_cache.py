@@ -0,0 +1,184 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+from prometrix.sharding import merge_matrix_data, normalize_timestamp
+
+# Rough in-memory cost of the structures held per cached series and per [timestamp, value] sample
+_SERIES_OVERHEAD_BYTES = 200
+_SAMPLE_BYTES = 120
+
+RangeFetcher = Callable[[float, float], Dict]
+
+
+def align_to_step(timestamp: float, step_seconds: float, origin: float = 0) -> float:
+    """ Snap a timestamp down to the closest `origin` plus a multiple of the step """
+    return normalize_timestamp(origin + math.floor((timestamp - origin) / step_seconds) * step_seconds)
+
+
+def _series_key(metric: Dict[str, str]) -> Tuple:
+    return tuple(sorted(metric.items()))
+
+
+def _slice_matrix(data: Dict, start: float, end: float) -> Dict:
+    """
+    Keep only the samples (float values and native histograms) within [start, end], dropping series left
+    without samples
+    """
+    result = []
+    for item in data["result"]:
+        sliced = {"metric": item["metric"]}
+        for samples_key in ("values", "histograms"):
+            samples = [sample for sample in item.get(samples_key, ()) if start <= float(sample[0]) <= end]
+            if samples:
+                sliced[samples_key] = samples
+        if len(sliced) > 1:
+            result.append(sliced)
+    return {"resultType": "matrix", "result": result}
+
+
+def _estimate_series_bytes(series: Dict) -> int:
+    labels_bytes = sum(len(k) + len(v) for k, v in series["metric"].items())
+    histograms_bytes = sum(
+        _SAMPLE_BYTES * (1 + len(histogram.get("buckets", ()))) for _, histogram in series.get("histograms", ())
+    )
+    return _SERIES_OVERHEAD_BYTES + labels_bytes + _SAMPLE_BYTES * len(series.get("values", ())) + histograms_bytes
+
+
+class CachedExtent:
+    """
+    The samples of one range query between two timestamps of its step grid (both inclusive).
+    """
+
+    def __init__(self, start: float, end: float, series: Dict[Tuple, Dict]):
+        self.start = start
+        self.end = end
+        self.series = series
+        self.size = sum(_estimate_series_bytes(item) for item in series.values())
+
+    def slice(self, start: float, end: float) -> Dict:
+        return _slice_matrix({"result": self.series.values()}, start, end)
+
+
+class RangeQueryCache:
+    """
+    In-process cache of query_range results, in the spirit of Thanos' query-frontend.
+
+    For a cached query only the missing head and/or tail of a requested range is fetched and merged
+    with the cached samples. Samples newer than `mutable_window_seconds` are never cached, because recent
+    data may still change (late scrapes, rule evaluation lag). Entries are evicted least recently used
+    first once their estimated size exceeds `max_bytes`.
+    Prometheus evaluates a range query at start, start + step, ... so an entry only holds the timestamps of
+    one such grid: keys include the offset of the grid within the step (see make_key).
+    A single cache may be shared by several connect instances, keys include the backend url.
+    """
+
+    def __init__(self, max_bytes: int, mutable_window_seconds: float = 600):
+        self.max_bytes = max_bytes
+        self.mutable_window_seconds = mutable_window_seconds
+        self.hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Hashable, CachedExtent]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(
+        url: str, query: str, step: str, params: Optional[Dict] = None, step_offset: float = 0
+    ) -> Tuple:
+        """ `step_offset` is the query's start modulo the step, ranges on other grids do not share entries """
+        params = tuple(sorted((k, str(v)) for k, v in (params or {}).items()))
+        return url, query, str(step), normalize_timestamp(step_offset), params
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "partial_hits": self.partial_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._size,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def query_range(
+        self,
+        key: Hashable,
+        start: float,
+        end: float,
+        step_seconds: float,
+        fetch: RangeFetcher,
+    ) -> Dict:
+        """
+        Return the matrix `data` for the [start, end] range, calling fetch(start, end) only for the
+        sub-ranges that are not cached. `end` must be on the step grid of `start`, as must the start of
+        every range queried with the same key.
+        """
+        immutable_end = align_to_step(time.time() - self.mutable_window_seconds, step_seconds, origin=start)
+        extent = self._get_entry(key)
+
+        if extent is None or start > extent.end + step_seconds or end < extent.start - step_seconds:
+            # Nothing usable cached, or the cached extent is not contiguous with the requested range
+            data = fetch(start, end)
+            self._record("misses")
+            stored_end = min(end, immutable_end)
+            # Do not replace a wider cached extent by a disjoint narrower one
+            if start <= stored_end and (extent is None or stored_end - start > extent.end - extent.start):
+                self._store(key, start, stored_end, data)
+            return data
+
+        if start >= extent.start and end <= extent.end:
+            self._record("hits")
+            return extent.slice(start, end)
+
+        head = None
+        if start < extent.start:
+            head = fetch(start, normalize_timestamp(extent.start - step_seconds))
+        tail = None
+        if end > extent.end:
+            tail = fetch(normalize_timestamp(extent.end + step_seconds), end)
+        self._record("partial_hits")
+        cached = extent.slice(extent.start, extent.end)
+        merged = merge_matrix_data(part for part in (head, cached, tail) if part is not None)
+        self._store(key, min(start, extent.start), max(extent.end, min(end, immutable_end)), merged)
+        return _slice_matrix(merged, start, end)
+
+    def _record(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _get_entry(self, key: Hashable) -> Optional[CachedExtent]:
+        with self._lock:
+            extent = self._entries.get(key)
+            if extent is not None:
+                self._entries.move_to_end(key)
+            return extent
+
+    def _put_entry(self, key: Hashable, extent: CachedExtent) -> None:
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= previous.size
+            if extent.size > self.max_bytes:
+                return
+            self._entries[key] = extent
+            self._size += extent.size
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.size
+                self.evictions += 1
+
+    def _store(self, key: Hashable, start: float, end: float, data: Dict) -> None:
+        series = {
+            _series_key(item["metric"]): item for item in _slice_matrix(data, start, end)["result"]
+        }
+        self._put_entry(key, CachedExtent(start, end, series))
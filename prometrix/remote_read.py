@@ -0,0 +1,358 @@
+"""
+Client side of the Prometheus remote read protocol (POST /api/v1/read) with the STREAMED_XOR_CHUNKS response
+type: raw samples at full resolution, in the compressed chunks the TSDB stores, without PromQL evaluation.
+
+The few protobuf messages involved (prompb ReadRequest and ChunkedReadResponse) are encoded and decoded by hand,
+and the request is snappy-framed as literals only, so no protobuf or snappy package is needed.
+"""
+import logging
+import struct
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from prometrix.models.prometheus_result import load_numpy
+from prometrix.promql import LabelMatcher
+
+REMOTE_READ_HEADERS = {
+    "Content-Type": "application/x-protobuf",
+    "Content-Encoding": "snappy",
+    "Accept": "application/x-streamed-protobuf; proto=prometheus.ChunkedReadResponse",
+    "X-Prometheus-Remote-Read-Version": "0.1.0",
+}
+STREAMED_CONTENT_TYPE = "application/x-streamed-protobuf"
+
+# prompb ReadRequest.ResponseType and LabelMatcher.Type
+STREAMED_XOR_CHUNKS = 1
+_MATCHER_TYPES = {"=": 0, "!=": 1, "=~": 2, "!~": 3}
+# prompb Chunk.Encoding
+CHUNK_XOR = 1
+
+# Frames are limited to 50MB by Prometheus, anything larger is a corrupt stream
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+_UINT64_MASK = (1 << 64) - 1
+_pack_uint64 = struct.Struct(">Q").pack
+_unpack_double = struct.Struct(">d").unpack
+
+
+def _uvarint(value: int) -> bytes:
+    value &= _UINT64_MASK
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def read_uvarint(data: bytes, pos: int) -> Tuple[int, int]:
+    """ Decode the base 128 varint at `pos`, returns the value and the position after it """
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+        if shift >= 70:
+            raise ValueError("Malformed varint")
+
+
+def _int64(value: int) -> int:
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _field(number: int, payload: bytes) -> bytes:
+    """ A length-delimited protobuf field """
+    return _uvarint(number << 3 | 2) + _uvarint(len(payload)) + payload
+
+
+def _varint_field(number: int, value: int) -> bytes:
+    return _uvarint(number << 3) + _uvarint(value)
+
+
+def iter_fields(data: bytes) -> Iterator[Tuple[int, int, object]]:
+    """
+    Iterate over the (field number, wire type, value) of a protobuf message. Varints are returned as
+    unsigned ints, length-delimited fields as memoryviews, fixed fields as raw bytes.
+    """
+    view = memoryview(data)
+    pos = 0
+    end = len(view)
+    while pos < end:
+        key, pos = read_uvarint(view, pos)
+        number, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, pos = read_uvarint(view, pos)
+        elif wire_type == 2:
+            size, pos = read_uvarint(view, pos)
+            value = view[pos:pos + size]
+            pos += size
+        elif wire_type == 1:
+            value = view[pos:pos + 8]
+            pos += 8
+        elif wire_type == 5:
+            value = view[pos:pos + 4]
+            pos += 4
+        else:
+            raise ValueError(f"Unsupported protobuf wire type {wire_type}")
+        if pos > end:
+            raise ValueError("Truncated protobuf message")
+        yield number, wire_type, value
+
+
+def encode_read_request(
+    start_ms: int, end_ms: int, matchers: Sequence[LabelMatcher]
+) -> bytes:
+    """ A prompb ReadRequest for one query, accepting only the streamed XOR chunks response """
+    query = _varint_field(1, start_ms) + _varint_field(2, end_ms)
+    for matcher in matchers:
+        query += _field(
+            3,
+            _varint_field(1, _MATCHER_TYPES[matcher.op])
+            + _field(2, matcher.name.encode())
+            + _field(3, matcher.value.encode()),
+        )
+    return _field(1, query) + _field(2, _uvarint(STREAMED_XOR_CHUNKS))
+
+
+def snappy_literal_block(data: bytes) -> bytes:
+    """
+    `data` in the snappy block format as a single literal, without compressing it. Any snappy decoder reads it,
+    and read requests are a few hundred bytes, so compressing them would not save anything noticeable.
+    """
+    size = len(data)
+    if size == 0:
+        return _uvarint(0)
+    if size <= 60:
+        tag = bytes([(size - 1) << 2])
+    else:
+        length = (size - 1).to_bytes(4, "little").rstrip(b"\x00") or b"\x00"
+        tag = bytes([(59 + len(length)) << 2]) + length
+    return _uvarint(size) + tag + data
+
+
+def _crc32c_table() -> List[int]:
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0x82F63B78 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+_CRC32C_TABLE = _crc32c_table()
+
+
+def crc32c(data: bytes) -> int:
+    """ CRC-32C (Castagnoli), the checksum of remote read frames """
+    crc = 0xFFFFFFFF
+    table = _CRC32C_TABLE
+    for byte in data:
+        crc = table[(crc ^ byte) & 0xFF] ^ (crc >> 8)
+    return crc ^ 0xFFFFFFFF
+
+
+def iter_frames(chunks: Iterable[bytes], verify_checksums: bool = True) -> Iterator[bytes]:
+    """
+    Split a streamed remote read body into its messages. Each frame is the uvarint size of the message,
+    its big endian CRC-32C and the message itself.
+    """
+    buffer = b""
+    for chunk in chunks:
+        buffer = buffer + chunk if buffer else chunk
+        pos = 0
+        while True:
+            try:
+                size, header_end = read_uvarint(buffer, pos)
+            except IndexError:
+                break
+            if size > MAX_FRAME_BYTES:
+                raise ValueError(f"Remote read frame of {size} bytes exceeds the {MAX_FRAME_BYTES} bytes limit")
+            frame_end = header_end + 4 + size
+            if frame_end > len(buffer):
+                break
+            message = buffer[header_end + 4:frame_end]
+            if verify_checksums:
+                (expected,) = struct.unpack_from(">I", buffer, header_end)
+                if crc32c(message) != expected:
+                    raise ValueError("Remote read frame checksum mismatch")
+            yield message
+            pos = frame_end
+        buffer = buffer[pos:]
+    if buffer:
+        raise ValueError(f"Remote read stream ended inside a frame ({len(buffer)} bytes left)")
+
+
+def decode_xor_chunk(
+    data: bytes, start_ms: int, end_ms: int, timestamps: array, values: array
+) -> int:
+    """
+    Append the samples of a Prometheus XOR (Gorilla) chunk within [start_ms, end_ms] to the `timestamps`
+    (seconds) and `values` float64 arrays. Returns the number of samples appended.
+    """
+    count = int.from_bytes(data[:2], "big")
+    if count == 0:
+        return 0
+    width = 8 * (len(data) - 2)
+    # The bit stream as a string of 0 and 1, reading n bits is then a slice and an int()
+    bits = format(int.from_bytes(data[2:], "big"), f"0{width}b") if width else ""
+    pos = 0
+
+    def read_varint_bytes() -> int:
+        nonlocal pos
+        result = 0
+        shift = 0
+        while True:
+            byte = int(bits[pos:pos + 8], 2)
+            pos += 8
+            result |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return result
+            shift += 7
+
+    raw_t = read_varint_bytes()
+    t = (raw_t >> 1) ^ -(raw_t & 1)
+    value_bits = int(bits[pos:pos + 64], 2)
+    pos += 64
+    leading = trailing = 0
+    appended = 0
+    t_delta = 0
+    for index in range(count):
+        if index == 1:
+            t_delta = read_varint_bytes()
+            t += t_delta
+        elif index > 1:
+            # Delta of delta of the timestamp: 0, 10 + 14 bits, 110 + 17, 1110 + 20 or 1111 + 64
+            if bits[pos] == "0":
+                pos += 1
+                dod = 0
+            else:
+                if bits[pos + 1] == "0":
+                    size, pos = 14, pos + 2
+                elif bits[pos + 2] == "0":
+                    size, pos = 17, pos + 3
+                elif bits[pos + 3] == "0":
+                    size, pos = 20, pos + 4
+                else:
+                    size, pos = 64, pos + 4
+                dod = int(bits[pos:pos + size], 2)
+                pos += size
+                if size == 64:
+                    dod = _int64(dod)
+                elif dod > 1 << (size - 1):
+                    dod -= 1 << size
+            t_delta += dod
+            t += t_delta
+        if index > 0:
+            # Value XORed with the previous one: 0 unchanged, 10 + the previous window of meaningful bits,
+            # 11 + 5 bits of leading zeros + 6 bits of meaningful bits count + the meaningful bits
+            if bits[pos] == "1":
+                if bits[pos + 1] == "1":
+                    leading = int(bits[pos + 2:pos + 7], 2)
+                    significant = int(bits[pos + 7:pos + 13], 2) or 64
+                    trailing = 64 - leading - significant
+                    pos += 13
+                else:
+                    significant = 64 - leading - trailing
+                    pos += 2
+                value_bits ^= int(bits[pos:pos + significant], 2) << trailing
+                pos += significant
+            else:
+                pos += 1
+        if t > end_ms:
+            break
+        if t >= start_ms:
+            timestamps.append(t / 1000)
+            values.append(_unpack_double(_pack_uint64(value_bits))[0])
+            appended += 1
+    return appended
+
+
+def parse_chunked_series(
+    message: bytes,
+) -> Iterator[Tuple[int, Dict[str, str], List[Tuple[int, int, int, memoryview]]]]:
+    """
+    The series of a prompb ChunkedReadResponse, as (query index, labels, chunks) with each chunk being
+    (min time ms, max time ms, encoding, data)
+    """
+    query_index = 0
+    series = []
+    for number, _, value in iter_fields(message):
+        if number == 1:
+            series.append(value)
+        elif number == 2:
+            query_index = value
+    for payload in series:
+        labels: Dict[str, str] = {}
+        chunks = []
+        for number, _, value in iter_fields(payload):
+            if number == 1:
+                name = label_value = ""
+                for label_number, _, label_field in iter_fields(value):
+                    if label_number == 1:
+                        name = bytes(label_field).decode()
+                    elif label_number == 2:
+                        label_value = bytes(label_field).decode()
+                labels[name] = label_value
+            elif number == 2:
+                min_time = max_time = encoding = 0
+                data = memoryview(b"")
+                for chunk_number, _, chunk_field in iter_fields(value):
+                    if chunk_number == 1:
+                        min_time = _int64(chunk_field)
+                    elif chunk_number == 2:
+                        max_time = _int64(chunk_field)
+                    elif chunk_number == 3:
+                        encoding = chunk_field
+                    elif chunk_number == 4:
+                        data = chunk_field
+                chunks.append((min_time, max_time, encoding, data))
+        yield query_index, labels, chunks
+
+
+def _series_item(labels: Dict[str, str], timestamps: array, values: array) -> Dict:
+    np = load_numpy()
+    if np is not None:
+        # Views over the arrays, not copies
+        return {
+            "metric": labels,
+            "timestamps": np.frombuffer(timestamps, dtype=np.float64),
+            "values": np.frombuffer(values, dtype=np.float64),
+        }
+    return {"metric": labels, "timestamps": timestamps, "values": values}
+
+
+def iter_remote_read_series(
+    chunks: Iterable[bytes], start_ms: int, end_ms: int, verify_checksums: bool = True
+) -> Iterator[Dict]:
+    """
+    Decode a streamed remote read body into series dicts shaped like the columnar series of
+    PrometheusQueryResult: `metric` labels, and `timestamps` (seconds) and `values` float64 buffers holding
+    the samples within [start_ms, end_ms]. A series split over consecutive frames is yielded once, whole,
+    series without samples in the range are left out. Chunks of native histograms are skipped.
+    """
+    current: Optional[Tuple[int, Dict[str, str]]] = None
+    timestamps = array("d")
+    values = array("d")
+    skipped_histograms = 0
+    for message in iter_frames(chunks, verify_checksums):
+        for query_index, labels, series_chunks in parse_chunked_series(message):
+            if current is not None and (query_index, labels) != current:
+                if timestamps:
+                    yield _series_item(current[1], timestamps, values)
+                timestamps, values = array("d"), array("d")
+            current = (query_index, labels)
+            for min_time, max_time, encoding, data in series_chunks:
+                if encoding != CHUNK_XOR:
+                    skipped_histograms += 1
+                    continue
+                if max_time < start_ms or min_time > end_ms:
+                    continue
+                decode_xor_chunk(data, start_ms, end_ms, timestamps, values)
+    if current is not None and timestamps:
+        yield _series_item(current[1], timestamps, values)
+    if skipped_histograms:
+        logging.warning(f"Skipped {skipped_histograms} native histogram chunks, they are not supported")
@@ -0,0 +1,440 @@
+import asyncio
+import contextvars
+import email.utils
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import (FIRST_COMPLETED, Future, ThreadPoolExecutor,
+                                wait)
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+from requests.exceptions import ConnectionError, Timeout
+
+from prometrix.concurrency import (AdaptiveLimit, AsyncConcurrencyLimiter,
+                                   CircuitBreaker, ConcurrencyLimiter)
+from prometrix.exceptions import PrometheusCircuitOpen
+from prometrix.instrumentation import current_request_event
+from prometrix.models.prometheus_config import ResiliencePolicy
+
+# Number of recent latencies per endpoint the hedging percentile is computed from
+LATENCY_WINDOW_SIZE = 200
+
+OUTCOMES = (
+    "requests",
+    "succeeded",
+    "failed",
+    "retries",
+    "retry_after",
+    "timeouts",
+    "connection_errors",
+    "throttled",
+    "server_errors",
+    "hedged",
+    "hedge_wins",
+    "rejected",
+)
+
+# Responses telling that the backend, or a proxy in front of it, is overloaded
+OVERLOAD_STATUS_CODES = (429, 502, 503, 504)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """ Seconds to wait according to a Retry-After header, given in seconds or as an HTTP date """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at.timestamp() - time.time(), 0.0)
+
+
+def backoff_delay(attempt: int, base: float, maximum: float) -> float:
+    """ Exponential backoff with full jitter: uniform in [0, min(maximum, base * 2^attempt)] """
+    return random.uniform(0, min(maximum, base * (2 ** attempt)))
+
+
+class LatencyTracker:
+    """ Latencies of the recent successful requests of each endpoint """
+
+    def __init__(self, window_size: int = LATENCY_WINDOW_SIZE):
+        self.window_size = window_size
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint: str, seconds: float) -> None:
+        with self._lock:
+            latencies = self._latencies.get(endpoint)
+            if latencies is None:
+                latencies = self._latencies[endpoint] = deque(maxlen=self.window_size)
+            latencies.append(seconds)
+
+    def percentile(self, endpoint: str, percentile: float, min_samples: int) -> Optional[float]:
+        with self._lock:
+            latencies = sorted(self._latencies.get(endpoint, ()))
+        if len(latencies) < min_samples:
+            return None
+        index = min(len(latencies) - 1, int(len(latencies) * percentile / 100))
+        return latencies[index]
+
+
+class ResilienceStats:
+    def __init__(self):
+        self._counts = dict.fromkeys(OUTCOMES, 0)
+        self._lock = threading.Lock()
+
+    def increment(self, outcome: str, count: int = 1) -> None:
+        with self._lock:
+            self._counts[outcome] += count
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
+
+
+class _Outcome:
+    """ The response or exception of one attempt """
+
+    def __init__(
+        self, response: Any = None, error: Optional[BaseException] = None, started: Optional[float] = None
+    ):
+        self.response = response
+        self.error = error
+        # perf_counter() when the attempt was sent, None if it was rejected before
+        self.started = started
+        # A hedged attempt completing after another one succeeded
+        self.lost = False
+
+    def result(self) -> Any:
+        if self.error is not None:
+            raise self.error
+        return self.response
+
+
+class _HedgeRace:
+    """ The attempts of one hedged request: the first successful one wins, those completing after it lost """
+
+    def __init__(self):
+        self.decided = False
+        self._lock = threading.Lock()
+
+    def complete(self, succeeded: bool) -> bool:
+        """ Record a completed attempt, returns True if it lost the race """
+        with self._lock:
+            if self.decided:
+                return True
+            self.decided = succeeded
+            return False
+
+
+class _BaseResilientSender:
+    """
+    Applies a ResiliencePolicy to the requests of a client: retries with jittered exponential backoff
+    (honouring Retry-After), hedging, i.e. sending a duplicate request once the first one has been
+    pending for longer than a percentile of the endpoint's recent latencies, keeping the first answer,
+    an adaptive limit on the attempts in flight and a circuit breaker.
+    Subclasses define which exceptions are timeouts and connection errors for their HTTP library.
+    """
+
+    timeout_errors: Tuple = ()
+    connection_errors: Tuple = ()
+
+    def __init__(self, policy: ResiliencePolicy, name: str = "Prometheus"):
+        self.policy = policy
+        self.latencies = LatencyTracker()
+        self._stats = ResilienceStats()
+        self.circuit_breaker: Optional[CircuitBreaker] = None
+        if policy.circuit_failure_threshold:
+            self.circuit_breaker = CircuitBreaker(
+                policy.circuit_failure_threshold, policy.circuit_reset_timeout, name
+            )
+
+    def _adaptive_limit(self, pool_size: int) -> Optional[AdaptiveLimit]:
+        if not self.policy.adaptive_concurrency:
+            return None
+        return AdaptiveLimit(
+            min_limit=self.policy.min_concurrency,
+            max_limit=self.policy.max_concurrency or pool_size,
+            initial_limit=self.policy.initial_concurrency,
+            decrease_factor=self.policy.concurrency_decrease_factor,
+            latency_tolerance=self.policy.latency_tolerance,
+        )
+
+    def stats(self) -> Dict[str, int]:
+        stats = self._stats.stats()
+        if self.limiter is not None:
+            stats.update({f"concurrency_{name}": value for name, value in self.limiter.stats().items()})
+        if self.circuit_breaker is not None:
+            stats["circuit_opened"] = self.circuit_breaker.opened
+        return stats
+
+    def _check_circuit(self) -> Optional[_Outcome]:
+        """ The rejected outcome of an attempt that must not be sent, None if it may """
+        if self.circuit_breaker is None:
+            return None
+        try:
+            self.circuit_breaker.before_request()
+        except PrometheusCircuitOpen as e:
+            self._stats.increment("rejected")
+            return _Outcome(error=e)
+        return None
+
+    def _signals(self, outcome: _Outcome, seconds: float) -> Tuple[bool, bool, Optional[float]]:
+        """ Whether an attempt signals an overloaded backend, a healthy one, and its latency if it succeeded """
+        if outcome.error is not None:
+            timed_out = isinstance(outcome.error, self.timeout_errors)
+            healthy = not timed_out and not isinstance(outcome.error, self.connection_errors)
+            return timed_out, healthy, None
+        status_code = outcome.response.status_code
+        latency = seconds if status_code < 400 else None
+        return status_code in OVERLOAD_STATUS_CODES, status_code < 500, latency
+
+    def _hedge_delay(self, endpoint: str) -> Optional[float]:
+        if self.policy.hedge_percentile is None:
+            return None
+        delay = self.latencies.percentile(
+            endpoint, self.policy.hedge_percentile, self.policy.hedge_min_samples
+        )
+        return max(delay, self.policy.hedge_min_delay) if delay is not None else None
+
+    def _observe(self, endpoint: str, outcome: _Outcome, seconds: float) -> None:
+        # Only the latency the caller saw counts, hedged losers would drag the percentile up
+        if outcome.error is None and outcome.response.status_code < 400:
+            self.latencies.observe(endpoint, seconds)
+
+    def _classify(self, outcome: _Outcome) -> bool:
+        """ Count the outcome of an attempt, returns True if it may be retried """
+        if outcome.error is not None:
+            if isinstance(outcome.error, self.timeout_errors):
+                self._stats.increment("timeouts")
+                return True
+            if isinstance(outcome.error, self.connection_errors):
+                self._stats.increment("connection_errors")
+                return True
+            return False
+        status_code = outcome.response.status_code
+        if status_code == 429:
+            self._stats.increment("throttled")
+        elif status_code >= 500:
+            self._stats.increment("server_errors")
+        return status_code in self.policy.retry_status_codes
+
+    def _retry_delay(self, attempt: int, outcome: _Outcome) -> float:
+        delay = backoff_delay(attempt, self.policy.backoff_base, self.policy.backoff_max)
+        if self.policy.respect_retry_after and outcome.response is not None:
+            retry_after = parse_retry_after(outcome.response.headers.get("Retry-After"))
+            if retry_after is not None:
+                self._stats.increment("retry_after")
+                delay = min(max(delay, retry_after), self.policy.backoff_max)
+        return delay
+
+    def _finish(self, outcome: _Outcome, attempts: int) -> Any:
+        failed = outcome.error is not None or outcome.response.status_code >= 400
+        self._stats.increment("failed" if failed else "succeeded")
+        event = current_request_event()
+        if event is not None:
+            event.retries += attempts - 1
+            if outcome.started is not None:
+                event.attempt_started(outcome.started)
+        return outcome.result()
+
+    @staticmethod
+    def _record_backoff(seconds: float) -> None:
+        event = current_request_event()
+        if event is not None:
+            event.add_phase("backoff", seconds)
+
+    def _close(self, outcome: _Outcome) -> None:
+        close = getattr(outcome.response, "close", None)
+        if close is not None:
+            close()
+
+
+class ResilientSender(_BaseResilientSender):
+    """ ResiliencePolicy for the requests based clients """
+
+    timeout_errors = (Timeout,)
+    connection_errors = (ConnectionError,)
+
+    def __init__(self, policy: ResiliencePolicy, pool_size: int = 10, name: str = "Prometheus"):
+        super().__init__(policy, name)
+        limit = self._adaptive_limit(pool_size)
+        self.limiter = ConcurrencyLimiter(limit) if limit is not None else None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        self._max_workers = pool_size
+
+    def send(self, endpoint: str, send: Callable[[], Any]) -> Any:
+        """ Send a request through `send`, retrying and hedging it according to the policy """
+        self._stats.increment("requests")
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            outcome = self._hedged_attempt(endpoint, send)
+            self._observe(endpoint, outcome, time.perf_counter() - start)
+            retryable = self._classify(outcome)
+            if attempt >= self.policy.max_retries or not retryable:
+                return self._finish(outcome, attempt + 1)
+            delay = self._retry_delay(attempt, outcome)
+            self._close(outcome)
+            attempt += 1
+            self._stats.increment("retries")
+            logging.debug(f"Retrying Prometheus {endpoint} request in {delay:.2f}s (attempt {attempt + 1})")
+            sleep_start = time.perf_counter()
+            time.sleep(delay)
+            self._record_backoff(time.perf_counter() - sleep_start)
+
+    def _attempt(self, endpoint: str, send: Callable[[], Any], race: Optional[_HedgeRace] = None) -> _Outcome:
+        rejected = self._check_circuit()
+        if rejected is not None:
+            return rejected
+        started_at = self.limiter.acquire() if self.limiter is not None else None
+        start = time.perf_counter()
+        try:
+            outcome = _Outcome(response=send(), started=start)
+        except Exception as e:
+            outcome = _Outcome(error=e, started=start)
+        overloaded, healthy, latency = self._signals(outcome, time.perf_counter() - start)
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.record(healthy)
+        if race is not None:
+            outcome.lost = race.complete(outcome.error is None and outcome.response.status_code < 400)
+        if started_at is not None:
+            # A hedged attempt that lost can not be cancelled, but as in the async sender its latency says nothing
+            self.limiter.release(endpoint, started_at, overloaded, latency, sample=not outcome.lost)
+        return outcome
+
+    def _hedged_attempt(self, endpoint: str, send: Callable[[], Any]) -> _Outcome:
+        hedge_delay = self._hedge_delay(endpoint)
+        if hedge_delay is None:
+            return self._attempt(endpoint, send)
+
+        # Run in copies of the caller's context, so the instrumentation still sees the tracked request
+        executor = self._get_executor()
+        race = _HedgeRace()
+        primary = executor.submit(contextvars.copy_context().run, self._attempt, endpoint, send, race)
+        done, _ = wait([primary], timeout=hedge_delay)
+        if done:
+            return primary.result()
+
+        if self.limiter is not None and not self.limiter.has_capacity():
+            # Hedging must not add load beyond the concurrency limit
+            return primary.result()
+        self._stats.increment("hedged")
+        hedge = executor.submit(contextvars.copy_context().run, self._attempt, endpoint, send, race)
+        pending = {primary, hedge}
+        outcome: Optional[_Outcome] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                outcome = future.result()
+                if outcome.error is None and outcome.response.status_code < 400 and not outcome.lost:
+                    if future is hedge:
+                        self._stats.increment("hedge_wins")
+                    for loser in pending | done - {future}:
+                        loser.add_done_callback(self._close_future)
+                    return outcome
+        return outcome
+
+    def _close_future(self, future: Future) -> None:
+        self._close(future.result())
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self._max_workers, thread_name_prefix="prometrix-hedge"
+                )
+            return self._executor
+
+
+class AsyncResilientSender(_BaseResilientSender):
+    """ ResiliencePolicy for the httpx based async clients """
+
+    def __init__(self, policy: ResiliencePolicy, pool_size: int = 100, name: str = "Prometheus"):
+        # Imported here so the sync clients never load httpx, only the async ones use this sender
+        import httpx
+
+        super().__init__(policy, name)
+        limit = self._adaptive_limit(pool_size)
+        self.limiter = AsyncConcurrencyLimiter(limit) if limit is not None else None
+        self.timeout_errors = (httpx.TimeoutException,)
+        self.connection_errors = (httpx.TransportError,)
+
+    async def send(self, endpoint: str, send: Callable[[], Awaitable[Any]]) -> Any:
+        """ Send a request through `send`, retrying and hedging it according to the policy """
+        self._stats.increment("requests")
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            outcome = await self._hedged_attempt(endpoint, send)
+            self._observe(endpoint, outcome, time.perf_counter() - start)
+            retryable = self._classify(outcome)
+            if attempt >= self.policy.max_retries or not retryable:
+                return self._finish(outcome, attempt + 1)
+            delay = self._retry_delay(attempt, outcome)
+            attempt += 1
+            self._stats.increment("retries")
+            logging.debug(f"Retrying Prometheus {endpoint} request in {delay:.2f}s (attempt {attempt + 1})")
+            sleep_start = time.perf_counter()
+            await asyncio.sleep(delay)
+            self._record_backoff(time.perf_counter() - sleep_start)
+
+    async def _attempt(self, endpoint: str, send: Callable[[], Awaitable[Any]]) -> _Outcome:
+        rejected = self._check_circuit()
+        if rejected is not None:
+            return rejected
+        started_at = await self.limiter.acquire() if self.limiter is not None else None
+        start = time.perf_counter()
+        try:
+            outcome = _Outcome(response=await send(), started=start)
+        except Exception as e:
+            outcome = _Outcome(error=e, started=start)
+        except asyncio.CancelledError:
+            # A hedged attempt that lost, its latency says nothing
+            if started_at is not None:
+                await self.limiter.release(endpoint, started_at, dropped=False, sample=False)
+            raise
+        overloaded, healthy, latency = self._signals(outcome, time.perf_counter() - start)
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.record(healthy)
+        if started_at is not None:
+            await self.limiter.release(endpoint, started_at, overloaded, latency)
+        return outcome
+
+    async def _hedged_attempt(self, endpoint: str, send: Callable[[], Awaitable[Any]]) -> _Outcome:
+        hedge_delay = self._hedge_delay(endpoint)
+        if hedge_delay is None:
+            return await self._attempt(endpoint, send)
+
+        primary = asyncio.ensure_future(self._attempt(endpoint, send))
+        done, _ = await asyncio.wait([primary], timeout=hedge_delay)
+        if done:
+            return primary.result()
+
+        if self.limiter is not None and not self.limiter.has_capacity():
+            # Hedging must not add load beyond the concurrency limit
+            return await primary
+        self._stats.increment("hedged")
+        hedge = asyncio.ensure_future(self._attempt(endpoint, send))
+        pending = {primary, hedge}
+        outcome: Optional[_Outcome] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    outcome = task.result()
+                    if outcome.error is None and outcome.response.status_code < 400:
+                        if task is hedge:
+                            self._stats.increment("hedge_wins")
+                        return outcome
+            return outcome
+        finally:
+            for task in pending:
+                task.cancel()
@@ -0,0 +1,114 @@
+import re
+from typing import Dict, Iterable, List, Tuple
+
+_DURATION_UNITS = {
+    "ms": 0.001,
+    "s": 1,
+    "m": 60,
+    "h": 60 * 60,
+    "d": 60 * 60 * 24,
+    "w": 60 * 60 * 24 * 7,
+    "y": 60 * 60 * 24 * 365,
+}
+_DURATION_PART_RE = re.compile(r"(\d+)(ms|s|m|h|d|w|y)")
+
+
+def parse_duration_seconds(duration: str) -> float:
+    """
+    Convert a Prometheus duration (like a query step: 1h30m, or a float number of seconds) to seconds.
+    """
+    duration = str(duration).strip()
+    try:
+        seconds = float(duration)
+    except ValueError:
+        pos = 0
+        seconds = 0.0
+        for match in _DURATION_PART_RE.finditer(duration):
+            if match.start() != pos:
+                break
+            seconds += int(match.group(1)) * _DURATION_UNITS[match.group(2)]
+            pos = match.end()
+        if pos != len(duration) or pos == 0:
+            raise ValueError(f"Invalid prometheus duration {duration!r}")
+    if seconds <= 0:
+        raise ValueError(f"Invalid prometheus duration {duration!r}")
+    return seconds
+
+
+def format_duration_seconds(seconds: float) -> str:
+    """ Format seconds as a Prometheus duration, e.g. 5400 as 1h30m, and fractions as a float """
+    if not float(seconds).is_integer():
+        return str(seconds)
+    remaining = int(seconds)
+    parts = []
+    for unit in ("d", "h", "m", "s"):
+        count, remaining = divmod(remaining, int(_DURATION_UNITS[unit]))
+        if count:
+            parts.append(f"{count}{unit}")
+    return "".join(parts) or "0s"
+
+
+def normalize_timestamp(value: float) -> float:
+    """ Send integral timestamps as ints, so they are not serialized as 1700000000.0 """
+    return int(value) if float(value).is_integer() else value
+
+
+def split_time_range(
+    start: float, end: float, step_seconds: float, max_points: int
+) -> List[Tuple[float, float]]:
+    """
+    Split [start, end] into consecutive sub-ranges of at most max_points evaluation steps each.
+    Every sub-range starts on the original start + k * step grid, so the server evaluates the
+    exact same timestamps as it would for the whole range.
+    """
+    if max_points <= 0:
+        raise ValueError("max_points must be positive")
+    if end < start:
+        return [(start, end)]
+
+    total_points = int((end - start) // step_seconds) + 1
+    ranges = []
+    for first in range(0, total_points, max_points):
+        last = min(first + max_points, total_points) - 1
+        ranges.append(
+            (
+                normalize_timestamp(start + first * step_seconds),
+                normalize_timestamp(start + last * step_seconds),
+            )
+        )
+    return ranges
+
+
+def _series_key(metric: Dict[str, str]) -> Tuple:
+    return tuple(sorted(metric.items()))
+
+
+def merge_matrix_data(parts: Iterable[Dict]) -> Dict:
+    """
+    Stitch query_range `data` dicts of consecutive time ranges into a single matrix `data` dict.
+    Series are matched by their label set, and samples on shared boundaries are kept only once.
+    """
+    merged: Dict[Tuple, Dict] = {}
+    for part in parts:
+        result_type = part.get("resultType")
+        if result_type != "matrix":
+            raise ValueError(f"Can not merge query_range results of type {result_type}")
+        for series in part.get("result", []):
+            key = _series_key(series.get("metric", {}))
+            target = merged.get(key)
+            if target is None:
+                target = {"metric": series.get("metric", {})}
+                merged[key] = target
+            for samples_key in ("values", "histograms"):
+                if samples_key not in series:
+                    continue
+                samples = target.setdefault(samples_key, [])
+                last_timestamp = float(samples[-1][0]) if samples else None
+                for sample in series[samples_key]:
+                    timestamp = float(sample[0])
+                    if last_timestamp is not None and timestamp <= last_timestamp:
+                        continue
+                    samples.append(sample)
+                    last_timestamp = timestamp
+
+    return {"resultType": "matrix", "result": list(merged.values())}
@@ -0,0 +1,85 @@
+import codecs
+import json
+import re
+from typing import Dict, Iterable, Iterator, List
+
+_RESULT_START_RE = re.compile(r'"result"\s*:\s*\[')
+# A result item (series or vector sample) is an object, so it can only end on `}` followed by `,` or `]`
+_ITEM_END_RE = re.compile(r"\}\s*[,\]]")
+_SEPARATORS = " \t\r\n,"
+# Enough overlap to catch an item end split across two chunks
+_OVERLAP = 64
+
+_decoder = json.JSONDecoder()
+
+
+def iter_result_items(chunks: Iterable[bytes]) -> Iterator[Dict]:
+    """
+    Incrementally parse a Prometheus query response body and yield the items of `data.result`
+    (one series for matrix results) as soon as each item has been fully received.
+    Only the item being parsed is buffered, so memory is bounded by the largest single item
+    rather than by the whole response.
+    """
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    prefix = ""
+    in_result = False
+    # Text of the current item, joined only once a possible end of item has been received
+    pieces: List[str] = []
+    tail = ""
+    # Where the next end-of-item candidate search starts in the joined buffer
+    search_pos = 0
+
+    for chunk in chunks:
+        if not chunk:
+            continue
+        text = text_decoder.decode(chunk)
+
+        if not in_result:
+            prefix += text
+            match = _RESULT_START_RE.search(prefix)
+            if not match:
+                continue
+            text = prefix[match.end():]
+            prefix = ""
+            in_result = True
+
+        pieces.append(text)
+        probe = tail + text
+        tail = probe[-_OVERLAP:]
+        # A lone piece means the text starts on an item boundary, which may also be the end of the list
+        if len(pieces) > 1 and not _ITEM_END_RE.search(probe):
+            continue
+
+        buffer = "".join(pieces)
+        while True:
+            start = 0
+            while start < len(buffer) and buffer[start] in _SEPARATORS:
+                start += 1
+            if start:
+                buffer = buffer[start:]
+                search_pos = max(0, search_pos - start)
+            if not buffer:
+                break
+            if buffer[0] == "]":
+                return
+
+            candidate = _ITEM_END_RE.search(buffer, search_pos)
+            if not candidate:
+                search_pos = max(0, len(buffer) - _OVERLAP)
+                break
+            try:
+                item, end = _decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                # The `}` was inside a string or a nested object, wait for the real end
+                search_pos = candidate.end()
+                continue
+            yield item
+            buffer = buffer[end:]
+            search_pos = 0
+
+        pieces = [buffer] if buffer else []
+        tail = buffer[-_OVERLAP:]
+
+    if not in_result:
+        raise ValueError("Prometheus response does not contain a result list")
+    raise ValueError("Prometheus response ended before the result list was complete")
@@ -1,15 +1,18 @@
 from collections import defaultdict
-from typing import Dict, List
+from typing import TYPE_CHECKING, Dict, List
 from urllib.parse import parse_qs
 
 from requests.sessions import merge_setting
 
 from prometrix.auth import PrometheusAuthorization
-from prometrix.connect.aws_connect import AWSPrometheusConnect
 from prometrix.connect.custom_connect import CustomPrometheusConnect
 from prometrix.models.prometheus_config import (AWSPrometheusConfig,
                                                 PrometheusConfig)
 
+if TYPE_CHECKING:
+    from prometrix.connect.async_custom_connect import \
+        AsyncCustomPrometheusConnect
+
 
 def _parse_query_string(query_string: str) -> Dict[str, List[str]]:
     if not query_string:
@@ -31,6 +34,9 @@ def get_custom_prometheus_connect(
         PrometheusAuthorization.get_authorization_headers(prom_config)
     )
     if isinstance(prom_config, AWSPrometheusConfig):
+        # boto3 / botocore are slow to import, only load them for AWS backends
+        from prometrix.connect.aws_connect import AWSPrometheusConnect
+
         prom = AWSPrometheusConnect(
             access_key=prom_config.access_key,
             secret_key=prom_config.secret_access_key,
@@ -50,3 +56,35 @@ def get_custom_prometheus_connect(
         prom._session.params = merge_setting(prom._session.params, query_string_params)
     prom.config = prom_config
     return prom
+
+
+def get_async_custom_prometheus_connect(
+    prom_config: PrometheusConfig,
+) -> "AsyncCustomPrometheusConnect":
+    from prometrix.connect.async_custom_connect import \
+        AsyncCustomPrometheusConnect
+
+    prom_config.headers.update(
+        PrometheusAuthorization.get_authorization_headers(prom_config)
+    )
+    if isinstance(prom_config, AWSPrometheusConfig):
+        from prometrix.connect.async_aws_connect import \
+            AsyncAWSPrometheusConnect
+
+        prom = AsyncAWSPrometheusConnect(
+            access_key=prom_config.access_key,
+            secret_key=prom_config.secret_access_key,
+            service_name=prom_config.service_name,
+            region=prom_config.aws_region,
+            assume_role_arn=prom_config.assume_role_arn,
+            config=prom_config,
+            token=prom_config.token,
+        )
+    else:
+        prom = AsyncCustomPrometheusConnect(config=prom_config)
+
+    if prom_config.prometheus_url_query_string:
+        prom._client.params = _parse_query_string(
+            prom_config.prometheus_url_query_string
+        )
+    return prom
@@ -0,0 +1,66 @@
+import threading
+import time
+
+import pytest
+
+from benchmarks.fake_prometheus import FakePrometheusServer
+from prometrix import AzurePrometheusConfig, PrometheusAuthorization
+
+
+@pytest.fixture(scope="session")
+def fake_prometheus():
+    """
+    A local synthetic Prometheus (see benchmarks/fake_prometheus.py) serving 20 series of 50 samples, shared by
+    the whole session: compare its `requests` counter before and after.
+    """
+    with FakePrometheusServer(series=20, steps=50) as server:
+        yield server
+
+
+class TokenEndpoint:
+    """ Stands in for PrometheusAuthorization._post_azure_token_endpoint, counting requests per client id """
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def __call__(self, config):
+        with self._lock:
+            self.requests.append(config.azure_client_id)
+            number = len(self.requests)
+        time.sleep(self.delay)
+        return _Response({"access_token": f"{config.azure_client_id}-{number}", "expires_in": "3600"})
+
+
+class _Response:
+    ok = True
+    reason = "OK"
+
+    def __init__(self, body):
+        self.body = body
+
+    def json(self):
+        return self.body
+
+
+@pytest.fixture
+def token_endpoint(monkeypatch):
+    endpoint = TokenEndpoint()
+    monkeypatch.setattr(PrometheusAuthorization, "_post_azure_token_endpoint", classmethod(lambda cls, c: endpoint(c)))
+    monkeypatch.setattr(PrometheusAuthorization, "_azure_tokens", {})
+    monkeypatch.setattr(PrometheusAuthorization, "_identity_locks", {})
+    monkeypatch.setattr(PrometheusAuthorization, "_refreshing", set())
+    return endpoint
+
+
+def azure_config(client_id: str = "client", url: str = "http://localhost:9090") -> AzurePrometheusConfig:
+    return AzurePrometheusConfig(
+        url=url,
+        azure_resource="https://prometheus.monitor.azure.com",
+        azure_metadata_endpoint="",
+        azure_token_endpoint="https://login.example.com/token",
+        azure_client_id=client_id,
+        azure_tenant_id="tenant",
+        azure_client_secret="secret",
+    )
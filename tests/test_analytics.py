@@ -0,0 +1,37 @@
+import pytest
+
+from prometrix import PrometheusQueryResult
+
+np = pytest.importorskip("numpy")
+
+from prometrix.analytics import SeriesMatrix  # noqa: E402
+
+MATRIX = {
+    "resultType": "matrix",
+    "result": [
+        {"metric": {"pod": "a"}, "values": [[0, "1"], [60, "2"], [120, "3"]]},
+        {"metric": {"pod": "b"}, "values": [[60, "5"]]},
+    ],
+}
+
+
+@pytest.mark.parametrize("options", [{}, {"lazy": True}, {"columnar": True}, {"lazy": True, "intern_labels": True}])
+def test_labelled_items(options):
+    result = PrometheusQueryResult(MATRIX, **options)
+    items = result.labelled_items()
+    assert [dict(labels) for labels, _ in items] == [{"pod": "a"}, {"pod": "b"}]
+    # Reading the items does not format a lazy result
+    assert (result._items is not None) == bool(options.get("lazy"))
+
+
+@pytest.mark.parametrize("options", [{}, {"lazy": True}, {"columnar": True}])
+def test_series_matrix_from_result(options):
+    matrix = SeriesMatrix.from_result(PrometheusQueryResult(MATRIX, **options))
+    assert matrix.step == 60
+    assert matrix.timestamps.tolist() == [0, 60, 120]
+    np.testing.assert_array_equal(matrix.values, [[1, 2, 3], [np.nan, 5, np.nan]])
+
+
+def test_labelled_items_of_scalar():
+    with pytest.raises(TypeError):
+        PrometheusQueryResult({"resultType": "scalar", "result": [0, "1"]}).labelled_items()
@@ -0,0 +1,42 @@
+import pytest
+
+from prometrix import PrometheusQueryResult
+
+pa = pytest.importorskip("pyarrow")
+pytest.importorskip("numpy")
+
+from prometrix.arrow import to_arrow_table  # noqa: E402
+
+MATRIX = {
+    "resultType": "matrix",
+    "result": [
+        {"metric": {"__name__": "cpu", "ns": "a", "pod": "p1"}, "values": [[0, "1"], [60, "2"]]},
+        {"metric": {"__name__": "cpu", "ns": "b"}, "values": [[0, "3"], [120, "4"]]},
+    ],
+}
+VECTOR = {
+    "resultType": "vector",
+    "result": [{"metric": {"job": "x"}, "value": [10, "3"]}, {"metric": {"job": "y"}, "value": [10, "4"]}],
+}
+
+
+@pytest.mark.parametrize("options", [{}, {"lazy": True}, {"columnar": True}, {"lazy": True, "intern_labels": True}])
+def test_long_table(options):
+    table = to_arrow_table(PrometheusQueryResult(MATRIX, **options))
+    assert table.to_pydict() == {
+        "__name__": ["cpu"] * 4,
+        "ns": ["a", "a", "b", "b"],
+        "pod": ["p1", "p1", None, None],
+        "timestamp": [0.0, 60.0, 0.0, 120.0],
+        "value": [1.0, 2.0, 3.0, 4.0],
+    }
+
+
+@pytest.mark.parametrize("options", [{}, {"lazy": True}])
+def test_wide_table(options):
+    matrix = to_arrow_table(PrometheusQueryResult(MATRIX, **options), layout="wide")
+    assert matrix.column("timestamp").to_pylist() == [0.0, 60.0, 120.0]
+    assert [column.to_pylist() for column in matrix.columns[1:]] == [[1.0, 2.0, None], [3.0, None, 4.0]]
+
+    vector = to_arrow_table(PrometheusQueryResult(VECTOR, **options), layout="wide")
+    assert vector.to_pydict() == {"timestamp": [10.0], '{job="x"}': [3.0], '{job="y"}': [4.0]}
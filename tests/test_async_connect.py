@@ -0,0 +1,228 @@
+import asyncio
+import functools
+import json
+from datetime import datetime
+from urllib.parse import parse_qs
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from prometheus_api_client import PrometheusApiClientException  # noqa: E402
+
+from benchmarks.fake_prometheus import SigV4Credentials  # noqa: E402
+from benchmarks.fake_prometheus import verify_sigv4
+from prometrix import (AWSPrometheusConfig, PrometheusConfig,  # noqa: E402
+                       get_async_custom_prometheus_connect,
+                       get_custom_prometheus_connect)
+from prometrix.connect import async_custom_connect  # noqa: E402
+from tests.conftest import azure_config  # noqa: E402
+
+START = datetime.fromtimestamp(1_700_000_000)
+END = datetime.fromtimestamp(1_700_000_600)
+MATRIX = {"resultType": "matrix", "result": [{"metric": {"pod": "a"}, "values": [[1_700_000_000, "1"]]}]}
+
+
+class Backend:
+    """ httpx.MockTransport handler recording the requests it answers """
+
+    def __init__(self, respond=None):
+        self.requests = []
+        self.respond = respond or (lambda request: httpx.Response(200, json={"status": "success", "data": MATRIX}))
+
+    def __call__(self, request):
+        self.requests.append(request)
+        return self.respond(request)
+
+    def form(self, index=-1):
+        return {key: values[0] for key, values in parse_qs(self.requests[index].content.decode()).items()}
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    """ Every AsyncClient created by the async connect classes sends its requests to the returned Backend """
+    backend = Backend()
+    client_class = functools.partial(httpx.AsyncClient, transport=httpx.MockTransport(backend))
+    monkeypatch.setattr(async_custom_connect.httpx, "AsyncClient", client_class)
+    return backend
+
+
+def _run(prom, call):
+    async def main():
+        async with prom:
+            return await call(prom)
+
+    return asyncio.run(main())
+
+
+def test_query_range_request(backend):
+    prom = get_async_custom_prometheus_connect(
+        PrometheusConfig(
+            url="http://prometheus:9090",
+            headers={"X-Scope-OrgID": "tenant"},
+            additional_labels={"cluster": "a"},
+            inject_additional_labels=True,
+        )
+    )
+    data = _run(prom, lambda p: p.safe_custom_query_range("up", START, END, "60s", params={"timeout": "5s"}))
+    assert data == MATRIX
+    request = backend.requests[0]
+    assert (request.method, str(request.url)) == ("POST", "http://prometheus:9090/api/v1/query_range")
+    assert request.headers["X-Scope-OrgID"] == "tenant"
+    assert backend.form() == {
+        "query": 'up{cluster="a"}',
+        "start": "1700000000",
+        "end": "1700000600",
+        "step": "60s",
+        "timeout": "5s",
+    }
+
+
+def test_query_range_is_sharded(backend):
+    prom = get_async_custom_prometheus_connect(PrometheusConfig(url="http://prometheus:9090", query_range_shard_points=4))
+    _run(prom, lambda p: p.safe_custom_query_range("up", START, END, "60s"))
+    shards = [(backend.form(i)["start"], backend.form(i)["end"]) for i in range(len(backend.requests))]
+    assert sorted(shards) == [
+        ("1700000000", "1700000180"),
+        ("1700000240", "1700000420"),
+        ("1700000480", "1700000600"),
+    ]
+
+
+def test_errors_are_raised(backend):
+    backend.respond = lambda request: httpx.Response(400, text="bad query")
+    prom = get_async_custom_prometheus_connect(PrometheusConfig(url="http://prometheus:9090"))
+    with pytest.raises(PrometheusApiClientException, match="400"):
+        _run(prom, lambda p: p.safe_custom_query("up{"))
+
+
+def test_url_query_string_is_sent_with_every_request(backend):
+    backend.respond = lambda request: httpx.Response(200, json={"status": "success", "data": ["a", "b"]})
+    prom = get_async_custom_prometheus_connect(
+        PrometheusConfig(url="http://prometheus:9090", prometheus_url_query_string="tenant=a&tenant=b&x=1")
+    )
+    assert dict(prom._client.params.multi_items()) == {"tenant": "b", "x": "1"}
+    assert prom._client.params.get_list("tenant") == ["a", "b"]
+    assert _run(prom, lambda p: p.get_label_values("pod", params={"match[]": "up"})) == ["a", "b"]
+    request = backend.requests[0]
+    assert request.method == "GET"
+    assert request.url.path == "/api/v1/label/pod/values"
+    assert request.url.params.get_list("tenant") == ["a", "b"]
+    assert request.url.params["match[]"] == "up"
+
+
+def test_series_request(backend):
+    series = [{"__name__": "up", "pod": "a"}]
+    backend.respond = lambda request: httpx.Response(200, json={"status": "success", "data": series})
+    prom = get_async_custom_prometheus_connect(PrometheusConfig(url="http://prometheus:9090"))
+    assert _run(prom, lambda p: p.get_series(["up"], START, END, label_matchers={"pod": "a"})) == series
+    assert backend.requests[0].url.path == "/api/v1/series"
+    assert backend.form() == {"match[]": 'up{pod="a"}', "start": "1700000000", "end": "1700000600"}
+
+
+def test_azure_token_refreshed_on_401(backend, token_endpoint):
+    def respond(request):
+        if request.headers["Authorization"] == "Bearer client-1":
+            return httpx.Response(401)
+        return httpx.Response(200, json={"status": "success", "data": MATRIX})
+
+    backend.respond = respond
+    prom = get_async_custom_prometheus_connect(azure_config(url="http://prometheus:9090"))
+    assert _run(prom, lambda p: p.safe_custom_query_range("up", START, END, "60s")) == MATRIX
+    assert [request.headers["Authorization"] for request in backend.requests] == [
+        "Bearer client-1",
+        "Bearer client-2",
+    ]
+    assert token_endpoint.requests == ["client", "client"]
+
+
+def test_first_azure_token_is_fetched_off_the_event_loop(backend, token_endpoint, monkeypatch):
+    threads = []
+    to_thread = asyncio.to_thread
+
+    async def recording_to_thread(func, *args):
+        threads.append(func.__name__)
+        return await to_thread(func, *args)
+
+    monkeypatch.setattr(async_custom_connect.asyncio, "to_thread", recording_to_thread)
+    prom = async_custom_connect.AsyncCustomPrometheusConnect(azure_config(url="http://prometheus:9090"))
+    _run(prom, lambda p: p.safe_custom_query("up"))
+    assert threads == ["get_azure_token"]
+    assert backend.requests[0].headers["Authorization"] == "Bearer client-1"
+
+
+CREDENTIALS = SigV4Credentials("AK", "SK", "us-east-1", "aps")
+
+
+def _aws_config(**kwargs):
+    return AWSPrometheusConfig(
+        url="https://aps.example.com/workspaces/ws",
+        access_key=CREDENTIALS.access_key,
+        secret_access_key=CREDENTIALS.secret_key,
+        aws_region=CREDENTIALS.region,
+        service_name=CREDENTIALS.service_name,
+        **kwargs,
+    )
+
+
+def _headers(request):
+    """ The headers as sent, with their original case """
+    return {name.decode(): value.decode() for name, value in request.headers.raw}
+
+
+def test_aws_requests_are_signed_with_the_merged_url(backend):
+    prom = get_async_custom_prometheus_connect(_aws_config(prometheus_url_query_string="tenant=a b"))
+    _run(prom, lambda p: p.safe_custom_query_range("up", START, END, "60s"))
+    backend.respond = lambda request: httpx.Response(200, json={"status": "success", "data": []})
+    _run(get_async_custom_prometheus_connect(_aws_config()), lambda p: p.get_label_values("pod", {"limit": 5}))
+
+    query_range, label_values = backend.requests
+    assert query_range.url.params["tenant"] == "a b"
+    assert label_values.url.params["limit"] == "5"
+    for request in (query_range, label_values):
+        assert verify_sigv4(CREDENTIALS, request.method, str(request.url), request.content, _headers(request))
+    # A request changed after signing is rejected
+    assert not verify_sigv4(
+        CREDENTIALS, "POST", str(query_range.url), query_range.content + b"&x=1", _headers(query_range)
+    )
+
+
+@pytest.mark.parametrize("disable_ssl", [False, True])
+def test_aws_clients_verify_tls_alike(monkeypatch, disable_ssl):
+    verify = []
+    client_class = httpx.AsyncClient
+
+    def async_client(**kwargs):
+        verify.append(kwargs["verify"])
+        return client_class(**kwargs)
+
+    monkeypatch.setattr(async_custom_connect.httpx, "AsyncClient", async_client)
+    get_async_custom_prometheus_connect(_aws_config(disable_ssl=disable_ssl))
+
+    prom = get_custom_prometheus_connect(_aws_config(disable_ssl=disable_ssl))
+    sent = []
+
+    def send(request, **kwargs):
+        sent.append(kwargs["verify"])
+        raise RuntimeError("not sent")
+
+    monkeypatch.setattr(prom._session, "send", send)
+    for call in (
+        lambda: prom.safe_custom_query("up"),
+        lambda: prom.safe_custom_query_range("up", START, END, "60s"),
+        lambda: prom.get_label_values("pod"),
+        lambda: prom.get_series(["up"]),
+    ):
+        with pytest.raises(Exception):
+            call()
+    assert verify == [not disable_ssl]
+    # requests replaces True with the CA bundle of the environment, if any
+    assert len(sent) == 4
+    assert {value is not False for value in sent} == {not disable_ssl}
+
+
+def test_response_body_is_decoded(backend):
+    payload = json.dumps({"status": "success", "data": {"resultType": "scalar", "result": [1, "2"]}})
+    backend.respond = lambda request: httpx.Response(200, content=payload.encode())
+    prom = get_async_custom_prometheus_connect(PrometheusConfig(url="http://prometheus:9090", json_backend="json"))
+    assert _run(prom, lambda p: p.safe_custom_query("2")) == {"resultType": "scalar", "result": [1, "2"]}
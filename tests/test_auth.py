@@ -0,0 +1,97 @@
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+from prometrix import PrometheusAuthorization, get_custom_prometheus_connect
+from tests.conftest import azure_config
+
+
+def test_first_token_is_fetched_before_returning(token_endpoint):
+    config = azure_config()
+    assert not PrometheusAuthorization.has_azure_token(config)
+    assert PrometheusAuthorization.get_azure_token(config) == "client-1"
+    assert PrometheusAuthorization.has_azure_token(config)
+    # Later calls use the cached token
+    assert PrometheusAuthorization.get_azure_token(config) == "client-1"
+    assert token_endpoint.requests == ["client"]
+
+
+def test_concurrent_first_calls_share_one_request(token_endpoint):
+    token_endpoint.delay = 0.2
+    config = azure_config()
+    tokens = []
+    threads = [
+        threading.Thread(target=lambda: tokens.append(PrometheusAuthorization.get_azure_token(config)))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert tokens == ["client-1"] * 8
+    assert token_endpoint.requests == ["client"]
+
+
+def test_identities_do_not_wait_for_each_other(token_endpoint, monkeypatch):
+    slow_started = threading.Event()
+    release_slow = threading.Event()
+
+    def endpoint(cls, config):
+        if config.azure_client_id == "slow":
+            slow_started.set()
+            release_slow.wait(5)
+        return token_endpoint(config)
+
+    monkeypatch.setattr(PrometheusAuthorization, "_post_azure_token_endpoint", classmethod(endpoint))
+    slow = threading.Thread(target=PrometheusAuthorization.get_azure_token, args=(azure_config("slow"),))
+    slow.start()
+    assert slow_started.wait(5)
+    try:
+        start = time.perf_counter()
+        assert PrometheusAuthorization.get_azure_token(azure_config("fast")).startswith("fast-")
+        assert PrometheusAuthorization.refresh_rejected_token(azure_config("fast"), "fast-1")
+        assert time.perf_counter() - start < 1
+    finally:
+        release_slow.set()
+        slow.join()
+
+
+def test_rejected_token_refreshed_once(token_endpoint):
+    config = azure_config()
+    rejected = PrometheusAuthorization.get_azure_token(config)
+    assert PrometheusAuthorization.refresh_rejected_token(config, rejected)
+    # A second caller rejected with the same token reuses the replacement
+    assert PrometheusAuthorization.refresh_rejected_token(config, rejected)
+    assert PrometheusAuthorization.get_azure_token(config) == "client-2"
+    assert len(token_endpoint.requests) == 2
+
+
+def test_token_near_expiry_is_refreshed_by_the_next_call(token_endpoint, monkeypatch):
+    config = azure_config()
+    assert PrometheusAuthorization.get_azure_token(config) == "client-1"
+    # No timer is left running for the identity
+    assert not [thread for thread in threading.enumerate() if isinstance(thread, threading.Timer)]
+
+    token = PrometheusAuthorization._azure_tokens[PrometheusAuthorization._azure_identity(config)]
+    assert token.expires_on - config.azure_token_refresh_margin == pytest.approx(token.refresh_at, abs=1)
+    monkeypatch.setattr(time, "time", lambda: token.refresh_at + 1)
+    # The still valid token is returned while the refresh runs in the background
+    assert PrometheusAuthorization.get_azure_token(config) == "client-1"
+    for thread in threading.enumerate():
+        if thread.name == "azure-token-refresh":
+            thread.join(5)
+    assert PrometheusAuthorization.get_azure_token(config) == "client-2"
+    assert token_endpoint.requests == ["client", "client"]
+
+
+def test_first_request_is_authorized(token_endpoint, fake_prometheus):
+    seen = []
+    prom = get_custom_prometheus_connect(azure_config(url=fake_prometheus.url))
+    prom._session.hooks["response"].append(lambda r, **kwargs: seen.append(r.request.headers["Authorization"]))
+    prom.safe_custom_query_range(
+        "synthetic_metric", datetime.fromtimestamp(1_700_000_000), datetime.fromtimestamp(1_700_000_600), "60s"
+    )
+    assert seen == ["Bearer client-1"]
+    assert token_endpoint.requests == ["client"]
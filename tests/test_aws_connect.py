@@ -0,0 +1,63 @@
+from datetime import datetime
+
+import pytest
+import requests
+from botocore.credentials import Credentials
+from prometheus_api_client import PrometheusApiClientException
+
+from benchmarks.fake_prometheus import FakePrometheusServer, SigV4Credentials
+from prometrix import AWSPrometheusConfig, get_custom_prometheus_connect
+
+CREDENTIALS = SigV4Credentials("AK", "SK", "us-east-1", "aps")
+START = datetime.fromtimestamp(1_700_000_000)
+END = datetime.fromtimestamp(1_700_000_600)
+
+
+@pytest.fixture(scope="module")
+def amp():
+    """ A fake Amazon Managed Prometheus, rejecting requests not signed with CREDENTIALS """
+    with FakePrometheusServer(series=3, steps=10, sigv4=CREDENTIALS) as server:
+        yield server
+
+
+def _connect(url, **kwargs):
+    return get_custom_prometheus_connect(
+        AWSPrometheusConfig(
+            url=url,
+            access_key=CREDENTIALS.access_key,
+            secret_access_key=CREDENTIALS.secret_key,
+            aws_region=CREDENTIALS.region,
+            service_name=CREDENTIALS.service_name,
+            **kwargs,
+        )
+    )
+
+
+def test_signed_requests_share_one_pooled_connection(amp, monkeypatch):
+    monkeypatch.setattr(requests, "request", lambda *args, **kwargs: pytest.fail("unpooled request"))
+    prom = _connect(amp.url, prometheus_url_query_string="tenant=a")
+    urls = []
+    prom._session.hooks["response"].append(lambda r, **kwargs: urls.append(r.request.url))
+
+    assert prom.safe_custom_query("synthetic_metric")["resultType"] == "vector"
+    for _ in range(3):
+        assert len(prom.safe_custom_query_range("synthetic_metric", START, END, "60s")["result"]) == 3
+    assert prom.get_label_values("label_0")
+    assert len(prom.get_series(["synthetic_metric"])) == 3
+
+    # The session's query string is merged into, and signed with, every request
+    assert len(urls) == 6
+    assert all("tenant=a" in url for url in urls)
+    pools = prom._session.get_adapter(amp.url).poolmanager.pools
+    assert [pools[key].num_connections for key in pools.keys()] == [1]
+
+
+def test_every_request_is_signed_with_the_current_credentials(amp):
+    prom = _connect(amp.url)
+    prom.safe_custom_query("synthetic_metric")
+    # Rotated credentials are picked up by the next request
+    prom._credentials = Credentials("OTHER", "KEY")
+    with pytest.raises(PrometheusApiClientException, match="403"):
+        prom.safe_custom_query("synthetic_metric")
+    prom._credentials = Credentials(CREDENTIALS.access_key, CREDENTIALS.secret_key)
+    assert prom.safe_custom_query("synthetic_metric")["resultType"] == "vector"
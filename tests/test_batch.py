@@ -0,0 +1,87 @@
+import threading
+import time
+from datetime import datetime
+
+from prometrix import (InstantQuery, PrometheusConfig, RangeQuery,
+                       get_custom_prometheus_connect)
+
+START = datetime.fromtimestamp(1_700_000_000)
+END = datetime.fromtimestamp(1_700_000_600)
+
+
+def test_batch_results_in_order(fake_prometheus):
+    prom = get_custom_prometheus_connect(PrometheusConfig(url=fake_prometheus.url))
+    queries = [
+        RangeQuery(query="metric_a", start_time=START, end_time=END, step="60s"),
+        InstantQuery(query="metric_b", params={"time": 1_700_000_000}),
+        RangeQuery(query="metric_c", start_time=START, end_time=END, step="120s"),
+    ]
+    results = prom.safe_custom_query_batch(queries, max_workers=3)
+    assert [(result.index, result.query, result.ok) for result in results] == [
+        (0, "metric_a", True),
+        (1, "metric_b", True),
+        (2, "metric_c", True),
+    ]
+    assert [result.data["resultType"] for result in results] == ["matrix", "vector", "matrix"]
+    assert results[0].data == prom.safe_custom_query_range("metric_a", START, END, "60s")
+    assert len(results[2].data["result"][0]["values"]) == 50
+    assert prom.safe_custom_query_batch([]) == []
+
+
+def test_errors_are_reported_per_query(monkeypatch):
+    prom = get_custom_prometheus_connect(PrometheusConfig(url="http://localhost:9090"))
+
+    def query(query, params=None):
+        if query == "bad":
+            raise ValueError("bad query")
+        return {"resultType": "vector", "result": []}
+
+    monkeypatch.setattr(prom, "safe_custom_query", query)
+    results = prom.safe_custom_query_batch([InstantQuery(query=q) for q in ("a", "bad", "c")])
+    assert [result.ok for result in results] == [True, False, True]
+    assert isinstance(results[1].error, ValueError)
+    assert results[1].data is None
+
+
+def test_concurrency_is_bounded(monkeypatch):
+    prom = get_custom_prometheus_connect(PrometheusConfig(url="http://localhost:9090", batch_max_workers=3))
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def query(query, params=None):
+        with lock:
+            running.append(query)
+            peak.append(len(running))
+        time.sleep(0.02)
+        with lock:
+            running.remove(query)
+        return {"resultType": "vector", "result": []}
+
+    monkeypatch.setattr(prom, "safe_custom_query", query)
+    results = prom.safe_custom_query_batch([InstantQuery(query=str(i)) for i in range(12)])
+    assert all(result.ok for result in results)
+    assert max(peak) == 3
+    # max_workers overrides the config
+    peak.clear()
+    prom.safe_custom_query_batch([InstantQuery(query=str(i)) for i in range(4)], max_workers=1)
+    assert max(peak) == 1
+
+
+def test_results_as_they_complete(monkeypatch):
+    prom = get_custom_prometheus_connect(PrometheusConfig(url="http://localhost:9090"))
+
+    def query(query, params=None):
+        time.sleep(float(query))
+        return {"resultType": "vector", "result": []}
+
+    monkeypatch.setattr(prom, "safe_custom_query", query)
+    results = prom.iter_custom_query_batch([InstantQuery(query="0.3"), InstantQuery(query="0")], max_workers=2)
+    assert [result.index for result in results] == [1, 0]
+
+
+def test_pool_size_from_config():
+    prom = get_custom_prometheus_connect(PrometheusConfig(url="http://localhost:9090", pool_maxsize=32))
+    adapter = prom._session.get_adapter("http://localhost:9090/api/v1/query")
+    assert adapter._pool_maxsize == 32
+    assert adapter._pool_block
@@ -0,0 +1,61 @@
+import math
+from array import array
+from types import SimpleNamespace
+
+import pytest
+
+from prometrix import PrometheusColumnarSeries, PrometheusQueryResult
+from prometrix.models import prometheus_result
+
+SAMPLES = [[1_700_000_000, "1.5"], [1_700_000_060.5, "NaN"], [1_700_000_120, "+Inf"], [1_700_000_180, "-Inf"]]
+MATRIX = {"resultType": "matrix", "result": [{"metric": {"pod": "a"}, "values": SAMPLES}]}
+
+
+def _check_samples(series):
+    assert list(series.timestamps) == [1_700_000_000.0, 1_700_000_060.5, 1_700_000_120.0, 1_700_000_180.0]
+    values = list(series.values)
+    assert values[0] == 1.5
+    assert math.isnan(values[1])
+    assert values[2:] == [math.inf, -math.inf]
+
+
+def test_numpy_buffers():
+    np = pytest.importorskip("numpy")
+    series = PrometheusColumnarSeries({"pod": "a"}, SAMPLES)
+    for buffer in (series.timestamps, series.values):
+        assert isinstance(buffer, np.ndarray)
+        assert buffer.dtype == np.float64
+        assert buffer.flags["C_CONTIGUOUS"]
+    _check_samples(series)
+
+
+def test_array_buffers_without_numpy(monkeypatch):
+    monkeypatch.setattr(prometheus_result, "load_numpy", lambda: None)
+    series = PrometheusColumnarSeries({"pod": "a"}, SAMPLES)
+    assert isinstance(series.timestamps, array) and series.timestamps.typecode == "d"
+    assert isinstance(series.values, array) and series.values.typecode == "d"
+    _check_samples(series)
+    assert len(prometheus_result.to_float64_buffer([])) == 0
+
+
+def test_columnar_result():
+    result = PrometheusQueryResult(MATRIX, columnar=True)
+    series = result.series_list_result[0]
+    assert series["metric"] == {"pod": "a"}
+    _check_samples(SimpleNamespace(**series))
+    assert result.columnar
+
+
+def test_default_result_is_unchanged():
+    series = PrometheusQueryResult(MATRIX).series_list_result[0]
+    assert series == {
+        "metric": {"pod": "a"},
+        "timestamps": [1_700_000_000.0, 1_700_000_060.5, 1_700_000_120.0, 1_700_000_180.0],
+        "values": ["1.5", "NaN", "+Inf", "-Inf"],
+    }
+
+
+def test_vectors_are_not_columnar():
+    vector = {"resultType": "vector", "result": [{"metric": {"pod": "a"}, "value": [1_700_000_000, "2"]}]}
+    result = PrometheusQueryResult(vector, columnar=True)
+    assert result.vector_result == [{"metric": {"pod": "a"}, "value": {"timestamp": 1_700_000_000.0, "value": "2"}}]
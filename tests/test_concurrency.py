@@ -0,0 +1,230 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from prometrix import ResiliencePolicy
+from prometrix.concurrency import (LATENCY_WARMUP_SAMPLES, AdaptiveLimit,
+                                   AsyncConcurrencyLimiter, CircuitBreaker,
+                                   ConcurrencyLimiter)
+from prometrix.exceptions import PrometheusCircuitOpen
+from prometrix.resilience import AsyncResilientSender, ResilientSender
+
+
+def test_adaptive_limit_grows_while_used():
+    limit = AdaptiveLimit(min_limit=1, max_limit=10, initial_limit=4)
+    # Additive increase: about one per `limit` samples
+    for _ in range(4):
+        limit.on_sample("query", time.monotonic(), in_flight=4, dropped=False)
+    assert limit.value == 4
+    limit.on_sample("query", time.monotonic(), in_flight=4, dropped=False)
+    assert limit.value == 5
+    # An idle client does not grow the limit
+    for _ in range(20):
+        limit.on_sample("query", time.monotonic(), in_flight=1, dropped=False)
+    assert limit.value == 5
+    for _ in range(200):
+        limit.on_sample("query", time.monotonic(), in_flight=10, dropped=False)
+    assert limit.value == 10
+
+
+def test_adaptive_limit_decreases_once_per_round_trip():
+    limit = AdaptiveLimit(min_limit=2, max_limit=16)
+    started_before = time.monotonic()
+    limit.on_sample("query", started_before, in_flight=16, dropped=True)
+    assert (limit.value, limit.decreases) == (8, 1)
+    # Requests sent before the decrease do not decrease it again
+    limit.on_sample("query", started_before, in_flight=8, dropped=True)
+    assert limit.value == 8
+    limit.on_sample("query", time.monotonic(), in_flight=8, dropped=True)
+    assert (limit.value, limit.decreases) == (4, 2)
+    for _ in range(5):
+        limit.on_sample("query", time.monotonic(), in_flight=4, dropped=True)
+    assert limit.value == 2
+
+
+def test_adaptive_limit_latency_signal():
+    limit = AdaptiveLimit(min_limit=1, max_limit=10, latency_tolerance=2.0)
+    for _ in range(LATENCY_WARMUP_SAMPLES):
+        limit.on_sample("query", time.monotonic(), in_flight=1, dropped=False, latency=0.1)
+    assert limit.decreases == 0
+    for _ in range(5):
+        limit.on_sample("query", time.monotonic(), in_flight=1, dropped=False, latency=2.0)
+    assert limit.decreases >= 1
+    # Endpoints have separate latency baselines
+    assert "query_range" not in limit._latencies
+
+
+def test_adaptive_limit_bounds():
+    limit = AdaptiveLimit(min_limit=0, max_limit=3, initial_limit=50)
+    assert (limit.min_limit, limit.value) == (1, 3)
+    assert AdaptiveLimit(min_limit=5, max_limit=2).value == 5
+
+
+def test_limiter_blocks_beyond_the_limit():
+    limiter = ConcurrencyLimiter(AdaptiveLimit(min_limit=1, max_limit=2, initial_limit=2))
+    first = limiter.acquire()
+    limiter.acquire()
+    acquired = threading.Event()
+    thread = threading.Thread(target=lambda: (limiter.acquire(), acquired.set()))
+    thread.start()
+    assert not acquired.wait(0.1)
+    assert not limiter.has_capacity()
+    limiter.release("query", first, dropped=False)
+    assert acquired.wait(5)
+    thread.join()
+    assert limiter.stats()["in_flight"] == 2
+
+
+def test_release_without_sample_leaves_the_limit():
+    limit = AdaptiveLimit(min_limit=1, max_limit=10, initial_limit=8)
+    limiter = ConcurrencyLimiter(limit)
+    limiter.release("query", limiter.acquire(), dropped=True, sample=False)
+    assert (limit.value, limit.decreases, limiter.in_flight) == (8, 0, 0)
+    limiter.release("query", limiter.acquire(), dropped=True)
+    assert (limit.value, limit.decreases) == (4, 1)
+
+    async def main():
+        async_limit = AdaptiveLimit(min_limit=1, max_limit=10, initial_limit=8)
+        async_limiter = AsyncConcurrencyLimiter(async_limit)
+        await async_limiter.release("query", await async_limiter.acquire(), dropped=True, sample=False)
+        assert (async_limit.value, async_limiter.in_flight) == (8, 0)
+
+    asyncio.run(main())
+
+
+def test_circuit_breaker_states(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30, name="test")
+    for _ in range(2):
+        breaker.before_request()
+        breaker.record(False)
+    assert breaker.state == CircuitBreaker.CLOSED
+    # A success resets the consecutive failures
+    breaker.record(True)
+    for _ in range(3):
+        breaker.record(False)
+    assert (breaker.state, breaker.opened) == (CircuitBreaker.OPEN, 1)
+    with pytest.raises(PrometheusCircuitOpen, match="test"):
+        breaker.before_request()
+
+    now[0] += 30
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # A single trial request is let through
+    breaker.before_request()
+    with pytest.raises(PrometheusCircuitOpen):
+        breaker.before_request()
+    breaker.record(False)
+    assert (breaker.state, breaker.opened) == (CircuitBreaker.OPEN, 2)
+
+    now[0] += 30
+    breaker.before_request()
+    breaker.record(True)
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_request()
+
+
+class Response:
+    def __init__(self, status_code: int = 200):
+        self.status_code = status_code
+        self.headers = {}
+
+    def close(self):
+        pass
+
+
+def test_sender_rejects_while_the_circuit_is_open():
+    sender = ResilientSender(ResiliencePolicy(circuit_failure_threshold=2, circuit_reset_timeout=60))
+    for _ in range(2):
+        assert sender.send("query", lambda: Response(500)).status_code == 500
+    with pytest.raises(PrometheusCircuitOpen):
+        sender.send("query", lambda: Response(200))
+    stats = sender.stats()
+    assert (stats["rejected"], stats["circuit_opened"]) == (1, 1)
+
+
+def test_sender_decreases_the_limit_on_overload():
+    sender = ResilientSender(ResiliencePolicy(adaptive_concurrency=True, max_concurrency=8), pool_size=8)
+    sender.send("query", lambda: Response(503))
+    stats = sender.stats()
+    assert (stats["concurrency_limit"], stats["concurrency_decreases"], stats["concurrency_in_flight"]) == (4, 1, 0)
+
+
+class RecordingLimiter:
+    """ Wraps a limiter, recording whether each release carried a sample """
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self.samples = []
+
+    def __getattr__(self, name):
+        return getattr(self.limiter, name)
+
+
+def _record_releases(sender):
+    recording = RecordingLimiter(sender.limiter)
+    release = sender.limiter.release
+
+    def record(*args, sample=True, **kwargs):
+        recording.samples.append(sample)
+        return release(*args, sample=sample, **kwargs)
+
+    recording.release = record
+    sender.limiter = recording
+    return recording
+
+
+def _hedging_policy():
+    return ResiliencePolicy(
+        adaptive_concurrency=True,
+        max_concurrency=8,
+        hedge_percentile=90,
+        hedge_min_samples=20,
+        hedge_min_delay=0.01,
+    )
+
+
+def test_hedge_losers_release_without_a_sample():
+    sender = ResilientSender(_hedging_policy(), pool_size=8)
+    for _ in range(20):
+        sender.latencies.observe("query", 0.01)
+    recording = _record_releases(sender)
+    calls = []
+
+    def send():
+        calls.append(1)
+        if len(calls) == 1:
+            time.sleep(0.3)
+        return Response(200)
+
+    sender.send("query", send)
+    deadline = time.monotonic() + 5
+    while len(recording.samples) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # The hedge won, the slow primary completed afterwards
+    assert recording.samples == [True, False]
+    assert sender.limiter.in_flight == 0
+
+
+def test_async_hedge_losers_release_without_a_sample():
+    async def main():
+        sender = AsyncResilientSender(_hedging_policy(), pool_size=8)
+        for _ in range(20):
+            sender.latencies.observe("query", 0.01)
+        recording = _record_releases(sender)
+        calls = []
+
+        async def send():
+            calls.append(1)
+            if len(calls) == 1:
+                await asyncio.sleep(0.3)
+            return Response(200)
+
+        await sender.send("query", send)
+        await asyncio.sleep(0)
+        assert sorted(recording.samples) == [False, True]
+        assert sender.limiter.in_flight == 0
+
+    asyncio.run(main())
@@ -0,0 +1,58 @@
+import logging
+from datetime import datetime
+
+import pytest
+
+from prometrix import PrometheusConfig, get_custom_prometheus_connect
+from prometrix.decoding import (SUPPORTED_ACCEPT_ENCODING,
+                                available_json_backends, get_json_loads)
+
+PAYLOAD = b'{"status":"success","data":{"resultType":"matrix","result":[{"metric":{"pod":"\\u00e9"},"values":[[1.5,"NaN"]]}]}}'
+START = datetime.fromtimestamp(1_700_000_000)
+END = datetime.fromtimestamp(1_700_000_600)
+
+
+@pytest.mark.parametrize("backend", list(available_json_backends()))
+def test_backends_decode_alike(backend):
+    assert get_json_loads(backend)(PAYLOAD) == get_json_loads("json")(PAYLOAD)
+    assert get_json_loads(backend)(PAYLOAD)["data"]["result"][0]["metric"] == {"pod": "é"}
+
+
+def test_auto_picks_the_fastest_installed_backend():
+    backends = available_json_backends()
+    assert list(backends)[-1] == "json"
+    assert get_json_loads("auto") is next(iter(backends.values()))
+
+
+def test_missing_backend_falls_back_to_json(caplog):
+    with caplog.at_level(logging.WARNING):
+        loads = get_json_loads("not-installed")
+        get_json_loads("not-installed")
+    assert loads is get_json_loads("json")
+    # Warned about once
+    assert len([record for record in caplog.records if "not-installed" in record.message]) == 1
+
+
+def test_accept_encoding():
+    assert {"gzip", "deflate"} <= {encoding.strip() for encoding in SUPPORTED_ACCEPT_ENCODING.split(",")}
+    prom = get_custom_prometheus_connect(PrometheusConfig(url="http://localhost:9090"))
+    assert prom._session.headers["Accept-Encoding"] == SUPPORTED_ACCEPT_ENCODING
+    prom = get_custom_prometheus_connect(PrometheusConfig(url="http://localhost:9090", accept_encoding="identity"))
+    assert prom._session.headers["Accept-Encoding"] == "identity"
+
+
+@pytest.mark.parametrize("backend", list(available_json_backends()))
+def test_compressed_responses_are_decoded(fake_prometheus, backend):
+    def fetch(**kwargs):
+        prom = get_custom_prometheus_connect(PrometheusConfig(url=fake_prometheus.url, **kwargs))
+        responses = []
+        prom._session.hooks["response"].append(lambda r, **_: responses.append(r))
+        data = prom.safe_custom_query_range("synthetic_metric", START, END, "60s")
+        return data, responses[0]
+
+    compressed, response = fetch(json_backend=backend)
+    assert response.headers["Content-Encoding"] == "gzip"
+    plain, response = fetch(json_backend="json", accept_encoding="identity")
+    assert "Content-Encoding" not in response.headers
+    assert compressed == plain
+    assert len(compressed["result"]) == 20
@@ -0,0 +1,122 @@
+import socket
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+from prometrix import (ClusterQueryResult, FederatedPrometheusConnect,
+                       PrometheusConfig, ResiliencePolicy)
+from prometrix.federation import merge_cluster_data, tag_result_data
+
+START = datetime.fromtimestamp(1_700_000_000)
+END = datetime.fromtimestamp(1_700_000_600)
+
+
+@pytest.fixture
+def hanging_server():
+    """ Accepts connections and never answers, like a cluster stuck evaluating a query """
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+    connections = []
+    stop = threading.Event()
+
+    def accept():
+        listener.settimeout(0.05)
+        while not stop.is_set():
+            try:
+                connections.append(listener.accept()[0])
+            except socket.timeout:
+                pass
+
+    thread = threading.Thread(target=accept, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:%d" % listener.getsockname()[1]
+    stop.set()
+    thread.join()
+    for connection in connections:
+        connection.close()
+    listener.close()
+
+
+def _federation_threads():
+    return [thread for thread in threading.enumerate() if thread.name.startswith("prometrix-federation")]
+
+
+def test_tag_result_data():
+    vector = {"resultType": "vector", "result": [{"metric": {"pod": "a", "cluster": "own"}, "value": [0, "1"]}]}
+    tagged = tag_result_data(vector, {"cluster": "eu", "region": "west"})
+    # Labels the series already has are kept
+    assert tagged["result"][0]["metric"] == {"pod": "a", "cluster": "own", "region": "west"}
+    assert vector["result"][0]["metric"] == {"pod": "a", "cluster": "own"}
+    assert tag_result_data({"resultType": "scalar", "result": [0, "3"]}, {"cluster": "eu"}) == {
+        "resultType": "vector",
+        "result": [{"metric": {"cluster": "eu"}, "value": [0, "3"]}],
+    }
+
+
+def test_merge_cluster_data():
+    matrix = {"resultType": "matrix", "result": [{"metric": {}, "values": [[0, "1"]]}]}
+    clusters = [
+        ClusterQueryResult(index=0, url="a", labels={"cluster": "a"}, data=matrix),
+        ClusterQueryResult(index=1, url="b", error=TimeoutError()),
+        ClusterQueryResult(index=2, url="c", labels={"cluster": "c"}, data=matrix),
+    ]
+    merged = merge_cluster_data(clusters, "vector")
+    assert merged["resultType"] == "matrix"
+    assert [item["metric"] for item in merged["result"]] == [{"cluster": "a"}, {"cluster": "c"}]
+    assert merge_cluster_data(clusters[1:2], "vector") == {"resultType": "vector", "result": []}
+    vector = {"resultType": "vector", "result": []}
+    with pytest.raises(ValueError):
+        merge_cluster_data(clusters + [ClusterQueryResult(index=3, url="d", data=vector)], "vector")
+
+
+def test_fan_out_merges_tagged_results(fake_prometheus):
+    federated = FederatedPrometheusConnect(
+        [
+            PrometheusConfig(url=fake_prometheus.url, additional_labels={"cluster": "eu"}),
+            PrometheusConfig(url=fake_prometheus.url, additional_labels={"cluster": "us"}),
+        ]
+    )
+    answer = federated.safe_custom_query_range("synthetic_metric", START, END, "60s", lazy=True)
+    assert not answer.partial and answer.errors == {}
+    assert answer.result.lazy
+    assert len(answer.result) == 40
+    assert {labels["cluster"] for labels in answer.result.labels()} == {"eu", "us"}
+    assert [cluster.index for cluster in answer.clusters] == [0, 1]
+    assert all(cluster.duration is not None for cluster in answer.clusters)
+
+
+def test_slow_cluster_is_reported_and_its_request_ends(fake_prometheus, hanging_server):
+    federated = FederatedPrometheusConnect(
+        [
+            PrometheusConfig(url=fake_prometheus.url, additional_labels={"cluster": "fast"}),
+            PrometheusConfig(url=hanging_server, additional_labels={"cluster": "slow"}),
+        ],
+        cluster_timeout=0.3,
+    )
+    sent = []
+    federated.clients[0]._session.hooks["response"].append(lambda r, **kwargs: sent.append(r.request.body))
+
+    start = time.monotonic()
+    answer = federated.safe_custom_query("synthetic_metric")
+    assert time.monotonic() - start < 1
+    assert answer.partial
+    assert isinstance(answer.errors[hanging_server], TimeoutError)
+    assert {labels["cluster"] for labels in answer.result.labels()} == {"fast"}
+    # The timeout is passed to Prometheus too
+    assert "timeout=0.3" in sent[0]
+
+    # The request to the slow cluster does not outlive the timeout for long
+    deadline = time.monotonic() + 2
+    while _federation_threads() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert _federation_threads() == []
+
+
+def test_client_timeouts_are_capped():
+    config = PrometheusConfig(url="http://localhost:9090", resilience=ResiliencePolicy(read_timeout=60))
+    federated = FederatedPrometheusConnect([config, PrometheusConfig(url="http://localhost:9091")], cluster_timeout=5)
+    assert [client._timeout for client in federated.clients] == [(5, 5), (5, 5)]
+    assert FederatedPrometheusConnect([PrometheusConfig(url="http://x")]).clients[0]._timeout == (None, None)
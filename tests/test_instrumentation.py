@@ -0,0 +1,103 @@
+import time
+
+from prometrix import (MetricsCollector, PrometheusConfig, RequestEvent,
+                       ResiliencePolicy, get_custom_prometheus_connect)
+from prometrix.instrumentation import count_series_and_samples, track_request
+from prometrix.resilience import ResilientSender
+
+
+class Response:
+    def __init__(self, status_code: int, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def close(self):
+        pass
+
+
+def _event(duration: float, query: str) -> RequestEvent:
+    event = RequestEvent("PrometheusConfig", "query", query)
+    event.duration = duration
+    event.status_code = 200
+    return event
+
+
+def test_phases_exclude_earlier_attempts_and_backoff():
+    sender = ResilientSender(ResiliencePolicy(max_retries=1, backoff_base=0.2, backoff_max=0.2))
+    responses = iter([Response(503, {"Retry-After": "0.2"}), Response(200)])
+
+    def send():
+        time.sleep(0.1)
+        return next(responses)
+
+    events = []
+    with track_request([events.append], "PrometheusConfig", "query", "up") as event:
+        response = sender.send("query", send)
+        # The HTTP library measured the headers of the final attempt after 0.1s
+        event.response_received(response.status_code, 100, headers_seconds=0.1)
+
+    assert events == [event]
+    assert event.retries == 1
+    assert 0.2 <= event.phases["backoff"] < 0.3
+    assert 0.09 <= event.phases["wait"] <= 0.1
+    # Only the time after the final attempt's headers, not the first attempt nor the backoff
+    assert event.phases["download"] < 0.05
+    assert event.duration >= 0.4
+
+
+def test_phases_without_resilience_layer():
+    with track_request([], "PrometheusConfig", "query") as event:
+        time.sleep(0.05)
+        event.response_received(200, 10, headers_seconds=0.01)
+    assert 0.04 <= event.phases["download"] < 0.1
+    assert "backoff" not in event.phases
+
+
+def test_slow_queries_keeps_the_slowest():
+    collector = MetricsCollector(slow_query_seconds=1, slow_query_log_size=3)
+    for index, duration in enumerate([5, 1.5, 0.5, 9, 2, 7, 3]):
+        collector(_event(duration, f"q{index}"))
+    slow = collector.slow_queries()
+    assert [entry["duration"] for entry in slow] == [9, 7, 5]
+    assert [entry["query"] for entry in slow] == ["q3", "q5", "q0"]
+    assert collector.snapshot()["slow_queries"] == slow
+    collector.reset()
+    assert collector.slow_queries() == []
+
+
+def test_collector_counters():
+    collector = MetricsCollector()
+    event = _event(0.2, "up")
+    event.response_bytes, event.series, event.samples, event.retries = 100, 2, 20, 1
+    event.add_phase("wait", 0.1)
+    collector(event)
+    collector(event)
+    snapshot = collector.snapshot()
+    assert snapshot["requests"] == [{"backend": "PrometheusConfig", "endpoint": "query", "status": "200", "count": 2}]
+    assert snapshot["totals"][0] == {
+        "backend": "PrometheusConfig",
+        "endpoint": "query",
+        "response_bytes": 200,
+        "series": 4,
+        "samples": 40,
+        "retries": 2,
+    }
+    assert snapshot["latency_seconds"][0]["count"] == 2
+    assert snapshot["phase_seconds"][0]["phase"] == "wait"
+
+
+def test_count_series_and_samples():
+    matrix = {"resultType": "matrix", "result": [{"values": [1, 2]}, {"histograms": [1]}]}
+    assert count_series_and_samples(matrix) == (2, 3)
+    assert count_series_and_samples({"resultType": "vector", "result": [{}, {}]}) == (2, 2)
+    assert count_series_and_samples([{"__name__": "up"}]) == (1, None)
+    assert count_series_and_samples(["a", "b"]) == (None, None)
+
+
+def test_listener_sees_client_requests(fake_prometheus):
+    prom = get_custom_prometheus_connect(PrometheusConfig(url=fake_prometheus.url))
+    events = []
+    prom.add_request_listener(events.append)
+    prom.safe_custom_query("synthetic_metric")
+    assert [(event.endpoint, event.status_code, event.series) for event in events] == [("query", 200, 20)]
+    assert set(events[0].phases) >= {"wait", "download", "decode"}
@@ -0,0 +1,83 @@
+import gc
+import pickle
+
+import pytest
+
+from prometrix import (LabelSet, PrometheusColumnarSeries,
+                       PrometheusQueryResult, PrometheusSeries, intern_labels,
+                       join_results)
+from prometrix.labels import interned_label_sets_count
+
+
+def _matrix(name, pods):
+    return {
+        "resultType": "matrix",
+        "result": [{"metric": {"__name__": name, "pod": pod}, "values": [[0, "1"]]} for pod in pods],
+    }
+
+
+def test_label_set_is_an_immutable_hashable_dict():
+    labels = LabelSet([("pod", "a"), ("namespace", "default")])
+    assert labels == {"namespace": "default", "pod": "a"}
+    assert hash(labels) == hash(LabelSet([("namespace", "default"), ("pod", "a")]))
+    assert {labels: 1}[LabelSet([("namespace", "default"), ("pod", "a")])] == 1
+    for mutate in (lambda: labels.__setitem__("pod", "b"), lambda: labels.pop("pod"), labels.clear):
+        with pytest.raises(TypeError):
+            mutate()
+    assert pickle.loads(pickle.dumps(labels)) == labels
+
+
+def test_intern_labels_shares_storage():
+    first = intern_labels({"pod": "api-" + str(1), "namespace": "default"})
+    second = intern_labels({"namespace": "default", "pod": "api-1"})
+    assert first is second
+    assert intern_labels(first) is first
+    # Names and values are interned strings
+    other = intern_labels({"pod": "api-" + str(1), "job": "x"})
+    assert other["pod"] is first["pod"]
+
+
+def test_unused_label_sets_are_released():
+    gc.collect()
+    before = interned_label_sets_count()
+    labels = intern_labels({"released": "yes"})
+    assert interned_label_sets_count() == before + 1
+    del labels
+    gc.collect()
+    assert interned_label_sets_count() == before
+
+
+def test_project():
+    labels = intern_labels({"__name__": "cpu", "pod": "a", "namespace": "default"})
+    assert labels.project(on=["pod"]) is intern_labels({"pod": "a"})
+    assert labels.project(ignoring=["__name__"]) == {"pod": "a", "namespace": "default"}
+
+
+@pytest.mark.parametrize("options", [{}, {"lazy": True}, {"columnar": True}])
+def test_results_share_label_sets(options):
+    cpu = PrometheusQueryResult(_matrix("cpu", ["a", "b"]), intern_labels=True, **options)
+    again = PrometheusQueryResult(_matrix("cpu", ["b", "a"]), intern_labels=True, **options)
+    assert isinstance(cpu[0]["metric"], LabelSet)
+    assert cpu[0]["metric"] is again[1]["metric"]
+    # Without the flag labels stay plain dicts
+    assert type(PrometheusQueryResult(_matrix("cpu", ["a"]), **options)[0]["metric"]) is dict
+
+
+@pytest.mark.parametrize("series_class", [PrometheusSeries, PrometheusColumnarSeries])
+def test_series_intern_labels(series_class):
+    series = series_class({"pod": "a"}, [[0, "1"]], intern_labels=True)
+    assert series.metric is intern_labels({"pod": "a"})
+    assert series.to_dict()["metric"] is series.metric
+    assert type(series_class({"pod": "a"}, [[0, "1"]]).metric) is dict
+
+
+def test_join_results():
+    cpu = PrometheusQueryResult(_matrix("cpu", ["a", "b", "c"]), intern_labels=True)
+    memory = PrometheusQueryResult(_matrix("memory", ["b", "a"]))
+    joined = join_results(cpu, memory)
+    assert set(joined) == {intern_labels({"pod": "a"}), intern_labels({"pod": "b"})}
+    cpu_item, memory_item = joined[intern_labels({"pod": "a"})]
+    assert (cpu_item["metric"]["__name__"], memory_item["metric"]["__name__"]) == ("cpu", "memory")
+    assert join_results() == {}
+    with pytest.raises(ValueError):
+        cpu.index_by_labels(on=[])
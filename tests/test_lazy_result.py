@@ -0,0 +1,88 @@
+import pytest
+
+from prometrix import PrometheusQueryResult
+from prometrix.promql import LabelMatcher
+
+MATRIX = {
+    "resultType": "matrix",
+    "result": [
+        {"metric": {"namespace": "default", "pod": f"api-{i}"}, "values": [[0, str(i)], [60, str(i + 1)]]}
+        for i in range(3)
+    ]
+    + [{"metric": {"namespace": "kube-system", "pod": "dns"}, "values": [[0, "9"]]}],
+}
+VECTOR = {
+    "resultType": "vector",
+    "result": [{"metric": {"pod": "a"}, "value": [0, "1"]}, {"metric": {"pod": "b"}, "value": [0, "2"]}],
+}
+
+
+@pytest.fixture
+def formatted(monkeypatch):
+    """ The items formatted so far, by their pod label """
+    pods = []
+    format_series_item = PrometheusQueryResult._format_series_item
+    format_vector_item = PrometheusQueryResult._format_vector_item
+
+    def series_item(self, item):
+        pods.append(item["metric"]["pod"])
+        return format_series_item(self, item)
+
+    def vector_item(self, item):
+        pods.append(item["metric"]["pod"])
+        return format_vector_item(self, item)
+
+    monkeypatch.setattr(PrometheusQueryResult, "_format_series_item", series_item)
+    monkeypatch.setattr(PrometheusQueryResult, "_format_vector_item", vector_item)
+    return pods
+
+
+def test_labels_len_and_filter_do_not_format(formatted):
+    expected = PrometheusQueryResult(MATRIX).series_list_result
+    formatted.clear()
+    result = PrometheusQueryResult(MATRIX, lazy=True)
+    assert len(result) == 4
+    assert [labels["pod"] for labels in result.labels()] == ["api-0", "api-1", "api-2", "dns"]
+    default = result.filter('{namespace="default", pod=~"api-[12]"}')
+    assert len(default) == 2
+    assert len(result.filter({"namespace": "kube-system"})) == 1
+    assert len(result.filter([LabelMatcher("pod", "!=", "dns")])) == 3
+    assert formatted == []
+    # Indexing formats only the accessed items
+    assert default[0] == expected[1]
+    assert [series["metric"]["pod"] for series in result[2:]] == ["api-2", "dns"]
+    assert formatted == ["api-1", "api-2", "dns"]
+
+
+def test_lazy_result_matches_eager(formatted):
+    for data in (MATRIX, VECTOR):
+        lazy, eager = PrometheusQueryResult(data, lazy=True), PrometheusQueryResult(data)
+        assert dict(lazy) == dict(eager)
+        assert repr(lazy) == repr(eager)
+        assert lazy[-1] == eager[-1]
+    # Accessing the full result formats every item once, then keeps them
+    formatted.clear()
+    result = PrometheusQueryResult(MATRIX, lazy=True)
+    result.series_list_result
+    result.series_list_result
+    result[0]
+    assert formatted == ["api-0", "api-1", "api-2", "dns"]
+
+
+def test_filter_keeps_the_options():
+    result = PrometheusQueryResult(MATRIX, lazy=True, columnar=True).filter({"pod": "dns"})
+    assert (result.lazy, result.columnar) == (True, True)
+    assert list(result[0]["values"]) == [9.0]
+    # Filtering an already formatted result shares the formatted items
+    eager = PrometheusQueryResult(VECTOR)
+    assert eager.filter({"pod": "b"}).vector_result[0] is eager.vector_result[1]
+
+
+def test_scalar_and_string_results():
+    scalar = PrometheusQueryResult({"resultType": "scalar", "result": [0, "1"]}, lazy=True)
+    assert scalar.scalar_result == {"timestamp": 0.0, "value": "1"}
+    assert scalar
+    with pytest.raises(TypeError):
+        len(scalar)
+    with pytest.raises(TypeError):
+        list(scalar.labels())
@@ -0,0 +1,185 @@
+import math
+
+import pytest
+
+from prometrix import (PrometheusConfig, get_custom_prometheus_connect,
+                       metadata_cache)
+from prometrix.metadata_cache import MetadataCache, _SeriesEntry
+from prometrix.promql import parse_series_selector
+
+SERIES = [
+    {"__name__": "up", "job": "api", "pod": "api-1"},
+    {"__name__": "up", "job": "api", "pod": "api-2"},
+    {"__name__": "up", "job": "db", "pod": "db-1"},
+]
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Fetcher:
+    def __init__(self, value):
+        self.value = value
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.value
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(metadata_cache.time, "monotonic", clock)
+    return clock
+
+
+def test_label_values_ttl(clock):
+    cache = MetadataCache(ttl_seconds=60)
+    fetch = Fetcher(["a", "b"])
+    assert cache.get_label_values("pod", None, fetch) == ["a", "b"]
+    clock.now += 59
+    assert cache.get_label_values("pod", None, fetch) == ["a", "b"]
+    assert fetch.calls == 1
+    clock.now += 1
+    cache.get_label_values("pod", None, fetch)
+    assert fetch.calls == 2
+    assert cache.stats() == {"hits": 1, "misses": 2, "evictions": 0, "entries": 1}
+
+
+def test_label_values_are_keyed_by_params(clock):
+    cache = MetadataCache(ttl_seconds=60)
+    fetch = Fetcher(["a"])
+    cache.get_label_values("pod", {"start": 1}, fetch)
+    cache.get_label_values("pod", {"start": "1"}, fetch)
+    cache.get_label_values("pod", {"start": 2}, fetch)
+    cache.get_label_values("job", {"start": 2}, fetch)
+    assert fetch.calls == 3
+
+
+def test_callers_get_copies(clock):
+    cache = MetadataCache(ttl_seconds=60)
+    cache.get_label_values("pod", None, Fetcher(["a"])).append("mutated")
+    assert cache.get_label_values("pod", None, Fetcher(None)) == ["a"]
+
+
+def test_invalidation(clock):
+    cache = MetadataCache(ttl_seconds=60)
+    pods, jobs, series = Fetcher(["a"]), Fetcher(["api"]), Fetcher(SERIES)
+    cache.get_label_values("pod", None, pods)
+    cache.get_label_values("job", None, jobs)
+    cache.get_series(["up"], None, None, None, series)
+
+    cache.invalidate_label_values("pod")
+    cache.get_label_values("pod", None, pods)
+    cache.get_label_values("job", None, jobs)
+    assert (pods.calls, jobs.calls) == (2, 1)
+
+    cache.invalidate_label_values()
+    cache.get_label_values("pod", None, pods)
+    cache.get_label_values("job", None, jobs)
+    cache.get_series(["up"], None, None, None, series)
+    assert (pods.calls, jobs.calls, series.calls) == (3, 2, 1)
+
+    cache.invalidate_series()
+    cache.get_series(["up"], None, None, None, series)
+    assert series.calls == 2
+
+
+def test_lru_eviction(clock):
+    cache = MetadataCache(ttl_seconds=60, max_entries=2)
+    fetch = Fetcher(["a"])
+    cache.get_label_values("a", None, fetch)
+    cache.get_label_values("b", None, fetch)
+    cache.get_label_values("a", None, fetch)
+    cache.get_label_values("c", None, fetch)
+    assert cache.stats()["evictions"] == 1
+    assert fetch.calls == 3
+    cache.get_label_values("a", None, fetch)
+    assert fetch.calls == 3
+    cache.get_label_values("b", None, fetch)
+    assert fetch.calls == 4
+
+
+def _entry(selectors, start=0.0, end=100.0):
+    return _SeriesEntry([], math.inf, [parse_series_selector(s) for s in selectors], start, end)
+
+
+def test_covers():
+    entry = _entry(['up{job="api"}', "node_load1"])
+    narrower = parse_series_selector('up{job="api", pod=~"api-.*"}')
+    assert entry.covers([narrower], 0, 100)
+    assert entry.covers([narrower, parse_series_selector('node_load1{instance="a"}')], 0, 100)
+    # Wider selector, other selector, or another time range, even a narrower one
+    assert not entry.covers([parse_series_selector("up")], 0, 100)
+    assert not entry.covers([narrower, parse_series_selector("other")], 0, 100)
+    assert not entry.covers([narrower], -1, 100)
+    assert not entry.covers([narrower], 0, 101)
+    assert not entry.covers([narrower], 10, 90)
+    # Entries whose selectors could not be parsed only serve exact hits
+    assert not _SeriesEntry([], math.inf, None, 0, 100).covers([narrower], 0, 100)
+
+
+def test_series_served_from_a_wider_lookup(clock):
+    cache = MetadataCache(ttl_seconds=60)
+    fetch = Fetcher(SERIES)
+    assert cache.get_series(["up"], 0, 1000, None, fetch) == SERIES
+    narrower = cache.get_series(['up{job="api"}', 'up{pod="db-1"}'], 0, 1000, None, Fetcher(None))
+    assert narrower == SERIES
+    assert cache.get_series(['up{pod=~"api-.*"}'], 0, 1000, None, Fetcher(None)) == SERIES[:2]
+    assert cache.stats()["hits"] == 2
+
+    # Over another time range, or with different params, the lookup is sent
+    other = Fetcher([])
+    cache.get_series(['up{job="api"}'], 0, 2000, None, other)
+    cache.get_series(['up{job="api"}'], 0, 1000, {"extra": 1}, other)
+    assert other.calls == 2
+    # Unbounded lookups only serve unbounded ones
+    unbounded = Fetcher(SERIES)
+    cache.get_series(["up"], None, None, {"x": 1}, unbounded)
+    assert cache.get_series(['up{job="db"}'], None, None, {"x": 1}, Fetcher(None)) == SERIES[2:]
+    assert unbounded.calls == 1
+
+
+def test_wider_time_range_does_not_serve_a_narrower_window(clock):
+    cache = MetadataCache(ttl_seconds=60)
+    cache.get_series(["up"], 0, 1000, None, Fetcher(SERIES))
+    # Only the api pods have samples in the last 100 seconds
+    narrow = Fetcher(SERIES[:2])
+    assert cache.get_series(['up{job="api"}'], 900, 1000, None, narrow) == SERIES[:2]
+    assert cache.get_series(["up"], 900, 1000, None, narrow) == SERIES[:2]
+    assert narrow.calls == 2
+    assert cache.stats()["hits"] == 0
+
+
+def test_limited_series_lookups_are_not_reused(clock):
+    cache = MetadataCache(ttl_seconds=60)
+    cache.get_series(["up"], 0, 1000, {"limit": 1}, Fetcher(SERIES[:1]))
+    fetch = Fetcher(SERIES[:2])
+    cache.get_series(['up{job="api"}'], 0, 1000, {"limit": 1}, fetch)
+    assert fetch.calls == 1
+    # The exact same limited lookup is still cached
+    cache.get_series(["up"], 0, 1000, {"limit": 1}, fetch)
+    assert fetch.calls == 1
+
+
+def test_expired_wider_lookup_is_not_used(clock):
+    cache = MetadataCache(ttl_seconds=60)
+    cache.get_series(["up"], 0, 1000, None, Fetcher(SERIES))
+    clock.now += 60
+    fetch = Fetcher(SERIES[:2])
+    assert cache.get_series(['up{job="api"}'], 0, 1000, None, fetch) == SERIES[:2]
+    assert fetch.calls == 1
+
+
+def test_client_uses_the_metadata_cache(fake_prometheus):
+    prom = get_custom_prometheus_connect(PrometheusConfig(url=fake_prometheus.url, metadata_cache_ttl="5m"))
+    requests_before = fake_prometheus.requests
+    first = prom.get_label_values("pod")
+    assert prom.get_label_values("pod") == first
+    assert fake_prometheus.requests - requests_before == 1
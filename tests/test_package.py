@@ -0,0 +1,22 @@
+import subprocess
+import sys
+
+import prometrix
+
+
+def test_all_lists_every_lazy_import():
+    assert sorted(prometrix.__all__) == sorted(prometrix._LAZY_IMPORTS)
+    for name in prometrix.__all__:
+        assert getattr(prometrix, name) is not None
+
+
+def _loaded_modules(statement, modules):
+    probe = f"import sys\n{statement}\nprint(sorted(name for name in {modules!r} if name in sys.modules))"
+    return subprocess.run([sys.executable, "-c", probe], check=True, capture_output=True, text=True).stdout.strip()
+
+
+def test_entry_points_load_only_what_they_need():
+    heavy = ("boto3", "botocore", "httpx", "numpy", "pydantic", "requests")
+    assert _loaded_modules("import prometrix", heavy) == "[]"
+    assert _loaded_modules("from prometrix import PrometheusQueryResult", heavy) == "[]"
+    assert _loaded_modules("from prometrix import get_custom_prometheus_connect", heavy) == "['pydantic', 'requests']"
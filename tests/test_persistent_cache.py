@@ -0,0 +1,80 @@
+from prometrix import PrometheusConfig, get_custom_prometheus_connect
+from prometrix.persistent_cache import (DEFAULT_PERSISTENT_CACHE_MAX_BYTES,
+                                        PersistentRangeQueryCache)
+from tests.test_range_cache import Backend
+
+STEP = 60
+
+
+def _query(cache, backend, start, end, key="key"):
+    return cache.query_range(key, start, end, STEP, backend)
+
+
+def test_history_is_shared_across_instances(tmp_path):
+    path = str(tmp_path / "cache" / "range.sqlite")
+    backend = Backend()
+    first = PersistentRangeQueryCache(path, max_bytes=10**7)
+    _query(first, backend, 1200, 2400)
+    first.close()
+
+    second = PersistentRangeQueryCache(path, max_bytes=10**7)
+    result = _query(second, backend, 600, 3000)
+    # Only the head and tail missing from the earlier run are fetched
+    assert backend.calls == [(1200, 2400), (600, 1140), (2460, 3000)]
+    assert result == Backend()(600, 3000)
+    stats = second.stats()
+    assert (stats["partial_hits"], stats["entries"]) == (1, 1)
+    second.close()
+
+
+def test_byte_budget_applies_to_entries_of_earlier_runs(tmp_path):
+    path = str(tmp_path / "range.sqlite")
+    backend = Backend()
+    cache = PersistentRangeQueryCache(path, max_bytes=10**7)
+    for key in ("a", "b", "c"):
+        _query(cache, backend, 0, 600, key=key)
+    entry_bytes = cache.stats()["bytes"] // 3
+    cache.close()
+
+    cache = PersistentRangeQueryCache(path, max_bytes=int(entry_bytes * 1.5))
+    assert cache.stats()["entries"] == 1
+    assert cache.evictions == 2
+    backend.calls.clear()
+    # The most recently used entry is kept
+    _query(cache, backend, 0, 600, key="c")
+    assert backend.calls == []
+    cache.close()
+
+
+def test_max_age_eviction(tmp_path, monkeypatch):
+    now = [1_700_000_000.0]
+    monkeypatch.setattr("prometrix.persistent_cache.time.time", lambda: now[0])
+    path = str(tmp_path / "range.sqlite")
+    backend = Backend()
+    cache = PersistentRangeQueryCache(path, max_bytes=10**7, max_age_seconds=3600)
+    _query(cache, backend, 0, 600, key="old")
+    now[0] += 1800
+    _query(cache, backend, 0, 600, key="recent")
+    now[0] += 1800 + 1
+    # "old" has not been used for over an hour, "recent" still hits
+    _query(cache, backend, 0, 600, key="recent")
+    _query(cache, backend, 0, 600, key="old")
+    assert backend.calls == [(0, 600), (0, 600), (0, 600)]
+    assert cache.evictions == 1
+    cache.close()
+
+    # Expired entries of earlier runs are dropped when the file is opened
+    now[0] += 7200
+    cache = PersistentRangeQueryCache(path, max_bytes=10**7, max_age_seconds=3600)
+    assert cache.stats()["entries"] == 0
+    assert cache.evictions == 2
+    cache.close()
+
+
+def test_range_cache_path_alone_enables_the_persistent_cache(tmp_path):
+    prom = get_custom_prometheus_connect(
+        PrometheusConfig(url="http://localhost:9090", range_cache_path=str(tmp_path / "range.sqlite"))
+    )
+    assert isinstance(prom.range_cache, PersistentRangeQueryCache)
+    assert prom.range_cache.max_bytes == DEFAULT_PERSISTENT_CACHE_MAX_BYTES
+    prom.range_cache.close()
@@ -0,0 +1,101 @@
+from datetime import datetime
+
+import pytest
+
+from prometrix import (OverBudgetAction, PrometheusConfig,
+                       get_custom_prometheus_connect)
+from prometrix.exceptions import QueryBudgetExceeded
+from prometrix.planner import count_points, plan_range
+
+DAY = 86400
+
+
+def _plan(step="60s", series=10, sample_budget=None, max_points=11000, action=OverBudgetAction.WIDEN_STEP):
+    return plan_range(
+        query="up",
+        start=0,
+        end=DAY,
+        step=step,
+        series=series,
+        base_step="5m",
+        sample_budget=sample_budget,
+        max_points_per_series=max_points,
+        action=action,
+    )
+
+
+def test_count_points():
+    assert count_points(0, 600, 60) == 11
+    assert count_points(0, 599, 60) == 10
+    assert count_points(0, 0, 60) == 1
+    assert count_points(10, 0, 60) == 0
+
+
+def test_query_within_the_limits_runs_as_requested():
+    plan = _plan(step="5m", sample_budget=10_000)
+    assert (plan.action, plan.step, plan.points_per_series) == ("run", "5m", 289)
+    assert plan.estimated_samples == 2890
+    assert _plan(series=None).estimated_samples is None
+
+
+def test_step_is_widened_to_a_multiple_of_the_base_step():
+    # 1441 points of 10 series exceed a 5000 samples budget, 500 points per series fit
+    plan = _plan(sample_budget=5000)
+    assert plan.action == "widen_step"
+    assert plan.step == "5m"
+    assert plan.points_per_series == 289
+    plan = _plan(sample_budget=1000)
+    assert plan.step == "15m"
+    assert plan.points_per_series <= 100
+    assert plan.requested_step == "60s"
+    # The points per series limit applies without a budget
+    assert _plan(step="1s", max_points=11000).action == "widen_step"
+
+
+def test_shard():
+    plan = _plan(sample_budget=5000, action=OverBudgetAction.SHARD)
+    assert (plan.action, plan.step, plan.shard_points, plan.shards) == ("shard", "60s", 500, 3)
+
+
+def test_reject():
+    assert _plan(sample_budget=5000, action=OverBudgetAction.REJECT).action == "reject"
+    # Too many series for even one point each
+    plan = _plan(series=100, sample_budget=50)
+    assert plan.action == "reject"
+    assert "single point" in plan.reason
+
+
+def test_client_plans_with_the_estimated_series(fake_prometheus, monkeypatch):
+    prom = get_custom_prometheus_connect(
+        PrometheusConfig(url=fake_prometheus.url, query_sample_budget=2000, query_step="2m")
+    )
+    start, end = datetime.fromtimestamp(1_700_000_000), datetime.fromtimestamp(1_700_000_000 + 6 * 3600)
+    # A plain selector is estimated with a series lookup, the fake server has 20 series
+    plan = prom.plan_query_range("synthetic_metric", start, end, "60s")
+    assert plan.series == 20
+    assert (plan.action, plan.step) == ("widen_step", "4m")
+    # Other queries with a count() instant query at the end of the range
+    queries = []
+
+    def count_query(query, params=None):
+        queries.append((query, params["time"]))
+        return {"resultType": "vector", "result": [{"metric": {}, "value": [params["time"], "7"]}]}
+
+    monkeypatch.setattr(prom, "safe_custom_query", count_query)
+    assert prom.plan_query_range("rate(synthetic_metric[5m])", start, end, "60s").series == 7
+    assert queries == [("count(rate(synthetic_metric[5m]))", round(end.timestamp()))]
+    monkeypatch.undo()
+
+    plan, data = prom.planned_custom_query_range("synthetic_metric", start, end, "60s")
+    assert plan.step == "4m"
+    assert len(data["result"]) == 20
+
+    prom.config.over_budget_action = OverBudgetAction.SHARD
+    plan, data = prom.planned_custom_query_range("synthetic_metric", start, end, "60s")
+    assert (plan.action, plan.shards) == ("shard", 4)
+    assert len(data["result"]) == 20
+
+    prom.config.over_budget_action = OverBudgetAction.REJECT
+    with pytest.raises(QueryBudgetExceeded) as raised:
+        prom.planned_custom_query_range("synthetic_metric", start, end, "60s")
+    assert raised.value.plan.action == "reject"
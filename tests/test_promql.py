@@ -0,0 +1,124 @@
+from datetime import datetime
+
+import pytest
+
+from prometrix import PrometheusConfig, get_custom_prometheus_connect
+from prometrix.promql import (LabelMatcher, additional_label_matchers,
+                              find_vector_selectors, inject_label_matchers,
+                              parse_series_selector, to_label_matchers)
+
+CLUSTER = [LabelMatcher("cluster", "=", "a")]
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        ("up", 'up{cluster="a"}'),
+        ('up{job="api"}', 'up{cluster="a", job="api"}'),
+        ("up{}", 'up{cluster="a"}'),
+        ('{__name__="up"}', '{cluster="a", __name__="up"}'),
+        # Already scoped selectors are left as is
+        ('up{cluster="a"}', 'up{cluster="a"}'),
+        # offset and @ modifiers
+        ("rate(up[5m] offset 1h)", 'rate(up{cluster="a"}[5m] offset 1h)'),
+        ("up @ 1609746000", 'up{cluster="a"} @ 1609746000'),
+        ("rate(x[5m] @ end() offset -5m)", 'rate(x{cluster="a"}[5m] @ end() offset -5m)'),
+        # Subqueries
+        ("max_over_time(rate(x[5m])[1h:5m])", 'max_over_time(rate(x{cluster="a"}[5m])[1h:5m])'),
+        # Grouping label lists are not selectors, before or after the arguments, in any case
+        ("sum by (job) (up)", 'sum by (job) (up{cluster="a"})'),
+        ("SUM BY (job) (up)", 'SUM BY (job) (up{cluster="a"})'),
+        ("sum(up) without (instance)", 'sum(up{cluster="a"}) without (instance)'),
+        ("topk(3, sum without(pod)(x))", 'topk(3, sum without(pod)(x{cluster="a"}))'),
+        ("a / on(job) group_left(x) b", 'a{cluster="a"} / on(job) group_left(x) b{cluster="a"}'),
+        ("up and on() down unless x", 'up{cluster="a"} and on() down{cluster="a"} unless x{cluster="a"}'),
+        # Strings and comments are not scanned for selectors
+        ('label_replace(up, "dst", "$1", "src", "(.*)")', 'label_replace(up{cluster="a"}, "dst", "$1", "src", "(.*)")'),
+        ('count_values("up{x}", up)', 'count_values("up{x}", up{cluster="a"})'),
+        ("`raw{str}` + up", '`raw{str}` + up{cluster="a"}'),
+        ("up # foo{bar}\n+ down", 'up{cluster="a"} # foo{bar}\n+ down{cluster="a"}'),
+        # Numbers, keywords and functions
+        ("up > 1e3", 'up{cluster="a"} > 1e3'),
+        ("a > bool 1", 'a{cluster="a"} > bool 1'),
+        ("vector(1) + inf + NaN", "vector(1) + inf + NaN"),
+        (
+            'histogram_quantile(0.9, sum by (le) (rate(h_bucket{job=~"api|web"}[5m])))',
+            'histogram_quantile(0.9, sum by (le) (rate(h_bucket{cluster="a", job=~"api|web"}[5m])))',
+        ),
+    ],
+)
+def test_inject_label_matchers(query, expected):
+    assert inject_label_matchers(query, CLUSTER) == expected
+
+
+def test_inject_several_matchers():
+    matchers = [LabelMatcher("cluster", "=", "a"), LabelMatcher("namespace", "!~", 'kube-.*|"x"')]
+    assert inject_label_matchers('up{cluster="a"}', matchers) == 'up{namespace!~"kube-.*|\\"x\\"", cluster="a"}'
+    assert inject_label_matchers("up", []) == "up"
+
+
+def test_malformed_queries():
+    for query in ('up{job="api"', 'up{job="api}', "rate(up[5m)", 'label_replace(up, "dst)'):
+        with pytest.raises(ValueError):
+            inject_label_matchers(query, CLUSTER)
+
+
+def test_find_vector_selectors():
+    selectors = find_vector_selectors('sum(rate(a{job="x"}[5m])) / b')
+    assert [(selector.braces, selector.matchers) for selector in selectors] == [
+        (True, (LabelMatcher("job", "=", "x"),)),
+        (False, ()),
+    ]
+
+
+def test_parse_series_selector():
+    assert parse_series_selector('up{job=~"api|web", pod!=""}') == (
+        LabelMatcher("__name__", "=", "up"),
+        LabelMatcher("job", "=~", "api|web"),
+        LabelMatcher("pod", "!=", ""),
+    )
+    for invalid in ("", "sum(up)", 'up{job="a"} + 1', 'up{job=~"("}'):
+        with pytest.raises(ValueError):
+            parse_series_selector(invalid)
+
+
+def test_label_matcher_matches():
+    labels = {"job": "api-1"}
+    assert LabelMatcher("job", "=~", "api-.*").matches(labels)
+    # Regexes are fully anchored
+    assert not LabelMatcher("job", "=~", "api").matches(labels)
+    assert LabelMatcher("job", "!~", "web.*").matches(labels)
+    # A missing label matches like an empty one
+    assert LabelMatcher("pod", "=", "").matches(labels)
+    assert not LabelMatcher("pod", "!=", "").matches(labels)
+
+
+def test_to_label_matchers():
+    assert to_label_matchers(None) == ()
+    assert to_label_matchers({"a": "1"}) == (LabelMatcher("a", "=", "1"),)
+    assert to_label_matchers('{a!="1"}') == (LabelMatcher("a", "!=", "1"),)
+    assert to_label_matchers([LabelMatcher("a", "=", "1")]) == (LabelMatcher("a", "=", "1"),)
+
+
+def test_additional_label_matchers():
+    config = PrometheusConfig(url="http://localhost", additional_labels={"cluster": "a"})
+    assert additional_label_matchers(config) == ()
+    config.inject_additional_labels = True
+    assert additional_label_matchers(config) == (LabelMatcher("cluster", "=", "a"),)
+
+
+def test_client_sends_scoped_queries(fake_prometheus):
+    prom = get_custom_prometheus_connect(
+        PrometheusConfig(url=fake_prometheus.url, additional_labels={"cluster": "a"}, inject_additional_labels=True)
+    )
+    bodies = []
+    prom._session.hooks["response"].append(lambda r, **kwargs: bodies.append(r.request.body))
+    prom.safe_custom_query_range(
+        "sum(rate(synthetic_metric[5m]))",
+        datetime.fromtimestamp(1_700_000_000),
+        datetime.fromtimestamp(1_700_000_600),
+        "60s",
+        label_matchers={"pod": "pod-1"},
+    )
+    assert "cluster%3D%22a%22" in bodies[0]
+    assert "pod%3D%22pod-1%22" in bodies[0]
@@ -0,0 +1,160 @@
+import time
+from datetime import datetime
+
+from prometrix import PrometheusConfig, get_custom_prometheus_connect
+from prometrix.range_cache import RangeQueryCache, align_to_step
+
+STEP = 60
+
+
+class Backend:
+    """ query_range fetcher returning one float series and one native histogram series, recording its calls """
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, start, end):
+        self.calls.append((start, end))
+        timestamps = range(int(start), int(end) + 1, STEP)
+        return {
+            "resultType": "matrix",
+            "result": [
+                {"metric": {"pod": "a"}, "values": [[t, str(t / STEP)] for t in timestamps]},
+                {
+                    "metric": {"pod": "h"},
+                    "histograms": [[t, {"count": "1", "sum": str(t), "buckets": [[0, "0", "1", "1"]]}] for t in timestamps],
+                },
+            ],
+        }
+
+
+def _query(cache, backend, start, end, key="key"):
+    return cache.query_range(key, start, end, STEP, backend)
+
+
+def test_align_to_step():
+    assert align_to_step(125, 60) == 120
+    assert align_to_step(120, 60) == 120
+    assert isinstance(align_to_step(125.5, 60), int)
+    assert align_to_step(200, 60, origin=15) == 195
+    assert align_to_step(195, 60, origin=15) == 195
+
+
+def test_miss_then_hit():
+    cache, backend = RangeQueryCache(max_bytes=10**7), Backend()
+    first = _query(cache, backend, 1200, 2400)
+    second = _query(cache, backend, 1500, 2100)
+    assert backend.calls == [(1200, 2400)]
+    assert second == Backend()(1500, 2100)
+    assert first == Backend()(1200, 2400)
+    stats = cache.stats()
+    assert (stats["misses"], stats["hits"], stats["partial_hits"], stats["entries"]) == (1, 1, 0, 1)
+
+
+def test_partial_hit_fetches_only_head_and_tail():
+    cache, backend = RangeQueryCache(max_bytes=10**7), Backend()
+    _query(cache, backend, 1200, 2400)
+    result = _query(cache, backend, 600, 3000)
+    assert backend.calls == [(1200, 2400), (600, 1140), (2460, 3000)]
+    assert result == Backend()(600, 3000)
+    assert cache.stats()["partial_hits"] == 1
+    # The merged extent now covers the whole range
+    assert _query(cache, backend, 600, 3000) == result
+    assert len(backend.calls) == 3
+
+
+def test_hits_keep_native_histograms():
+    cache, backend = RangeQueryCache(max_bytes=10**7), Backend()
+    _query(cache, backend, 1200, 2400)
+    result = _query(cache, backend, 1260, 1380)
+    histograms = [item for item in result["result"] if item["metric"] == {"pod": "h"}]
+    assert len(histograms) == 1
+    assert [sample[0] for sample in histograms[0]["histograms"]] == [1260, 1320, 1380]
+    assert "values" not in histograms[0]
+    assert result == Backend()(1260, 1380)
+
+
+def test_disjoint_narrower_range_keeps_the_cached_extent():
+    cache, backend = RangeQueryCache(max_bytes=10**7), Backend()
+    _query(cache, backend, 0, 6000)
+    _query(cache, backend, 100_000, 100_120)
+    _query(cache, backend, 60, 5940)
+    assert backend.calls == [(0, 6000), (100_000, 100_120)]
+    # A wider disjoint range replaces it
+    _query(cache, backend, 200_000, 220_000)
+    _query(cache, backend, 200_060, 210_000)
+    assert backend.calls[-1] == (200_000, 220_000)
+
+
+def test_mutable_window_is_not_cached():
+    cache, backend = RangeQueryCache(max_bytes=10**7, mutable_window_seconds=600), Backend()
+    end = align_to_step(time.time(), STEP)
+    start = end - 3600
+    _query(cache, backend, start, end)
+    _query(cache, backend, start, end)
+    immutable_end = align_to_step(time.time() - 600, STEP)
+    # Only the recent tail is fetched again
+    assert backend.calls[1][0] > start
+    assert backend.calls[1][0] >= immutable_end - STEP
+    # Nothing is cached when the whole range is recent
+    cache.clear()
+    backend.calls.clear()
+    _query(cache, backend, end - 300, end)
+    _query(cache, backend, end - 300, end)
+    assert len(backend.calls) == 2
+    assert cache.stats()["entries"] == 0
+
+
+def test_lru_eviction_by_byte_budget():
+    probe, backend = RangeQueryCache(max_bytes=10**7), Backend()
+    _query(probe, backend, 0, 600)
+    entry_bytes = probe.stats()["bytes"]
+
+    cache = RangeQueryCache(max_bytes=int(entry_bytes * 2.5))
+    for key in ("a", "b"):
+        _query(cache, backend, 0, 600, key=key)
+    # Using "a" makes "b" the least recently used entry
+    _query(cache, backend, 0, 600, key="a")
+    _query(cache, backend, 0, 600, key="c")
+    stats = cache.stats()
+    assert (stats["entries"], stats["evictions"], stats["bytes"]) == (2, 1, entry_bytes * 2)
+    backend.calls.clear()
+    _query(cache, backend, 0, 600, key="a")
+    _query(cache, backend, 0, 600, key="c")
+    assert backend.calls == []
+    _query(cache, backend, 0, 600, key="b")
+    assert backend.calls == [(0, 600)]
+
+
+def test_entry_larger_than_the_budget_is_not_cached():
+    cache, backend = RangeQueryCache(max_bytes=100), Backend()
+    _query(cache, backend, 0, 600)
+    _query(cache, backend, 0, 600)
+    assert len(backend.calls) == 2
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["bytes"] == 0
+
+
+def test_client_results_match_uncached_queries(monkeypatch):
+    prom = get_custom_prometheus_connect(
+        PrometheusConfig(url="http://localhost:9090", range_cache_max_bytes=10**7)
+    )
+    backend = Backend()
+    monkeypatch.setattr(prom, "_query_range", lambda query, start, end, step, params: backend(start, end))
+
+    def query_range(start, end):
+        return prom.safe_custom_query_range(
+            "up", datetime.fromtimestamp(start), datetime.fromtimestamp(end), f"{STEP}s"
+        )
+
+    # Neither start nor end is a multiple of the step
+    start, end = 1_700_000_015, 1_700_003_650
+    assert query_range(start, end) == Backend()(start, end)
+    assert backend.calls == [(start, 1_700_003_615)]
+    # A window sliding by whole steps only fetches its tail
+    assert query_range(start + 2 * STEP, end + 2 * STEP) == Backend()(start + 2 * STEP, end + 2 * STEP)
+    assert backend.calls[1:] == [(1_700_003_675, 1_700_003_735)]
+    # Another grid within the step does not use the cached samples
+    assert query_range(start + 30, end) == Backend()(start + 30, end)
+    assert backend.calls[2:] == [(start + 30, 1_700_003_645)]
+    assert prom.range_cache.stats()["entries"] == 2
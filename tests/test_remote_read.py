@@ -0,0 +1,126 @@
+import struct
+from array import array
+from datetime import datetime
+
+import pytest
+
+from benchmarks.fake_prometheus import (FakePrometheusServer, SigV4Credentials,
+                                        encode_xor_chunk)
+from prometrix import (AWSPrometheusConfig, PrometheusConfig,
+                       get_custom_prometheus_connect)
+from prometrix.remote_read import (crc32c, decode_xor_chunk, iter_frames,
+                                   iter_remote_read_series, read_uvarint)
+
+START_MS = 1_000_000_000
+END_MS = START_MS + 3 * 3600 * 1000
+
+
+def _bits(value):
+    return struct.pack(">d", value)
+
+
+def test_crc32c():
+    assert crc32c(b"123456789") == 0xE3069283
+    assert crc32c(b"") == 0
+
+
+def test_decode_xor_chunk_round_trip():
+    samples = [
+        (-5000, 1.0), (0, 1.0), (15000, float("nan")), (30000, float("inf")), (30001, -0.0),
+        (10**9, 1e300), (10**9 + 1, 5e-324), (10**9 + 2, 2.5), (10**9 - 100, 2.5), (2**40, -7.25),
+    ]
+    samples += [(2**40 + 15000 * i + (i % 7) * 1000, round(i * 0.1, 3)) for i in range(1, 200)]
+    timestamps, values = array("d"), array("d")
+    assert decode_xor_chunk(encode_xor_chunk(samples), -10**12, 10**15, timestamps, values) == len(samples)
+    assert list(timestamps) == [t / 1000 for t, _ in samples]
+    # Bit exact, including NaN and the sign of zero
+    assert [_bits(value) for value in values] == [_bits(value) for _, value in samples]
+
+
+def test_decode_xor_chunk_keeps_only_the_range():
+    samples = [(t, float(t)) for t in range(0, 150_000, 15_000)]
+    timestamps, values = array("d", [-1.0]), array("d", [-1.0])
+    assert decode_xor_chunk(encode_xor_chunk(samples), 15_000, 45_000, timestamps, values) == 3
+    # Appended after what the arrays already hold
+    assert list(timestamps) == [-1.0, 15.0, 30.0, 45.0]
+    assert list(values) == [-1.0, 15_000.0, 30_000.0, 45_000.0]
+    assert decode_xor_chunk(encode_xor_chunk([]), 0, 10**6, timestamps, values) == 0
+
+
+@pytest.fixture(scope="module")
+def recorded(fake_prometheus):
+    """ A streamed remote read body recorded from the fake server, with the series it holds """
+    body = fake_prometheus.data.remote_read_frames("synthetic_metric", START_MS, END_MS)
+    return body, fake_prometheus.data.series_labels("synthetic_metric"), fake_prometheus.data.raw_samples(
+        START_MS, END_MS
+    )
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 97, 10**9])
+def test_iter_frames_over_any_chunking(recorded, chunk_size):
+    body, labels, _ = recorded
+    chunks = [body[pos:pos + chunk_size] for pos in range(0, len(body), chunk_size)]
+    messages = list(iter_frames(chunks))
+    # One frame per series
+    assert len(messages) == len(labels)
+    assert messages == list(iter_frames([body]))
+
+
+def test_decode_recorded_frames(recorded):
+    body, labels, samples = recorded
+    series = list(iter_remote_read_series([body], START_MS, END_MS))
+    assert [item["metric"] for item in series] == labels
+    for item in series:
+        assert list(item["timestamps"]) == [t / 1000 for t, _ in samples]
+        assert list(item["values"]) == [value for _, value in samples]
+
+    # Samples out of the requested range are dropped
+    end_ms = samples[9][0]
+    series = list(iter_remote_read_series([body], START_MS, end_ms))
+    assert len(series[0]["values"]) == 10
+
+
+def test_checksum_mismatch(recorded):
+    body = bytearray(recorded[0])
+    body[-1] ^= 1
+    with pytest.raises(ValueError, match="checksum"):
+        list(iter_remote_read_series([bytes(body)], START_MS, END_MS))
+    # The corrupted byte is a sample of the last series, the frame still parses without verification
+    assert len(list(iter_remote_read_series([bytes(body)], START_MS, END_MS, verify_checksums=False))) == 20
+
+
+def test_truncated_frame(recorded):
+    body = recorded[0]
+    with pytest.raises(ValueError, match="ended inside a frame"):
+        list(iter_frames([body[:-3]]))
+    # Ending inside the size varint of the next frame is truncated too
+    size, header_end = read_uvarint(body, 0)
+    first_frame_end = header_end + 4 + size
+    assert len(list(iter_frames([body[:first_frame_end]]))) == 1
+    with pytest.raises(ValueError, match="ended inside a frame"):
+        list(iter_frames([body[:first_frame_end + 1]]))
+
+
+def test_stream_remote_read(fake_prometheus):
+    prom = get_custom_prometheus_connect(PrometheusConfig(url=fake_prometheus.url))
+    start, end = datetime.fromtimestamp(START_MS / 1000), datetime.fromtimestamp(END_MS / 1000)
+    series = list(prom.stream_remote_read('{__name__="synthetic_metric"}', start, end, chunk_size=97))
+    samples = fake_prometheus.data.raw_samples(START_MS, END_MS)
+    assert [item["metric"] for item in series] == fake_prometheus.data.series_labels("synthetic_metric")
+    assert list(series[3]["timestamps"]) == [t / 1000 for t, _ in samples]
+    assert list(series[3]["values"]) == [value for _, value in samples]
+
+
+def test_stream_remote_read_signs_aws_requests():
+    credentials = SigV4Credentials("AK", "SK", "us-east-1", "aps")
+    with FakePrometheusServer(series=3, steps=50, sigv4=credentials) as server:
+        prom = get_custom_prometheus_connect(
+            AWSPrometheusConfig(
+                url=server.url, access_key="AK", secret_access_key="SK", aws_region="us-east-1", service_name="aps"
+            )
+        )
+        series = list(
+            prom.stream_remote_read('{__name__="m"}', datetime.fromtimestamp(0), datetime.fromtimestamp(3600))
+        )
+    assert prom.config.remote_read_path == "/api/v1/remote_read"
+    assert [len(item["values"]) for item in series] == [50, 50, 50]
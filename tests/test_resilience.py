@@ -0,0 +1,205 @@
+import asyncio
+import email.utils
+import random
+import threading
+import time
+
+import pytest
+from requests.exceptions import ConnectionError, Timeout
+
+from prometrix import ResiliencePolicy
+from prometrix.resilience import (AsyncResilientSender, LatencyTracker,
+                                  ResilientSender, backoff_delay,
+                                  parse_retry_after)
+
+
+class Response:
+    def __init__(self, status_code: int = 200, headers=None, body: str = ""):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.body = body
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class Sequence:
+    """ A send function returning (or raising) the given outcomes in turn, recording when it was called """
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = []
+
+    def __call__(self):
+        self.calls.append(time.perf_counter())
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def _policy(**kwargs) -> ResiliencePolicy:
+    return ResiliencePolicy(**{"backoff_base": 0.001, "backoff_max": 0.01, **kwargs})
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3
+    assert parse_retry_after("1.5") == 1.5
+    assert parse_retry_after("-4") == 0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    retry_at = email.utils.formatdate(time.time() + 120, usegmt=True)
+    assert 115 < parse_retry_after(retry_at) <= 120
+    assert parse_retry_after(email.utils.formatdate(time.time() - 60, usegmt=True)) == 0
+
+
+def test_backoff_delay_is_capped():
+    random.seed(1)
+    for attempt in range(10):
+        delay = backoff_delay(attempt, 0.5, 4)
+        assert 0 <= delay <= min(4, 0.5 * 2 ** attempt)
+
+
+def test_latency_tracker_percentile():
+    tracker = LatencyTracker(window_size=10)
+    for seconds in range(20):
+        tracker.observe("query", seconds)
+    assert tracker.percentile("query", 50, min_samples=10) == 15
+    assert tracker.percentile("query", 99, min_samples=10) == 19
+    assert tracker.percentile("query", 50, min_samples=11) is None
+    assert tracker.percentile("other", 50, min_samples=1) is None
+
+
+def test_retries_retryable_statuses_and_errors():
+    sender = ResilientSender(_policy(max_retries=3))
+    send = Sequence(Response(503), Timeout(), ConnectionError(), Response(200, body="ok"))
+    assert sender.send("query", send).body == "ok"
+    stats = sender.stats()
+    assert (stats["retries"], stats["server_errors"], stats["timeouts"], stats["connection_errors"]) == (3, 1, 1, 1)
+    assert (stats["requests"], stats["succeeded"], stats["failed"]) == (1, 1, 0)
+
+
+def test_gives_up_after_max_retries():
+    sender = ResilientSender(_policy(max_retries=1))
+    assert sender.send("query", Sequence(Response(429), Response(429))).status_code == 429
+    with pytest.raises(Timeout):
+        sender.send("query", Sequence(Timeout(), Timeout()))
+    stats = sender.stats()
+    assert (stats["failed"], stats["retries"], stats["throttled"]) == (2, 2, 2)
+
+
+def test_does_not_retry_other_failures():
+    sender = ResilientSender(_policy(max_retries=3))
+    send = Sequence(Response(400), Response(200))
+    assert sender.send("query", send).status_code == 400
+    with pytest.raises(ValueError):
+        sender.send("query", Sequence(ValueError("bug")))
+    assert sender.stats()["retries"] == 0
+
+
+def test_retry_after_sets_a_minimum_wait():
+    sender = ResilientSender(_policy(max_retries=1, backoff_max=5))
+    send = Sequence(Response(503, {"Retry-After": "0.3"}), Response(200))
+    sender.send("query", send)
+    assert send.calls[1] - send.calls[0] >= 0.3
+    assert sender.stats()["retry_after"] == 1
+
+
+def test_retry_after_is_capped_by_backoff_max():
+    sender = ResilientSender(_policy(max_retries=1, backoff_max=0.05))
+    send = Sequence(Response(503, {"Retry-After": "30"}), Response(200))
+    sender.send("query", send)
+    assert send.calls[1] - send.calls[0] < 1
+
+
+def test_retry_after_can_be_ignored():
+    sender = ResilientSender(_policy(max_retries=1, respect_retry_after=False))
+    send = Sequence(Response(503, {"Retry-After": "30"}), Response(200))
+    sender.send("query", send)
+    assert send.calls[1] - send.calls[0] < 1
+    assert sender.stats()["retry_after"] == 0
+
+
+def test_retried_responses_are_closed():
+    sender = ResilientSender(_policy(max_retries=1))
+    first = Response(503)
+    sender.send("query", Sequence(first, Response(200)))
+    assert first.closed
+
+
+def _warm_up(sender, endpoint: str = "query", seconds: float = 0.01, samples: int = 20):
+    for _ in range(samples):
+        sender.latencies.observe(endpoint, seconds)
+
+
+class SlowThenFast:
+    """ The first call takes `slow` seconds, the next ones answer at once """
+
+    def __init__(self, slow: float):
+        self.slow = slow
+        self.responses = []
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            index = len(self.responses)
+            response = Response(200, body=f"attempt-{index}")
+            self.responses.append(response)
+        if index == 0:
+            time.sleep(self.slow)
+        return response
+
+
+def test_hedging_returns_the_first_answer():
+    sender = ResilientSender(_policy(hedge_percentile=90, hedge_min_samples=20, hedge_min_delay=0.01))
+    _warm_up(sender)
+    send = SlowThenFast(0.5)
+    start = time.perf_counter()
+    response = sender.send("query", send)
+    assert time.perf_counter() - start < 0.4
+    assert response.body == "attempt-1"
+    stats = sender.stats()
+    assert (stats["hedged"], stats["hedge_wins"]) == (1, 1)
+    # The slow primary is closed once it completes
+    deadline = time.monotonic() + 5
+    while not send.responses[0].closed and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert send.responses[0].closed
+
+
+def test_no_hedging_without_enough_samples():
+    sender = ResilientSender(_policy(hedge_percentile=90, hedge_min_samples=20, hedge_min_delay=0.01))
+    _warm_up(sender, samples=19)
+    send = SlowThenFast(0.1)
+    assert sender.send("query", send).body == "attempt-0"
+    assert sender.stats()["hedged"] == 0
+
+
+def test_async_retries_and_hedging():
+    async def main():
+        sender = AsyncResilientSender(_policy(max_retries=1))
+        responses = [Response(503), Response(200, body="ok")]
+
+        async def send():
+            return responses.pop(0)
+
+        assert (await sender.send("query", send)).body == "ok"
+        assert sender.stats()["retries"] == 1
+
+        hedging = AsyncResilientSender(_policy(hedge_percentile=90, hedge_min_samples=20, hedge_min_delay=0.01))
+        _warm_up(hedging)
+        calls = []
+
+        async def slow_then_fast():
+            calls.append(1)
+            if len(calls) == 1:
+                await asyncio.sleep(0.5)
+            return Response(200, body=f"attempt-{len(calls) - 1}")
+
+        start = time.perf_counter()
+        assert (await hedging.send("query", slow_then_fast)).body == "attempt-1"
+        assert time.perf_counter() - start < 0.4
+        assert hedging.stats()["hedge_wins"] == 1
+
+    asyncio.run(main())
@@ -0,0 +1,98 @@
+import pytest
+
+from prometrix.sharding import (format_duration_seconds, merge_matrix_data,
+                                parse_duration_seconds, split_time_range)
+
+
+def _matrix(*series):
+    return {"resultType": "matrix", "result": list(series)}
+
+
+def test_parse_duration_seconds():
+    assert parse_duration_seconds("1h30m") == 5400
+    assert parse_duration_seconds("15s") == 15
+    assert parse_duration_seconds("500ms") == 0.5
+    assert parse_duration_seconds("2.5") == 2.5
+    for invalid in ("", "1x", "m5", "0s", "-1"):
+        with pytest.raises(ValueError):
+            parse_duration_seconds(invalid)
+
+
+def test_format_duration_seconds():
+    assert format_duration_seconds(5400) == "1h30m"
+    assert format_duration_seconds(90061) == "1d1h1m1s"
+    assert format_duration_seconds(0.5) == "0.5"
+
+
+def test_split_time_range_keeps_the_step_grid():
+    ranges = split_time_range(1000, 1000 + 99 * 60, 60, max_points=30)
+    assert ranges == [
+        (1000, 1000 + 29 * 60),
+        (1000 + 30 * 60, 1000 + 59 * 60),
+        (1000 + 60 * 60, 1000 + 89 * 60),
+        (1000 + 90 * 60, 1000 + 99 * 60),
+    ]
+    # Consecutive sub-ranges do not overlap and together evaluate exactly the 100 original steps
+    points = sum(int((end - start) // 60) + 1 for start, end in ranges)
+    assert points == 100
+
+
+def test_split_time_range_end_off_the_grid():
+    # The last evaluated step is the last grid point before end
+    assert split_time_range(0, 125, 60, max_points=2) == [(0, 60), (120, 120)]
+
+
+def test_split_time_range_small_and_empty_ranges():
+    assert split_time_range(0, 600, 60, max_points=11_000) == [(0, 600)]
+    assert split_time_range(600, 0, 60, max_points=10) == [(600, 0)]
+    assert split_time_range(10, 10, 60, max_points=10) == [(10, 10)]
+    with pytest.raises(ValueError):
+        split_time_range(0, 600, 60, max_points=0)
+
+
+def test_split_time_range_fractional_steps():
+    ranges = split_time_range(0.5, 10.5, 0.5, max_points=10)
+    assert ranges == [(0.5, 5), (5.5, 10), (10.5, 10.5)]
+    assert all(isinstance(end, int) for _, end in ranges[:2])
+
+
+def test_merge_matrix_data_deduplicates_boundaries():
+    first = _matrix(
+        {"metric": {"pod": "a"}, "values": [[0, "1"], [60, "2"]]},
+        {"metric": {"pod": "b"}, "values": [[60, "5"]]},
+    )
+    second = _matrix(
+        {"metric": {"pod": "a"}, "values": [[60, "2"], [120, "3"]]},
+        {"metric": {"pod": "c"}, "values": [[120, "7"]]},
+    )
+    merged = merge_matrix_data([first, second])
+    assert merged["resultType"] == "matrix"
+    by_pod = {series["metric"]["pod"]: series["values"] for series in merged["result"]}
+    assert by_pod == {
+        "a": [[0, "1"], [60, "2"], [120, "3"]],
+        "b": [[60, "5"]],
+        "c": [[120, "7"]],
+    }
+
+
+def test_merge_matrix_data_matches_series_by_label_set():
+    first = _matrix({"metric": {"pod": "a", "ns": "x"}, "values": [[0, "1"]]})
+    second = _matrix({"metric": {"ns": "x", "pod": "a"}, "values": [[60, "2"]]})
+    merged = merge_matrix_data([first, second])
+    assert len(merged["result"]) == 1
+    assert merged["result"][0]["values"] == [[0, "1"], [60, "2"]]
+
+
+def test_merge_matrix_data_keeps_histograms():
+    histogram = {"count": "1", "sum": "2", "buckets": []}
+    first = _matrix({"metric": {"pod": "a"}, "histograms": [[0, histogram], [60, histogram]]})
+    second = _matrix({"metric": {"pod": "a"}, "histograms": [[60, histogram], [120, histogram]]})
+    merged = merge_matrix_data([first, second])
+    assert [sample[0] for sample in merged["result"][0]["histograms"]] == [0, 60, 120]
+    assert "values" not in merged["result"][0]
+
+
+def test_merge_matrix_data_rejects_other_result_types():
+    with pytest.raises(ValueError):
+        merge_matrix_data([{"resultType": "vector", "result": []}])
+    assert merge_matrix_data([]) == {"resultType": "matrix", "result": []}
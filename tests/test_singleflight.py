@@ -0,0 +1,136 @@
+import asyncio
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+from prometrix import PrometheusConfig, get_custom_prometheus_connect
+from prometrix.singleflight import (AsyncSingleFlight, SingleFlight,
+                                    make_call_key)
+
+
+def _wait_until(predicate, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def _run_concurrently(single_flight, key, fn, callers):
+    """ Run `callers` calls of fn under `key`, returning each caller's result or exception """
+    outcomes = [None] * callers
+
+    def call(index):
+        try:
+            outcomes[index] = single_flight.do(key, fn)
+        except Exception as e:
+            outcomes[index] = e
+
+    threads = [threading.Thread(target=call, args=(index,)) for index in range(callers)]
+    for thread in threads:
+        thread.start()
+    return threads, outcomes
+
+
+def test_make_call_key():
+    assert make_call_key("query", "up", {"b": 1, "a": "x"}) == make_call_key("query", "up", {"a": "x", "b": "1"})
+    assert make_call_key("query", "up") != make_call_key("query_range", "up")
+    assert make_call_key("query", "up", None, 10) != make_call_key("query", "up", None, 20)
+
+
+def test_concurrent_calls_are_coalesced():
+    single_flight = SingleFlight()
+    release = threading.Event()
+    executions = []
+
+    def fn():
+        executions.append(1)
+        release.wait(5)
+        return {"result": []}
+
+    threads, outcomes = _run_concurrently(single_flight, "key", fn, 5)
+    _wait_until(lambda: single_flight.stats()["coalesced"] == 4)
+    assert single_flight.stats() == {"calls": 5, "coalesced": 4, "in_flight": 1}
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(executions) == 1
+    # Every caller gets the very same object
+    assert all(outcome is outcomes[0] for outcome in outcomes)
+    assert single_flight.stats() == {"calls": 5, "coalesced": 4, "in_flight": 0}
+
+
+def test_errors_are_shared_and_not_cached():
+    single_flight = SingleFlight()
+    release = threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise ValueError("boom")
+
+    threads, outcomes = _run_concurrently(single_flight, "key", fail, 3)
+    _wait_until(lambda: single_flight.stats()["coalesced"] == 2)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+    # The key is free again once the failed call completed
+    assert single_flight.do("key", lambda: 42) == 42
+
+
+def test_sequential_and_distinct_calls_are_not_coalesced():
+    single_flight = SingleFlight()
+    assert single_flight.do("a", lambda: 1) == 1
+    assert single_flight.do("a", lambda: 2) == 2
+    assert single_flight.do("b", lambda: 3) == 3
+    assert single_flight.stats() == {"calls": 3, "coalesced": 0, "in_flight": 0}
+
+
+def test_async_single_flight():
+    async def main():
+        single_flight = AsyncSingleFlight()
+        executions = []
+
+        async def fn():
+            executions.append(1)
+            await asyncio.sleep(0.05)
+            return "result"
+
+        results = await asyncio.gather(*(single_flight.do("key", fn) for _ in range(5)))
+        assert results == ["result"] * 5
+        assert len(executions) == 1
+        assert single_flight.stats() == {"calls": 5, "coalesced": 4, "in_flight": 0}
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        outcomes = await asyncio.gather(*(single_flight.do("key", fail) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+
+        # Cancelling a waiter does not cancel the shared call
+        task = asyncio.ensure_future(single_flight.do("slow", fn))
+        waiter = asyncio.ensure_future(single_flight.do("slow", fn))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        assert await task == "result"
+
+    asyncio.run(main())
+
+
+def test_client_routes_queries_through_single_flight(fake_prometheus):
+    prom = get_custom_prometheus_connect(PrometheusConfig(url=fake_prometheus.url, single_flight=True))
+    start, end = datetime.fromtimestamp(1_700_000_000), datetime.fromtimestamp(1_700_003_000)
+    requests_before = fake_prometheus.requests
+    first = prom.safe_custom_query_range("synthetic_metric", start, end, "60s")
+    second = prom.safe_custom_query_range("synthetic_metric", start, end, "60s")
+    assert first == second
+    assert prom.single_flight.stats()["calls"] == 2
+    assert fake_prometheus.requests - requests_before == 2
+
+
+@pytest.mark.parametrize("single_flight", [False, True])
+def test_client_single_flight_is_opt_in(fake_prometheus, single_flight):
+    prom = get_custom_prometheus_connect(PrometheusConfig(url=fake_prometheus.url, single_flight=single_flight))
+    assert (prom.single_flight is not None) == single_flight
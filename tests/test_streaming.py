@@ -0,0 +1,68 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from prometrix import PrometheusConfig, get_custom_prometheus_connect
+from prometrix.streaming import iter_result_items
+
+RESPONSE = {
+    "status": "success",
+    "data": {
+        "resultType": "matrix",
+        "result": [
+            {"metric": {"__name__": "up", "pod": "a"}, "values": [[1, "1"], [2, "0"]]},
+            # Item ends and brackets inside strings must not be taken for the end of the item
+            {"metric": {"pod": 'b"}, ]', "note": "},{]"}, "values": [[1, "NaN"]]},
+            {"metric": {"pod": "é€😀"}, "values": [[1, "+Inf"]]},
+            {"metric": {"pod": "d"}, "histograms": [[1, {"count": "2", "sum": "3", "buckets": [[0, "0", "1", "2"]]}]]},
+        ],
+    },
+}
+
+
+def _chunks(body: bytes, size: int):
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+@pytest.mark.parametrize("indent", [None, 2])
+def test_iter_result_items_any_chunking(indent):
+    body = json.dumps(RESPONSE, indent=indent, ensure_ascii=False).encode()
+    expected = RESPONSE["data"]["result"]
+    # Chunk boundaries fall everywhere, including inside multi-byte characters and item ends
+    for size in list(range(1, 40)) + [64, 65, 1000, len(body)]:
+        assert list(iter_result_items(_chunks(body, size))) == expected, size
+
+
+def test_iter_result_items_yields_before_the_body_is_complete():
+    body = json.dumps(RESPONSE).encode()
+    second_item = body.index(b'{"metric": {"pod": "b')
+    chunks = iter([body[:second_item], b""])
+    items = iter_result_items(chunks)
+    assert next(items) == RESPONSE["data"]["result"][0]
+
+
+def test_iter_result_items_result_before_result_type():
+    body = b'{"data":{"result":[{"metric":{},"value":[1,"2"]}],"resultType":"vector"},"status":"success"}'
+    assert list(iter_result_items([body])) == [{"metric": {}, "value": [1, "2"]}]
+
+
+def test_iter_result_items_empty_result():
+    assert list(iter_result_items([b'{"status":"success","data":{"resultType":"matrix","result":[ ]}}'])) == []
+
+
+def test_iter_result_items_errors():
+    with pytest.raises(ValueError, match="does not contain a result list"):
+        list(iter_result_items([b'{"status":"error","error":"bad query"}']))
+    body = json.dumps(RESPONSE).encode()
+    with pytest.raises(ValueError, match="ended before"):
+        list(iter_result_items(_chunks(body[:-40], 7)))
+
+
+def test_stream_custom_query_range_matches_the_buffered_query(fake_prometheus):
+    prom = get_custom_prometheus_connect(PrometheusConfig(url=fake_prometheus.url))
+    start, end = datetime.fromtimestamp(1_700_000_000), datetime.fromtimestamp(1_700_003_000)
+    expected = prom.safe_custom_query_range("synthetic_metric", start, end, "60s")["result"]
+    streamed = list(prom.stream_custom_query_range("synthetic_metric", start, end, "60s", chunk_size=100))
+    assert len(streamed) == 20
+    assert streamed == expected